@@ -0,0 +1,643 @@
+# Benchmarks for the stages of the reminder: parse, regex clean-up, rendering, labeling and sending.
+# Runs fully offline with a fake OpenAI client and a local SMTP stand-in.
+#
+# Usage: python benchmark.py [--output bench_results.json] [--baseline old_results.json] [--threshold 0.25]
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import smtplib
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_website_data.html")
+TEST_CERT = os.path.join(os.path.dirname(FIXTURE), "test_cert.pem")
+
+# Cumulative 'python -X importtime' budget for importing run_reminder
+STARTUP_BUDGET_SECONDS = 0.25
+# Imported by the stages that need them, never at startup
+LAZY_MODULES = ("openai", "requests", "tenacity", "bs4", "smtplib", "httpx")
+
+BENCHMARKS = {}
+
+
+def benchmark(name, repeat=5):
+    """
+    Registers a benchmark. The decorated function prepares the inputs and returns the callable to be measured.
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, repeat)
+        return setup
+    return register
+
+
+class FakeOpenAI:
+    """
+    Answers chat completions like the OpenAI client, without any network access. Tokens are estimated as
+    four characters each. Reading the prompt takes 'prompt_token_latency' seconds per prompt token and every
+    completion token takes 'token_latency' seconds, also when streamed.
+    """
+
+    def __init__(self, content="Scientific Computing, R", latency=0.0, token_latency=0.0, prompt_token_latency=0.0):
+        self.content = content
+        self.latency = latency
+        self.token_latency = token_latency
+        self.prompt_token_latency = prompt_token_latency
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, model=None, stream=False, max_tokens=None, response_format=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        self.prompt_tokens += prompt_tokens
+        if self.prompt_token_latency:
+            time.sleep(self.prompt_token_latency * prompt_tokens)
+        content = self.content
+        if response_format and response_format.get("type") == "json_schema":
+            content = json.dumps({"labels": content.split(", ")})
+        tokens = [content[i:i + 4] for i in range(0, len(content), 4)][:max_tokens]
+        if stream:
+            return FakeStream(self, model, tokens, prompt_tokens)
+        self.completion_tokens += len(tokens)
+        if self.token_latency:
+            time.sleep(self.token_latency * len(tokens))
+        return SimpleNamespace(
+            model=model or "fake-model",
+            choices=[SimpleNamespace(message=SimpleNamespace(content="".join(tokens)))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(tokens),
+                                  total_tokens=prompt_tokens + len(tokens)),
+        )
+
+
+class FakeStream:
+    """
+    Yields the tokens of a fake completion as stream chunks, then the usage. Closing it stops the generation.
+    """
+
+    def __init__(self, client, model, tokens, prompt_tokens):
+        self.client = client
+        self.model = model or "fake-model"
+        self.tokens = tokens
+        self.prompt_tokens = prompt_tokens
+        self.closed = False
+
+    def __iter__(self):
+        for token in self.tokens:
+            if self.closed:
+                return
+            if self.client.token_latency:
+                time.sleep(self.client.token_latency)
+            self.client.completion_tokens += 1
+            yield SimpleNamespace(model=self.model, usage=None,
+                                  choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+        yield SimpleNamespace(model=self.model, choices=[], usage=SimpleNamespace(
+            prompt_tokens=self.prompt_tokens, completion_tokens=len(self.tokens),
+            total_tokens=self.prompt_tokens + len(self.tokens)))
+
+    def close(self):
+        self.closed = True
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def read_fixture():
+    with open(FIXTURE, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def quiet(function):
+    """
+    Wraps 'function' so that its print output doesn't distort the timings.
+    """
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return run
+
+
+def create_builder(parser="scoped"):
+    from email_body_builder import EmailBodyBuilder
+    builder = EmailBodyBuilder(FakeOpenAI(), parser=parser)
+    builder.labeler.simulate = True
+    return builder
+
+
+@benchmark("parse")
+def bench_parse():
+    website_content = read_fixture()
+    builder = create_builder()
+    return quiet(lambda: builder.get_email_body(website_content))
+
+
+@benchmark("parse_full")
+def bench_parse_full():
+    website_content = read_fixture()
+    builder = create_builder(parser="full")
+    return quiet(lambda: builder.get_email_body(website_content))
+
+
+@benchmark("regex_cleanup", repeat=20)
+def bench_regex_cleanup():
+    from email_body_builder import clean_author, clean_description
+    author = "By Sample Author            \n                        ,                 Author 2"
+    description = "Sample Description Line 1\n                        Sample Description Line 2 " * 20
+
+    def run():
+        for _ in range(1000):
+            clean_author(author)
+            clean_description(description)
+    return run
+
+
+@benchmark("render_1000", repeat=5)
+def bench_render_1000():
+    from email_renderer import details_line, render_html, render_text
+    book = quiet(lambda: create_builder().extract_book(read_fixture()))()
+
+    def run():
+        for _ in range(1000):
+            render_html([(book, "Scientific Computing, R", "18.10.2026")])
+            render_text([(book, "Scientific Computing, R", "18.10.2026")])
+            details_line(book, "Scientific Computing, R", "18.10.2026")
+    return run
+
+
+@benchmark("optimize_payload", repeat=20)
+def bench_optimize_payload():
+    from payload_optimizer import minify_html
+    email_body = quiet(lambda: create_builder().get_email_body(read_fixture()))()
+    return lambda: minify_html(email_body)
+
+
+@benchmark("label", repeat=20)
+def bench_label():
+    from labeler import Labeler
+    labeler = Labeler(FakeOpenAI())
+    return quiet(lambda: [labeler.get_labels("Title", "Author", "Description") for _ in range(100)])
+
+
+# A long marketing text, as other giveaway sources have it; Packt's own descriptions are one line
+LONG_DESCRIPTION = " ".join(["Scientific computing with R covers numerical methods, linear algebra, optimization "
+                             "and simulation, with   many worked examples\n\n for researchers and data scientists."] * 12)
+
+
+def create_labeler(structured, token_latency=0.0, prompt_token_latency=0.0):
+    from labeler import Labeler
+    return Labeler(FakeOpenAI(token_latency=token_latency, prompt_token_latency=prompt_token_latency),
+                   structured=structured)
+
+
+@benchmark("label_structured", repeat=20)
+def bench_label_structured():
+    labeler = create_labeler(structured=True)
+    return quiet(lambda: [labeler.get_labels("Title", "Author", LONG_DESCRIPTION) for _ in range(100)])
+
+
+def compare_labeling(books=10, token_latency=0.01, prompt_token_latency=0.0002):
+    """
+    Labels 'books' books with a long description with the free-text prompt and in the structured streaming
+    mode. The fake client generates 100 tokens per second and reads 5000 prompt tokens per second, roughly
+    like a small hosted model. Returns the tokens and the seconds of both modes.
+    """
+    comparison = {}
+    for mode, structured in (("free_text", False), ("structured", True)):
+        labeler = create_labeler(structured, token_latency, prompt_token_latency)
+        started = time.perf_counter()
+        quiet(lambda: [labeler.get_labels("Title", "Author", LONG_DESCRIPTION) for _ in range(books)])()
+        client = labeler.openai_client
+        comparison[mode] = {"prompt_tokens": client.prompt_tokens, "completion_tokens": client.completion_tokens,
+                            "seconds": time.perf_counter() - started}
+    return comparison
+
+
+@benchmark("send")
+def bench_send():
+    from mail_delivery import MailDelivery
+    from smtp_stand_in import SmtpStandIn
+    server = SmtpStandIn().__enter__()
+    delivery = MailDelivery(lambda: smtplib.SMTP("127.0.0.1", server.port), "sender@example.com", "password")
+    email_body = quiet(lambda: create_builder().get_email_body(read_fixture()))()
+    return lambda: delivery.send("Benchmark", email_body, ["recipient@example.com"])
+
+
+@benchmark("send_100_recipients", repeat=3)
+def bench_send_100_recipients():
+    from mail_delivery import MailDelivery
+    from smtp_stand_in import SmtpStandIn
+    server = SmtpStandIn().__enter__()
+    delivery = MailDelivery(lambda: smtplib.SMTP("127.0.0.1", server.port), "sender@example.com", "password")
+    email_body = quiet(lambda: create_builder().get_email_body(read_fixture()))()
+    recipients = [f"recipient{i}@example.com" for i in range(100)]
+    return lambda: delivery.send("Benchmark", email_body, recipients)
+
+
+@benchmark("send_10000_recipients", repeat=1)
+def bench_send_10000_recipients():
+    """
+    Builds and sends the email to 10000 recipients over the default pool of SMTP connections, like a large
+    subscriber list. The messages are only built when they are sent.
+    """
+    import functools
+    from mail_delivery import MailDelivery, build_message
+    from smtp_stand_in import SmtpStandIn
+    server = SmtpStandIn().__enter__()
+    delivery = MailDelivery(lambda: smtplib.SMTP("127.0.0.1", server.port), "sender@example.com", "password")
+    email_body = quiet(lambda: create_builder().get_email_body(read_fixture()))()
+    recipients = [f"recipient{i}@example.com" for i in range(10_000)]
+    return lambda: delivery.deliver(
+        [(recipient, functools.partial(build_message, delivery.username, recipient, "Benchmark", email_body))
+         for recipient in recipients])
+
+
+def bench_fetch_https(shared):
+    """
+    Fetches the fixture 20 times from a local HTTPS stand-in, with a new connection each time like
+    requests.get, or over the kept-alive connection of the shared transport.
+    """
+    import ssl
+    from http_stand_in import HttpStandIn
+    from run_reminder import fetch_website_content
+    server = HttpStandIn(read_fixture().encode("utf-8"), certfile=TEST_CERT).__enter__()
+    if shared:
+        from http_transport import HttpTransport
+        http = quiet(lambda: HttpTransport(verify=ssl.create_default_context(cafile=TEST_CERT)))()
+        return lambda: [fetch_website_content(server.url, http=http) for _ in range(20)]
+    import requests
+    return lambda: [requests.get(server.url, verify=TEST_CERT).text for _ in range(20)]
+
+
+@benchmark("fetch_https_20", repeat=5)
+def bench_fetch_https_20():
+    return bench_fetch_https(shared=False)
+
+
+@benchmark("fetch_https_20_shared", repeat=5)
+def bench_fetch_https_20_shared():
+    return bench_fetch_https(shared=True)
+
+
+@benchmark("end_to_end", repeat=3)
+def bench_end_to_end():
+    import run_reminder
+    from mail_delivery import MailDelivery
+    from smtp_stand_in import SmtpStandIn
+    server = SmtpStandIn().__enter__()
+
+    response = MagicMock(status_code=200, text=read_fixture(), headers={})
+    environment = {
+        "GMAIL_USERNAME": "sender@example.com",
+        "GMAIL_APP_PASSWORD": "password",
+        "RECIPIENT_EMAIL": "recipient@example.com",
+        "OPENAI_API_KEY": "benchmark",
+    }
+
+    def create_delivery():
+        return MailDelivery(lambda: smtplib.SMTP("127.0.0.1", server.port), "sender@example.com", "password")
+
+    def run():
+        with patch.dict(os.environ, environment), \
+                patch("run_reminder.load_dotenv"), \
+                patch("requests.get", return_value=response), \
+                patch("openai.OpenAI", return_value=FakeOpenAI()), \
+                patch("run_reminder.create_gmail_delivery", side_effect=create_delivery):
+            run_reminder.main()
+    return quiet(run)
+
+
+SYNTHETIC_CATALOGS = {}
+
+
+def create_synthetic_catalog(rows=100_000):
+    if rows in SYNTHETIC_CATALOGS:
+        return SYNTHETIC_CATALOGS[rows]
+    import tempfile
+    from datetime import date, timedelta
+    from book_record import BookRecord
+    from catalog import Catalog
+    topics = ["Kubernetes", "Java", "Python", "Go", "Machine Learning", "Security", "React", "Rust", "SQL", "Cloud"]
+    directory = tempfile.mkdtemp()
+    catalog = Catalog(os.path.join(directory, "catalog.sqlite"))
+    start = date(2015, 1, 1)
+    catalog.record_many(
+        (BookRecord(title=f"Book {i} about {topics[i % 10]}", author=f"Author {i % 5000}", publication_year=str(2010 + i % 15),
+                    description=f"Learn {topics[i % 10]} " * 20),
+         f"{topics[i % 10]}, {topics[(i * 7) % 10]}", start + timedelta(days=i % 4000))
+        for i in range(rows)
+    )
+    SYNTHETIC_CATALOGS[rows] = catalog
+    return catalog
+
+
+@benchmark("catalog_query_100k", repeat=10)
+def bench_catalog_query_100k():
+    from datetime import date
+    catalog = create_synthetic_catalog()
+    return lambda: list(catalog.find(label="Kubernetes", since=date(2023, 1, 1)))
+
+
+@benchmark("catalog_export_100k", repeat=3)
+def bench_catalog_export_100k():
+    catalog = create_synthetic_catalog()
+
+    def run():
+        with open(os.devnull, "w", encoding="utf-8") as file:
+            return catalog.export(file)
+    return run
+
+
+@benchmark("pre_label_1000", repeat=5)
+def bench_pre_label_1000():
+    from pre_labeler import PreLabeler
+    pre_labeler = PreLabeler.from_catalog(create_synthetic_catalog(rows=3650))
+    return lambda: [pre_labeler.predict(f"Hands-on {topic}", f"Learn {topic} step by step")
+                    for topic in ["Kubernetes", "Java", "Python", "Go", "Rust"] * 200]
+
+
+def create_subscriber_index(count=50_000):
+    from subscribers import SubscriberIndex
+    topics = ["Kubernetes", "Java", "Python", "Go", "Machine Learning", "Security", "React", "Rust", "SQL", "Cloud"]
+    index = SubscriberIndex()
+    for i in range(count):
+        # A tenth gets everything, the others follow one to three topics and some exclude one
+        include = [] if i % 10 == 0 else [topics[(i + j * 3) % 10] for j in range(1 + i % 3)]
+        exclude = [topics[(i + 5) % 10]] if i % 4 == 0 else []
+        index.add(f"subscriber{i}@example.com", "text" if i % 5 == 0 else "html", include, exclude)
+    return index
+
+
+@benchmark("subscribers_route_50k", repeat=10)
+def bench_subscribers_route_50k():
+    from email_renderer import render_html, render_text
+    from subscribers import fan_out
+    index = create_subscriber_index()
+    book = quiet(lambda: create_builder().extract_book(read_fixture()))()
+    entries = [(book, "Kubernetes, Cloud", "18.10.2026"), (book, "Python, Machine Learning", "18.10.2026")]
+
+    def render(format, selected):
+        return (None, render_text(selected), ()) if format == "text" else (render_html(selected), None, ())
+    return lambda: fan_out(index, entries, "sender@example.com", "Benchmark", render)
+
+
+LABEL_VOCABULARIES = {}
+
+
+def create_label_vocabulary(count=100_000):
+    """
+    Returns a canonicalizer with 'count' labels of one to three made-up words, and the words.
+    """
+    if count in LABEL_VOCABULARIES:
+        return LABEL_VOCABULARIES[count]
+    import random
+    from label_canonicalizer import LabelCanonicalizer
+    random_words = random.Random(0)
+    # Letters with their frequency in English, so that the trigrams are as skewed as in real labels
+    letters, weights = "etaoinshrdlcumwfgypbvkjxqz", [127, 91, 82, 75, 70, 67, 63, 61, 60, 43, 40, 28, 28, 24, 24, 22,
+                                                      20, 20, 19, 15, 10, 8, 2, 2, 1, 1]
+    words = sorted({"".join(random_words.choices(letters, weights, k=random_words.randint(3, 10)))
+                    for _ in range(count // 5)})
+    labels = set()
+    while len(labels) < count:
+        labels.add(" ".join(random_words.choice(words).capitalize() for _ in range(random_words.choice((1, 1, 2, 2, 2, 3)))))
+    canonicalizer = LabelCanonicalizer(":memory:")
+    canonicalizer.add_many(sorted(labels))
+    # Built here, so that the first lookup of a new label isn't measured
+    canonicalizer._build_index()
+    LABEL_VOCABULARIES[count] = canonicalizer, words
+    return LABEL_VOCABULARIES[count]
+
+
+@benchmark("canonicalize_100k_known", repeat=10)
+def bench_canonicalize_100k_known():
+    canonicalizer, _ = create_label_vocabulary()
+    labels = [canonicalizer.spellings[key].upper() for key in list(canonicalizer.spellings)[:1000]]
+    return lambda: [canonicalizer.canonical(label) for label in labels]
+
+
+@benchmark("canonicalize_100k_new", repeat=5)
+def bench_canonicalize_100k_new():
+    import random
+    canonicalizer, words = create_label_vocabulary()
+    random_labels = random.Random(1)
+    # Misspelt known labels and labels of two random words; match() leaves the vocabulary as it is
+    known = random_labels.sample(sorted(canonicalizer.spellings), 50)
+    labels = [label[:-1] + "x" for label in known] + [" ".join(random_labels.sample(words, 2)) for _ in range(50)]
+    return lambda: [canonicalizer.match(label) for label in labels]
+
+
+@benchmark("canonicalize_100k_added", repeat=5)
+def bench_canonicalize_100k_added():
+    """
+    Canonicalizes 100 labels that aren't known yet, half of them misspelt known labels, with a vocabulary of
+    100k labels on disk. Unlike canonicalize_100k_new, the labels are added and written to the vocabulary.
+    """
+    import random
+    import tempfile
+    from label_canonicalizer import LabelCanonicalizer
+    vocabulary, words = create_label_vocabulary()
+    canonicalizer = LabelCanonicalizer(os.path.join(tempfile.mkdtemp(), "vocabulary.sqlite"))
+    canonicalizer.add_many(vocabulary.spellings.values())
+    canonicalizer._build_index()
+    random_labels = random.Random(2)
+    known = sorted(vocabulary.spellings)
+    # Every run takes new labels: the warm-up, the timed runs and the memory run
+    labels = {}
+    while len(labels) < 100 * (5 + 2):
+        for label in (random_labels.choice(known)[:-1] + "x", " ".join(random_labels.sample(words, 2))):
+            if label not in vocabulary.spellings:
+                labels[label] = None
+    labels = iter(labels)
+    return lambda: [canonicalizer.canonical(next(labels)) for _ in range(100)]
+
+
+def create_digest_catalog(days):
+    import tempfile
+    from dataclasses import replace
+    from datetime import date, timedelta
+    from catalog import Catalog
+    book = quiet(lambda: create_builder().extract_book(read_fixture()))()
+    catalog = Catalog(os.path.join(tempfile.mkdtemp(), "catalog.sqlite"))
+    catalog.record_many((replace(book, title=f"{book.title} {i}"), "Scientific Computing, R",
+                         date.today() - timedelta(days=i)) for i in range(days))
+    return catalog
+
+
+def bench_digest(days):
+    """
+    Loads 'days' recorded giveaways from the catalog and renders them into one digest email.
+    """
+    from email_renderer import render_html
+    catalog = create_digest_catalog(days)
+    return lambda: render_html(list(catalog.find()))
+
+
+@benchmark("digest_7", repeat=10)
+def bench_digest_7():
+    return bench_digest(7)
+
+
+@benchmark("digest_30", repeat=10)
+def bench_digest_30():
+    return bench_digest(30)
+
+
+@benchmark("digest_365", repeat=10)
+def bench_digest_365():
+    return bench_digest(365)
+
+
+@benchmark("replay_100", repeat=3)
+def bench_replay_100():
+    """
+    Replays the extraction over 100 archived snapshots with one worker process per CPU.
+    """
+    import tempfile
+    from replay import replay
+    directory = tempfile.mkdtemp()
+    fixture = read_fixture()
+    for i in range(100):
+        with open(os.path.join(directory, f"snapshot{i}.html"), "w", encoding="utf-8") as file:
+            file.write(fixture)
+    output = os.path.join(directory, "replay.jsonl")
+    return lambda: replay(directory, output, force=True)
+
+
+def measure_import_time(module="run_reminder"):
+    """
+    Imports 'module' in a fresh interpreter with '-X importtime'.
+    Returns its cumulative import time in seconds and the names of all modules that were imported.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(FIXTURE), capture_output=True, text=True, check=True,
+    ).stderr
+
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.removeprefix("import time:").split("|")
+        cumulative[name.strip()] = int(cumulative_us) / 1_000_000
+    return cumulative[module], set(cumulative)
+
+
+def check_startup(budget=STARTUP_BUDGET_SECONDS):
+    """
+    Returns the problems with the startup of run_reminder: a blown time budget or eagerly imported heavy modules.
+    """
+    import_seconds, modules = measure_import_time()
+    problems = []
+    if import_seconds > budget:
+        problems.append(f"importing run_reminder took {import_seconds * 1000:.0f} ms, budget is {budget * 1000:.0f} ms")
+    eager = sorted(module for module in LAZY_MODULES if module in modules)
+    if eager:
+        problems.append(f"imported at startup: {', '.join(eager)}")
+    return problems
+
+
+@benchmark("startup", repeat=5)
+def bench_startup():
+    return lambda: measure_import_time()
+
+
+def measure(setup, repeat):
+    function = setup()
+    # Warm-up run, e.g. for lazy imports and regex compilation
+    function()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "wall_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "repeat": repeat,
+        "peak_bytes": peak_bytes,
+    }
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Returns the benchmarks whose median wall time grew by more than 'threshold' (0.25 = 25 %) against 'baseline'.
+    """
+    regressions = {}
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("wall_seconds"):
+            continue
+        ratio = result["wall_seconds"] / previous["wall_seconds"]
+        if ratio > 1 + threshold:
+            regressions[name] = round(ratio, 2)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Packt free book reminder.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results as JSON.")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline before failing, 0.25 = 25 %%.")
+    parser.add_argument("--only", help="Comma-separated names of the benchmarks to run.")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_SECONDS,
+                        help="Import time budget of run_reminder in seconds, checked with the 'startup' benchmark.")
+    args = parser.parse_args(argv)
+
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    results = {}
+    for name in selected:
+        setup, repeat = BENCHMARKS[name]
+        results[name] = measure(setup, repeat)
+        print(f"{name:<28} {results[name]['wall_seconds'] * 1000:10.2f} ms {results[name]['peak_bytes'] / 1024:10.0f} KiB")
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump({"python": platform.python_version(), "results": results}, file, indent=2)
+
+    if "label_structured" in selected:
+        comparison = compare_labeling()
+        for mode, values in comparison.items():
+            print(f"Labeling {mode:<12} {values['prompt_tokens']:6} prompt tokens {values['completion_tokens']:5} "
+                  f"completion tokens {values['seconds'] * 1000:8.1f} ms")
+
+    if "startup" in selected:
+        problems = check_startup(args.startup_budget)
+        if problems:
+            print(f"Startup budget exceeded: {'; '.join(problems)}")
+            return 1
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions above {args.threshold:.0%}: {regressions}")
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+# The details of one giveaway book, as extracted from a website. Renderers, caches and the catalog share this record.
+from dataclasses import asdict, dataclass
+
+NOT_AVAILABLE = "Nicht verfügbar"
+
+
+@dataclass(frozen=True, slots=True)
+class BookRecord:
+    title: str = NOT_AVAILABLE
+    author: str = NOT_AVAILABLE
+    publication_year: str = NOT_AVAILABLE
+    description: str = NOT_AVAILABLE
+    # HTML snippet of the book on the website, empty if it wasn't found
+    snippet: str = ""
+    publisher: str = "Packt"
+    formats: str = "EPUB, PDF, MOBI"
+    source: str = "Packt Giveaway"
+    price: str = "0"
+    source_name: str = "PacktPub Free Learning"
+    source_url: str = "https://www.packtpub.com/free-learning"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "BookRecord":
+        return cls(**{name: values[name] for name in cls.__dataclass_fields__ if name in values})
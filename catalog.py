@@ -0,0 +1,221 @@
+# This class keeps the history of all giveaways in an indexed SQLite database and exports it for the spreadsheet.
+import argparse
+import csv
+import re
+import sqlite3
+import sys
+from datetime import date as Date
+from book_record import NOT_AVAILABLE, BookRecord
+
+EXPORT_COLUMNS = ["title", "author", "publication_year", "description", "labels",
+                  "publisher", "formats", "date", "source", "price"]
+
+# Columns that catalogs of older versions don't have yet, with their definition
+ADDED_COLUMNS = {
+    "snippet": "TEXT NOT NULL DEFAULT ''",
+    "source_name": "TEXT NOT NULL DEFAULT ''",
+    "source_url": "TEXT NOT NULL DEFAULT ''",
+    "labels_guessed": "INTEGER NOT NULL DEFAULT 0",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    book_key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL COLLATE NOCASE,
+    author TEXT NOT NULL COLLATE NOCASE,
+    publication_year TEXT NOT NULL,
+    description TEXT NOT NULL,
+    publisher TEXT NOT NULL,
+    formats TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS giveaways (
+    id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL REFERENCES books (id),
+    date TEXT NOT NULL,
+    source TEXT NOT NULL,
+    price TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    snippet TEXT NOT NULL DEFAULT '',
+    source_name TEXT NOT NULL DEFAULT '',
+    source_url TEXT NOT NULL DEFAULT '',
+    labels_guessed INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (date, source, book_id)
+);
+CREATE TABLE IF NOT EXISTS book_labels (
+    book_id INTEGER NOT NULL REFERENCES books (id),
+    label TEXT NOT NULL,
+    PRIMARY KEY (label, book_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS books_title ON books (title);
+CREATE INDEX IF NOT EXISTS books_author ON books (author);
+CREATE INDEX IF NOT EXISTS books_publication_year ON books (publication_year);
+CREATE INDEX IF NOT EXISTS giveaways_date ON giveaways (date);
+CREATE INDEX IF NOT EXISTS giveaways_book_date ON giveaways (book_id, date);
+"""
+
+
+def split_labels(labels):
+    return [label.strip() for label in (labels or "").split(",") if label.strip()]
+
+
+def book_key(book):
+    # The same book given away again keeps its key, even if the page spells it slightly differently
+    return re.sub(r"\s+", " ", f"{book.title}\x1f{book.author}").strip().casefold()
+
+
+class Catalog:
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(giveaways)")}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE giveaways ADD COLUMN {column} {definition}")
+        self.connection.commit()
+
+    def record(self, book: BookRecord, labels: str, date: Date = None, guessed: bool = False) -> bool:
+        """
+        Adds the giveaway of 'book' on 'date' (today by default). Returns False if it was already recorded.
+        """
+        return self.record_many([(book, labels, date)], {book.title} if guessed else ()) == 1
+
+    def record_many(self, entries, guessed_titles=()) -> int:
+        """
+        Adds (book, labels, date) giveaways in one transaction. Returns the number of new giveaways.
+        Books whose extraction failed, i.e. without a title, are skipped. The labels of the books in
+        'guessed_titles' were guessed by the pre-labeler, so it doesn't learn from them.
+        """
+        added = 0
+        with self.connection:
+            for book, labels, date in entries:
+                if book.title in (NOT_AVAILABLE, ""):
+                    print("Not recording a book without a title in the catalog.")
+                    continue
+                added += self._insert(book, labels, date or Date.today(), book.title in guessed_titles)
+        return added
+
+    def _insert(self, book, labels, date, guessed):
+        key = book_key(book)
+        self.connection.execute(
+            "INSERT INTO books (book_key, title, author, publication_year, description, publisher, formats) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (book_key) DO NOTHING",
+            (key, book.title, book.author, book.publication_year, book.description, book.publisher, book.formats),
+        )
+        book_id = self.connection.execute("SELECT id FROM books WHERE book_key = ?", (key,)).fetchone()[0]
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO giveaways (book_id, date, source, price, labels, snippet, source_name, source_url, "
+            "labels_guessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (book_id, date.isoformat(), book.source, book.price, labels or "", book.snippet, book.source_name,
+             book.source_url, int(guessed)),
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO book_labels (book_id, label) VALUES (?, ?)",
+            [(book_id, label.casefold()) for label in split_labels(labels)],
+        )
+        return cursor.rowcount
+
+    def find(self, label: str = None, since: Date = None, until: Date = None, title: str = None,
+             author: str = None, year=None, unique_books: bool = False, guessed: bool = True):
+        """
+        Yields (book, labels, date) entries of matching giveaways, oldest first, with the date as 'dd.mm.yyyy'.
+        'label', 'title' and 'author' match case-insensitively. With 'unique_books', a book that was
+        given away several times is only returned for its latest giveaway. Without 'guessed', giveaways
+        whose labels were guessed by the pre-labeler are left out.
+        """
+        rows = self._select(label=label, since=since, until=until, title=title, author=author, year=year,
+                            unique_books=unique_books, guessed=guessed, snippet=True)
+        for (title, author, year, description, labels, publisher, formats, date, source, price, snippet,
+             source_name, source_url) in rows:
+            # Giveaways recorded before the source website was kept are from Packt, the default of BookRecord
+            website = {name: value for name, value in (("source_name", source_name), ("source_url", source_url)) if value}
+            book = BookRecord(title=title, author=author, publication_year=year, description=description,
+                              snippet=snippet, publisher=publisher, formats=formats, source=source, price=price,
+                              **website)
+            yield book, labels, date
+
+    def export(self, file, delimiter: str = "\t", header: bool = False, **filters) -> int:
+        """
+        Streams the matching giveaways to 'file' as TSV (or CSV with delimiter=','), in the column
+        order of the details line. Takes the filters of find(). Returns the number of rows written.
+        """
+        writer = csv.writer(file, delimiter=delimiter, lineterminator="\n")
+        if header:
+            writer.writerow(EXPORT_COLUMNS)
+        count = 0
+        for row in self._select(**filters):
+            writer.writerow(row)
+            count += 1
+        return count
+
+    def _select(self, label=None, since=None, until=None, title=None, author=None, year=None, unique_books=False,
+                guessed=True, snippet=False):
+        conditions = []
+        parameters = []
+        if label:
+            conditions.append("g.book_id IN (SELECT book_id FROM book_labels WHERE label = ?)")
+            parameters.append(label.strip().casefold())
+        if since:
+            conditions.append("g.date >= ?")
+            parameters.append(since.isoformat())
+        if until:
+            conditions.append("g.date <= ?")
+            parameters.append(until.isoformat())
+        if title:
+            conditions.append("b.title = ?")
+            parameters.append(title)
+        if author:
+            conditions.append("b.author = ?")
+            parameters.append(author)
+        if year:
+            conditions.append("b.publication_year = ?")
+            parameters.append(str(year))
+        if not guessed:
+            conditions.append("g.labels_guessed = 0")
+        if unique_books:
+            conditions.append("g.date = (SELECT MAX(date) FROM giveaways WHERE book_id = g.book_id)")
+
+        # Columns in EXPORT_COLUMNS order, followed by the snippet and the source website for find(); the ISO date 'yyyy-mm-dd' is turned into 'dd.mm.yyyy'
+        query = (
+            "SELECT b.title, b.author, b.publication_year, b.description, g.labels, b.publisher, b.formats, "
+            "substr(g.date, 9, 2) || '.' || substr(g.date, 6, 2) || '.' || substr(g.date, 1, 4), g.source, g.price"
+            + (", g.snippet, g.source_name, g.source_url " if snippet else " ") +
+            "FROM giveaways g JOIN books b ON b.id = g.book_id"
+        )
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY g.date, g.id"
+
+        # The cursor is iterated lazily, so the history is never loaded into memory at once
+        return self.connection.execute(query, parameters)
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exports the giveaway catalog as TSV or CSV to stdout.")
+    parser.add_argument("path", help="Path of the catalog database.")
+    parser.add_argument("--csv", action="store_true", help="Write CSV instead of TSV.")
+    parser.add_argument("--header", action="store_true", help="Write a header row.")
+    parser.add_argument("--label")
+    parser.add_argument("--since", type=Date.fromisoformat, help="First date, e.g. 2023-01-01.")
+    parser.add_argument("--until", type=Date.fromisoformat, help="Last date, e.g. 2023-12-31.")
+    parser.add_argument("--title")
+    parser.add_argument("--author")
+    parser.add_argument("--year")
+    parser.add_argument("--unique-books", action="store_true", help="List re-giveaways only once.")
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.path)
+    try:
+        catalog.export(sys.stdout, delimiter="," if args.csv else "\t", header=args.header, label=args.label,
+                       since=args.since, until=args.until, title=args.title, author=args.author,
+                       year=args.year, unique_books=args.unique_books)
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# A run-wide time budget that is split across the stages of the reminder, and a circuit breaker that
+# remembers failing OpenAI requests across runs. The active deadline is kept in a contextvar, so every
+# network call below it, also in threads started with asyncio.to_thread, can ask for its timeout.
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+current = contextvars.ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+
+    def __init__(self, seconds: float, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def stage(self, share: float) -> "Deadline":
+        """
+        Returns the deadline of a stage that may use 'share' of the whole budget, but never more than is left.
+        Time a previous stage didn't need is left to the following ones.
+        """
+        return Deadline(min(self.remaining(), self.seconds * share), self.clock)
+
+    def timeout(self) -> float:
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"The deadline of {self.seconds:.1f} seconds has passed.")
+        return remaining
+
+
+@contextmanager
+def activate(deadline: Deadline):
+    # None runs the block without a deadline
+    token = current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current.reset(token)
+
+
+def current_timeout():
+    """
+    Returns the seconds left for a network call under the active deadline, or None without a deadline.
+    """
+    deadline = current.get()
+    return deadline.timeout() if deadline is not None else None
+
+
+def timeout_kwargs() -> dict:
+    # Calls without an active deadline keep the defaults of their library
+    timeout = current_timeout()
+    return {"timeout": timeout} if timeout is not None else {}
+
+
+class CircuitBreaker:
+
+    def __init__(self, path: str = None, failure_threshold: int = 3, reset_after: float = 3600, clock=time.time):
+        """
+        Opens after 'failure_threshold' failures in a row and then lets one trial call through every
+        'reset_after' seconds. With a 'path', the state survives between the scheduled runs.
+        """
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.failures, self.opened_at = self.load()
+
+    def load(self):
+        if self.path is None:
+            return 0, None
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+            return int(state.get("failures", 0)), state.get("opened_at")
+        except (OSError, ValueError):
+            return 0, None
+
+    def save(self):
+        if self.path is None:
+            return
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"failures": self.failures, "opened_at": self.opened_at}, file)
+        os.replace(temporary_path, self.path)
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at < self.reset_after:
+                return False
+            # Half-open: this call is the trial, the others wait for its result
+            self.opened_at = self.clock()
+            self.save()
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.failures or self.opened_at is not None:
+                self.failures, self.opened_at = 0, None
+                self.save()
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.save()
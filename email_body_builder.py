@@ -1,23 +1,104 @@
-from bs4 import BeautifulSoup
-from datetime import datetime
+from book_record import BookRecord, NOT_AVAILABLE
+from email_renderer import render_html, today
 from labeler import Labeler
 import re
 
+# Opening tag of the first div carrying the class 'product__info'
+PRODUCT_INFO_DIV = re.compile(
+    r'<div\b[^>]*?\bclass\s*=\s*(["\'])(?:[^"\']*\s)?product__info(?:\s[^"\']*)?\1', re.IGNORECASE)
+DIV_TAG = re.compile(r'<(/?)div\b', re.IGNORECASE)
+ANY_TAG = re.compile(r'<(/?)([a-zA-Z][^\s/>]*)[^>]*?(/?)>')
+IGNORED_MARKUP = re.compile(r'<!--.*?-->|<(script|style)\b.*?</\1\s*>', re.DOTALL | re.IGNORECASE)
+
+
+def scoped_product_info_region(website_content):
+    """
+    Cuts the 'product__info' div out of 'website_content' without parsing the whole page.
+    Returns None if the div can't be located, so the caller can fall back to a full parse.
+    """
+    match = PRODUCT_INFO_DIV.search(website_content)
+    if not match:
+        return None
+
+    start = match.start()
+    end = len(website_content)
+    depth = 0
+    for div_tag in DIV_TAG.finditer(website_content, start):
+        depth += -1 if div_tag.group(1) else 1
+        if depth == 0:
+            end = website_content.find(">", div_tag.end()) + 1 or len(website_content)
+            break
+
+    return pending_void_elements(website_content[:start]) + website_content[start:end]
+
+
+def pending_void_elements(html_prefix):
+    """
+    The html.parser tree builder remembers void elements like '<img>' that were written without
+    a closing slash and swallows the next self-closing '<img/>' of the same name. Replays this
+    state for the skipped part of the page, so the scoped parse renders exactly like a full parse.
+    """
+    from bs4.builder import HTMLTreeBuilder
+
+    pending = {}
+    for tag in ANY_TAG.finditer(IGNORED_MARKUP.sub("", html_prefix)):
+        name = tag.group(2).lower()
+        if name not in HTMLTreeBuilder.empty_element_tags:
+            continue
+        if tag.group(1) or tag.group(3):
+            if pending.get(name):
+                pending[name] -= 1
+        else:
+            pending[name] = pending.get(name, 0) + 1
+    return "".join(f"<{name}>" * count for name, count in pending.items())
+
+
+def clean_author(author_text):
+    author = author_text.removeprefix("By").strip()
+    author = re.sub(r'\s+', ' ', author)
+    return author.replace(' ,', ',')
+
+
+def clean_description(description_text):
+    return re.sub(r'\s+', ' ', description_text)
+
+
 class EmailBodyBuilder:
-    def __init__(self, openai_client):
-        self.labeler = Labeler(openai_client)
+    # 'scoped' parses only the 'product__info' region and falls back to 'full' if it can't be found
+    PARSERS = ("scoped", "full")
 
-    def get_email_body(self, website_content):
+    def __init__(self, openai_client, parser: str = "scoped", label_cache=None, pre_labeler=None, breaker=None,
+                 structured_labels: bool = False, canonicalizer=None):
+        if parser not in self.PARSERS:
+            raise ValueError(f"Unknown parser '{parser}', expected one of {self.PARSERS}")
+        self.labeler = Labeler(openai_client, cache=label_cache, pre_labeler=pre_labeler, breaker=breaker,
+                               structured=structured_labels, canonicalizer=canonicalizer)
+        self.parser = parser
+
+    def parse(self, website_content):
+        """
+        Returns the BeautifulSoup tree that contains the 'product__info' div, using the configured parser.
+        """
+        # Imported here, so that starting the reminder doesn't pay for it before the page is there
+        from bs4 import BeautifulSoup
+
+        if self.parser == "scoped":
+            region = scoped_product_info_region(website_content)
+            if region is not None:
+                return BeautifulSoup(region, "html.parser")
+        return BeautifulSoup(website_content, "html.parser")
+
+    def extract_book(self, website_content) -> BookRecord:
         """
         Searches in 'website_content' for a parent div with class='product__info'
         and within it for the child div with class='main-product'.
-        Returns this snippet as an HTML string.
+        Returns the book details and this snippet as a BookRecord.
         """
-        soup = BeautifulSoup(website_content, "html.parser")
+        soup = self.parse(website_content)
 
         snippet = ""
-        title = author = publication_year = description = "Nicht verfügbar"
-        
+        title = author = publication_year = description = NOT_AVAILABLE
+
         parent_div = soup.find("div", class_="product__info")
         if parent_div:
             main_product_div = parent_div.find("div", class_="main-product")
@@ -32,10 +113,7 @@ class EmailBodyBuilder:
 
                 author_tag = main_product_div.find("span", class_="product-info__author")
                 if author_tag:
-                    author = author_tag.get_text(strip=True)
-                    author = author.removeprefix("By").strip()
-                    author = re.sub(r'\s+', ' ', author)
-                    author = author.replace(' ,', ',')
+                    author = clean_author(author_tag.get_text(strip=True))
 
                 publication_date_tag = main_product_div.find("div", class_="free_learning__product_pages_date")
                 if publication_date_tag:
@@ -43,93 +121,25 @@ class EmailBodyBuilder:
 
                 description_tag = main_product_div.find("div", class_="free_learning__product_description")
                 if description_tag:
-                    description = description_tag.get_text(strip=True)
-                    description = re.sub(r'\s+', ' ', description)
-
-        # If snippet is empty, we provide a small hint
-        if not snippet:
-            snippet = "<p>Unfortunately, no matching snippet found.</p>"
+                    description = clean_description(description_tag.get_text(strip=True))
 
         # Replace relative path in images
         snippet = snippet.replace("src=\"/images", "src=\"https://www.packtpub.com/images")
 
-        # Get today's date in the format 'dd.mm.yyyy'
-        today_date = datetime.now().strftime("%d.%m.%Y")
+        return BookRecord(title=title, author=author, publication_year=publication_year,
+                          description=description, snippet=snippet)
 
-        # Get labels using the Labeler
+    def get_labels(self, book: BookRecord) -> str:
         try:
-            labels = self.labeler.get_labels(title, author, description)
+            return self.labeler.get_labels(book.title, book.author, book.description)
         except Exception as e:
             print(f"Could not get labels due to exception: {e}")
-            labels = ""
-        
-        details_line = f"{title}\t{author}\t{publication_year}\t{description}\t{labels}\tPackt\tEPUB, PDF, MOBI\t{today_date}\tPackt Giveaway\t0" 
-
-        email_html = f"""
-        <html>
-          <head>
-            <style>
-              table {{
-                border-collapse: collapse;
-                width: 100%;
-              }}
-              th, td {{
-                border: 1px solid #ddd;
-                padding: 8px;
-                text-align: left;
-              }}
-              th {{
-                background-color: #f2f2f2;
-              }}
-              tr:nth-child(even) {{
-                background-color: #f9f9f9;
-              }}
-              tr:hover {{
-                background-color: #ddd;
-              }}
-              .product-info__rating {{
-                background-color: #333; /* Dark background */
-                color: #fff; /* Bright text */
-                padding: 10px;
-                border-radius: 5px;
-              }}
-            </style>
-          </head>
-          <body>
-            <h2><a href="https://www.packtpub.com/free-learning">Today at PacktPub Free Learning:</a></h2>
-            {snippet}
-            <p/>
-            <table>
-              <tr>
-                <th>Title</th>
-                <th>Author</th>
-                <th>Publication Year</th>
-                <th>Description</th>
-                <th>Labels</th>
-                <th>Publisher</th>
-                <th>Formats</th>
-                <th>Date</th>
-                <th>Source</th>
-                <th>Price</th>
-              </tr>
-              <tr>
-                <td>{title}</td>
-                <td>{author}</td>
-                <td>{publication_year}</td>
-                <td>{description}</td>
-                <td>{labels}</td>
-                <td>Packt</td>
-                <td>EPUB, PDF, MOBI</td>
-                <td>{today_date}</td>
-                <td>Packt Giveaway</td>
-                <td>0</td>
-              </tr>
-            </table>
-
-            <p/>
-            <textarea rows="5" cols="150">{details_line}</textarea>
-
-          </body>
-        </html>
+            return ""
+
+    def get_email_body(self, website_content):
+        """
+        Extracts the book from 'website_content', labels it and returns the HTML email.
         """
-        return email_html
\ No newline at end of file
+        book = self.extract_book(website_content)
+        labels = self.get_labels(book)
+        return render_html([(book, labels, today())])
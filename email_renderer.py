@@ -0,0 +1,171 @@
+# Renders extracted books into the HTML email, a plain text version and the tab-separated details line.
+# The templates are compiled once at import time, so rendering is only a string join.
+import re
+from datetime import datetime
+
+NO_SNIPPET = "<p>Unfortunately, no matching snippet found.</p>"
+
+
+class CompiledTemplate:
+    """
+    A template with '{name}' placeholders, split once into its literal parts.
+    Braces that aren't a placeholder, e.g. in CSS rules, are kept as they are.
+    """
+    PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+    def __init__(self, text: str):
+        parts = self.PLACEHOLDER.split(text)
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+
+    def render(self, **values) -> str:
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            out.append(str(values[name]))
+            out.append(literal)
+        return "".join(out)
+
+
+EMAIL_TEMPLATE = CompiledTemplate("""
+        <html>
+          <head>
+            <style>
+              table {
+                border-collapse: collapse;
+                width: 100%;
+              }
+              th, td {
+                border: 1px solid #ddd;
+                padding: 8px;
+                text-align: left;
+              }
+              th {
+                background-color: #f2f2f2;
+              }
+              tr:nth-child(even) {
+                background-color: #f9f9f9;
+              }
+              tr:hover {
+                background-color: #ddd;
+              }
+              .product-info__rating {
+                background-color: #333; /* Dark background */
+                color: #fff; /* Bright text */
+                padding: 10px;
+                border-radius: 5px;
+              }
+            </style>
+          </head>
+          <body>
+{sections}            <table>
+              <tr>
+                <th>Title</th>
+                <th>Author</th>
+                <th>Publication Year</th>
+                <th>Description</th>
+                <th>Labels</th>
+                <th>Publisher</th>
+                <th>Formats</th>
+                <th>Date</th>
+                <th>Source</th>
+                <th>Price</th>
+              </tr>
+{rows}            </table>
+
+            <p/>
+            <textarea rows="5" cols="150">{details}</textarea>
+
+          </body>
+        </html>
+        """)
+
+SECTION_TEMPLATE = CompiledTemplate("""            <h2><a href="{source_url}">{heading}</a></h2>
+            {snippet}
+            <p/>
+""")
+
+ROW_TEMPLATE = CompiledTemplate("""              <tr>
+                <td>{title}</td>
+                <td>{author}</td>
+                <td>{publication_year}</td>
+                <td>{description}</td>
+                <td>{labels}</td>
+                <td>{publisher}</td>
+                <td>{formats}</td>
+                <td>{date}</td>
+                <td>{source}</td>
+                <td>{price}</td>
+              </tr>
+""")
+
+DETAILS_TEMPLATE = CompiledTemplate(
+    "{title}\t{author}\t{publication_year}\t{description}\t{labels}\t{publisher}\t{formats}\t{date}\t{source}\t{price}")
+
+TEXT_TEMPLATE = CompiledTemplate("""{heading} {title}
+Author: {author}
+Publication Year: {publication_year}
+Labels: {labels}
+{description}
+{source_url}
+""")
+
+
+def today():
+    # Format 'dd.mm.yyyy'
+    return datetime.now().strftime("%d.%m.%Y")
+
+
+def heading(book, date):
+    # Books of earlier days, e.g. in a digest, are headed by their giveaway date
+    return f"Today at {book.source_name}:" if date == today() else f"On {date} at {book.source_name}:"
+
+
+def book_values(book, labels, date):
+    values = book.to_dict()
+    values["labels"] = labels
+    values["date"] = date
+    values["heading"] = heading(book, date)
+    return values
+
+
+def details_line(book, labels, date=None) -> str:
+    return DETAILS_TEMPLATE.render(**book_values(book, labels, date or today()))
+
+
+class HtmlEmail:
+    """
+    The HTML email, rendered one book at a time, e.g. each as soon as its labels arrived.
+    """
+
+    def __init__(self):
+        self.sections = []
+        self.rows = []
+        self.details = []
+
+    def add(self, book, labels, date=None):
+        values = book_values(book, labels, date or today())
+        self.sections.append(SECTION_TEMPLATE.render(
+            source_url=book.source_url, heading=values["heading"], snippet=book.snippet or NO_SNIPPET))
+        self.rows.append(ROW_TEMPLATE.render(**values))
+        self.details.append(DETAILS_TEMPLATE.render(**values))
+
+    def render(self) -> str:
+        return EMAIL_TEMPLATE.render(sections="".join(self.sections), rows="".join(self.rows),
+                                     details="\n".join(self.details))
+
+
+def render_html(entries) -> str:
+    """
+    Renders (book, labels, date) entries into one HTML email with a section per book and a table row per book.
+    """
+    email = HtmlEmail()
+    for book, labels, date in entries:
+        email.add(book, labels, date)
+    return email.render()
+
+
+def render_text(entries) -> str:
+    """
+    Renders (book, labels, date) entries into a plain text email.
+    """
+    return "\n".join(TEXT_TEMPLATE.render(**book_values(book, labels, date or today())) for book, labels, date in entries)
@@ -0,0 +1,131 @@
+# Websites that give away free books. Each source knows its URL and how to extract the book from its page.
+# All sources are fetched concurrently, by the fetch of the reminder or through one pooled requests.Session.
+from __future__ import annotations
+import contextvars
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+import deadline
+from book_record import BookRecord
+from email_body_builder import EmailBodyBuilder
+
+if TYPE_CHECKING:
+    import requests
+
+SOURCES = {}
+
+
+def register_source(source_class):
+    SOURCES[source_class.name] = source_class
+    return source_class
+
+
+class GiveawaySource(ABC):
+    name = ""
+    url = ""
+
+    @abstractmethod
+    def extract(self, website_content) -> BookRecord:
+        """
+        Returns the book given away on the page 'website_content'.
+        """
+
+
+@register_source
+class PacktSource(GiveawaySource):
+    name = "packt"
+    url = "https://www.packtpub.com/free-learning"
+
+    def __init__(self, parser: str = "scoped"):
+        # Only the extraction of the builder is used, labels are requested for all sources together
+        self.builder = EmailBodyBuilder(openai_client=None, parser=parser)
+
+    def extract(self, website_content) -> BookRecord:
+        return self.builder.extract_book(website_content)
+
+
+def create_sources(names):
+    """
+    Returns source instances for comma-separated or listed source names, e.g. 'packt'.
+    """
+    if isinstance(names, str):
+        names = names.split(",")
+    sources = []
+    for name in (name.strip() for name in names):
+        if not name:
+            continue
+        if name not in SOURCES:
+            raise ValueError(f"Unknown giveaway source '{name}', expected one of {sorted(SOURCES)}")
+        sources.append(SOURCES[name]())
+    return sources
+
+
+class HostRateLimiter:
+    """
+    Keeps at least 'min_interval' seconds between two requests to the same host.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.next_request_at = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_request_at.get(host, now) - now
+            self.next_request_at[host] = max(now, self.next_request_at.get(host, now)) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def create_session(pool_size: int = 10) -> requests.Session:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_sources(sources, session: requests.Session = None, max_workers: int = 4,
+                  min_interval_per_host: float = 1.0, fetch=None) -> list:
+    """
+    Fetches and extracts all sources concurrently. Returns a (source, book, error) tuple per source,
+    in the order of 'sources'; a failing source has no book but an error and doesn't affect the others.
+    'fetch(url, rate_limiter)' returns the content of a page, e.g. the retrying and cached fetch of the
+    reminder, and waits for 'rate_limiter' before every request, retries included. Without it, the pages
+    are requested once through 'session', with the timeout of the active deadline.
+    """
+    own_session = fetch is None and session is None
+    if own_session:
+        session = create_session()
+    if fetch is None:
+        def fetch(url, rate_limiter):
+            rate_limiter.wait(url)
+            response = session.get(url, **deadline.timeout_kwargs())
+            response.raise_for_status()
+            return response.text
+    rate_limiter = HostRateLimiter(min_interval_per_host)
+
+    def fetch_source(source):
+        try:
+            return source, source.extract(fetch(source.url, rate_limiter=rate_limiter)), None
+        except Exception as e:
+            print(f"Could not get the book from source '{source.name}': {e}")
+            return source, None, e
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sources)))) as executor:
+            # Each source is fetched in a copy of the caller's context, so the active deadline and span reach it
+            futures = [executor.submit(contextvars.copy_context().run, fetch_source, source) for source in sources]
+            return [future.result() for future in futures]
+    finally:
+        if own_session:
+            session.close()
@@ -0,0 +1,79 @@
+# A minimal local HTTP server for tests and benchmarks. It answers every request with the same body,
+# optionally after a delay, to stand in for the Packt website or a slow or hanging API. Connections are kept
+# alive and counted, and with a 'certfile' it serves HTTPS, so that connection reuse can be checked.
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class HttpStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, body: bytes = b"", content_type: str = "text/html; charset=utf-8", delay: float = 0,
+                 host: str = "127.0.0.1", port: int = 0, certfile: str = None):
+        """
+        'certfile' holds the private key and certificate for HTTPS, e.g. test_cert.pem.
+        """
+        super().__init__((host, port), HttpSession)
+        self.body = body
+        self.content_type = content_type
+        self.delay = delay
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.tls = certfile is not None
+        if self.tls:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(certfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    @property
+    def url(self):
+        return f"{'https' if self.tls else 'http'}://{self.server_address[0]}:{self.server_address[1]}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class HttpSession(BaseHTTPRequestHandler):
+    # Keeps the connection open for further requests, like a real web server
+    protocol_version = "HTTP/1.1"
+    # Otherwise the body waits for the client's delayed ACK of the headers on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.respond()
+
+    def respond(self):
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path))
+        time.sleep(self.server.delay)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", self.server.content_type)
+            self.send_header("Content-Length", str(len(self.server.body)))
+            self.end_headers()
+            self.wfile.write(self.server.body)
+        except OSError:
+            # The client gave up waiting
+            pass
+
+    def log_message(self, format, *args):
+        pass
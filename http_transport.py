@@ -0,0 +1,133 @@
+# This class keeps one pooled httpx client for all HTTP requests of a run: the page fetch and, as its
+# http_client, the OpenAI client. Connections are kept alive between requests and retries, so DNS, TCP
+# and TLS are only paid once per host, and HTTP/2 is used if the h2 package is installed.
+import importlib.util
+import threading
+from collections import Counter
+
+
+def http2_available():
+    return importlib.util.find_spec("h2") is not None
+
+
+class HttpResponse:
+    """
+    Gives an httpx response the parts of the requests API that the page fetch uses.
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+    @property
+    def status_code(self):
+        return self.response.status_code
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    @property
+    def encoding(self):
+        return self.response.encoding
+
+    @property
+    def content(self):
+        return self.response.content
+
+    @property
+    def text(self):
+        return self.response.text
+
+    def raise_for_status(self):
+        # Like requests, only errors raise; httpx would also raise for '304 Not Modified'
+        if self.response.status_code >= 400:
+            self.response.raise_for_status()
+
+    def iter_content(self, chunk_size=None):
+        return self.response.iter_bytes(chunk_size)
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class HttpTransport:
+
+    def __init__(self, http2: bool = True, max_connections: int = 10, max_keepalive_connections: int = 5,
+                 keepalive_expiry: float = 30.0, timeout: float = 30.0, verify=True):
+        """
+        'timeout' applies to requests without a timeout of their own, connecting takes at most 10 seconds of it.
+        'verify' is True, False or an ssl.SSLContext with the trusted certificates.
+        """
+        import httpx
+
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            print("The h2 package is not installed, using HTTP/1.1.")
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.http_versions = Counter()
+        self.client = httpx.Client(
+            http2=self.http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                                keepalive_expiry=keepalive_expiry),
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            verify=verify,
+            follow_redirects=True,
+            event_hooks={"request": [self.on_request], "response": [self.on_response]},
+        )
+
+    def on_request(self, request):
+        self.count("requests")
+        # httpcore reports the steps of every request to this callback, also for the requests of the OpenAI client
+        request.extensions["trace"] = self.trace
+
+    def on_response(self, response):
+        with self.lock:
+            self.http_versions[response.http_version] += 1
+
+    def trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            self.count("connections")
+        elif event == "connection.start_tls.complete":
+            self.count("tls_handshakes")
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def get(self, url, headers=None, stream=False, timeout=None) -> HttpResponse:
+        """
+        Sends a GET like requests.get. With 'stream', the body is read by iter_content() and the response must be closed.
+        """
+        kwargs = {"headers": headers} if headers else {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        request = self.client.build_request("GET", url, **kwargs)
+        return HttpResponse(self.client.send(request, stream=stream))
+
+    def stats(self):
+        with self.lock:
+            requests, connections = self.counts["requests"], self.counts["connections"]
+            return {
+                "requests": requests,
+                "connections": connections,
+                "tls_handshakes": self.counts["tls_handshakes"],
+                "reused": max(0, requests - connections),
+                "reuse_rate": max(0, requests - connections) / requests if requests else 0.0,
+                "http_versions": dict(self.http_versions),
+            }
+
+    def close(self):
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
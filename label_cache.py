@@ -0,0 +1,84 @@
+# This class stores labels in a SQLite database, so that the same book isn't sent to the OpenAI API twice.
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+
+class LabelCache:
+
+    def __init__(self, path: str, ttl: float = 30 * 24 * 3600, max_entries: int = 1000, refresh: bool = False):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # With 'refresh', cached labels are ignored but fresh ones are still stored
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        # The connection is shared by the worker threads of the pipeline and of batch labeling
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "key TEXT PRIMARY KEY, labels TEXT NOT NULL, created_at REAL NOT NULL, "
+            "last_used REAL NOT NULL, latency REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS labels_last_used ON labels (last_used)")
+        self.connection.commit()
+
+    @staticmethod
+    def key(title, author, description, system_prompt, model) -> str:
+        fields = [re.sub(r"\s+", " ", str(field or "")).strip().casefold() for field in (title, author, description)]
+        fields += [system_prompt, str(model or "")]
+        return hashlib.sha256("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached labels for 'key' or None. Expired entries are deleted on the way.
+        """
+        with self.lock:
+            if self.refresh:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            row = self.connection.execute("SELECT labels, created_at, latency FROM labels WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self.connection.execute("DELETE FROM labels WHERE key = ?", (key,))
+                    self.connection.commit()
+                self.misses += 1
+                return None
+
+            self.connection.execute("UPDATE labels SET last_used = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+            self.saved_seconds += row[2]
+            return row[0]
+
+    def put(self, key, labels, latency):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO labels (key, labels, created_at, last_used, latency) VALUES (?, ?, ?, ?, ?)",
+                (key, labels, now, now, latency),
+            )
+            # Least recently used entries go first
+            self.connection.execute(
+                "DELETE FROM labels WHERE key NOT IN (SELECT key FROM labels ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self.connection.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+    def close(self):
+        self.connection.close()
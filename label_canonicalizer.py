@@ -0,0 +1,332 @@
+# This class maps the labels of the LLM to one canonical spelling, so that 'Kubernetes', 'kubernetes' and
+# 'Kubernets' don't end up as three labels in the catalog. It keeps a vocabulary and an alias table in SQLite
+# and finds similar labels with a trigram index. Near-identical spellings are merged right away; other
+# similar labels are proposed as aliases until an operator approves or rejects them.
+import argparse
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from itertools import chain
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vocabulary (
+    label TEXT PRIMARY KEY,
+    spelling TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    canonical TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    status TEXT NOT NULL
+);
+"""
+
+APPROVED = "approved"
+PROPOSED = "proposed"
+REJECTED = "rejected"
+
+SEPARATORS = re.compile(r"[\s_\-/]+")
+# Postings longer than this, or than 1% of the vocabulary, belong to trigrams too common to be worth counting
+COMMON_POSTINGS = 50
+# New labels and aliases are committed in batches of this many, and when the canonicalizer is closed
+COMMIT_EVERY = 100
+
+
+def normalize(label):
+    return " ".join(SEPARATORS.sub(" ", label or "").casefold().split())
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(grams, other_grams):
+    # Dice coefficient of the two trigram sets
+    return 2 * len(grams & other_grams) / (len(grams) + len(other_grams))
+
+
+class LabelCanonicalizer:
+
+    def __init__(self, path: str, min_similarity: float = 0.6, auto_merge: float = 0.9):
+        """
+        Labels at least 'auto_merge' similar to a known label are merged into it, labels at least
+        'min_similarity' similar are proposed as its alias and kept as they are until approved.
+        """
+        self.min_similarity = min_similarity
+        self.auto_merge = auto_merge
+        self.lookups = 0
+        self.aliased = 0
+        self.added = 0
+        self.uncommitted = 0
+        # The connection is shared by the worker threads of the pipeline and of batch labeling
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+        self.spellings = dict(self.connection.execute("SELECT label, spelling FROM vocabulary"))
+        # Built on the first label that isn't known yet; known labels and aliases only need the dicts
+        self.index = None
+        self.grams = {}
+        self.aliases = {}
+        self.known_aliases = set()
+        for alias, canonical, status in self.connection.execute("SELECT alias, canonical, status FROM aliases"):
+            self.known_aliases.add(alias)
+            if status == APPROVED:
+                self.aliases[alias] = canonical
+
+    def __len__(self):
+        return len(self.spellings)
+
+    def _build_index(self):
+        # Lists of keys build faster than sets; the trigrams of a key are only kept once it was a candidate
+        self.index = defaultdict(list)
+        for key in self.spellings:
+            for gram in trigrams(key):
+                self.index[gram].append(key)
+
+    def _index(self, key, spelling):
+        self.spellings[key] = spelling
+        if self.index is not None:
+            for gram in trigrams(key):
+                self.index[gram].append(key)
+
+    def _unindex(self, key):
+        # An alias may never have been a label of its own, or was already merged into another one
+        spelling = self.spellings.pop(key, None)
+        if spelling is not None and self.index is not None:
+            for gram in trigrams(key):
+                self.index[gram].remove(key)
+        self.grams.pop(key, None)
+        return spelling
+
+    def _trigrams(self, key):
+        grams = self.grams.get(key)
+        if grams is None:
+            grams = self.grams[key] = trigrams(key)
+        return grams
+
+    def match(self, label):
+        """
+        Returns the most similar known label as (key, similarity), or (None, 0.0) if none is similar enough.
+        """
+        key = normalize(label)
+        if key in self.spellings:
+            return key, 1.0
+        if self.index is None:
+            self._build_index()
+        grams = trigrams(key)
+        size, threshold = len(grams), self.min_similarity
+        # A label that is 'threshold' similar shares at least 'needed' trigrams with it. So the postings of up to
+        # 'needed - 1' trigrams can be skipped: a candidate that shares 'counted' of the others shares at most
+        # 'counted + skipped' trigrams in all. Only the long postings of very common trigrams are skipped.
+        needed = math.ceil(threshold * size / (2 - threshold))
+        ordered = sorted(grams, key=lambda gram: len(self.index.get(gram, ())), reverse=True)
+        common = max(COMMON_POSTINGS, len(self.spellings) // 100)
+        skipped = 0
+        while skipped < needed - 1 and len(self.index.get(ordered[skipped], ())) > common:
+            skipped += 1
+        counts = Counter(chain.from_iterable(self.index.get(gram, ()) for gram in ordered[skipped:]))
+        least_counted = max(1, math.ceil(threshold * (size + needed) / 2) - skipped)
+
+        best_similarity, best = 0.0, None
+        for candidate in [candidate for candidate, counted in counts.items() if counted >= least_counted]:
+            candidate_grams = self._trigrams(candidate)
+            if counts[candidate] + skipped < threshold * (size + len(candidate_grams)) / 2:
+                continue
+            candidate_similarity = similarity(grams, candidate_grams)
+            if (candidate_similarity, candidate) > (best_similarity, best or ""):
+                best_similarity, best = candidate_similarity, candidate
+        if best_similarity < self.min_similarity:
+            return None, 0.0
+        return best, best_similarity
+
+    def canonical(self, label):
+        """
+        Returns the canonical spelling of one label. New labels are added to the vocabulary.
+        """
+        key = normalize(label)
+        if not key:
+            return None
+        with self.lock:
+            self.lookups += 1
+            if key in self.aliases:
+                self.aliased += 1
+                return self.spellings[self.aliases[key]]
+            if key in self.spellings:
+                if self.spellings[key] != label.strip():
+                    self.aliased += 1
+                return self.spellings[key]
+
+            match, match_similarity = self.match(key)
+            if match is not None and match_similarity >= self.auto_merge:
+                self._store_alias(key, match, match_similarity, APPROVED)
+                self.aliased += 1
+                return self.spellings[match]
+            if match is not None and key not in self.known_aliases:
+                self._store_alias(key, match, match_similarity, PROPOSED)
+
+            self._index(key, label.strip())
+            self.connection.execute("INSERT OR REPLACE INTO vocabulary (label, spelling) VALUES (?, ?)",
+                                    (key, label.strip()))
+            self._changed()
+            self.added += 1
+            return label.strip()
+
+    def canonicalize(self, labels) -> str:
+        """
+        Canonicalizes comma-separated labels, e.g. an answer of the Labeler, and drops the duplicates.
+        """
+        canonical = []
+        for label in (labels or "").split(","):
+            spelling = self.canonical(label)
+            if spelling is not None and spelling.casefold() not in (c.casefold() for c in canonical):
+                canonical.append(spelling)
+        return ", ".join(canonical)
+
+    def add_many(self, labels):
+        """
+        Adds labels, e.g. the history of the catalog, in one transaction. Returns the number of new labels.
+        """
+        with self.lock:
+            rows = []
+            for label in labels:
+                key = normalize(label)
+                if key and key not in self.spellings and key not in self.aliases:
+                    self._index(key, label.strip())
+                    rows.append((key, label.strip()))
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO vocabulary (label, spelling) VALUES (?, ?)", rows)
+            return len(rows)
+
+    def _store_alias(self, alias, canonical, alias_similarity, status):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO aliases (alias, canonical, similarity, status) VALUES (?, ?, ?, ?)",
+            (alias, canonical, alias_similarity, status))
+        self._changed()
+        self.known_aliases.add(alias)
+        if status == APPROVED:
+            self.aliases[alias] = canonical
+
+    def _changed(self):
+        # A commit per new label would be the most expensive part of a lookup, so they are batched
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        """
+        Commits the new labels and aliases that aren't committed yet.
+        """
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def proposals(self):
+        """
+        Returns the (alias, canonical label, similarity) merges waiting for approval, most similar first.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT alias, canonical, similarity FROM aliases WHERE status = ? ORDER BY similarity DESC, alias",
+                (PROPOSED,)).fetchall()
+        return [(self.spellings.get(alias, alias), self.spellings.get(canonical, canonical), round(value, 3))
+                for alias, canonical, value in rows]
+
+    def approve(self, alias, canonical=None) -> bool:
+        """
+        Merges 'alias' into 'canonical', or into the label it was proposed for. Returns False if there is no such proposal.
+        """
+        key = normalize(alias)
+        with self.lock:
+            if canonical is None:
+                row = self.connection.execute("SELECT canonical, similarity FROM aliases WHERE alias = ? AND status = ?",
+                                              (key, PROPOSED)).fetchone()
+                if row is None:
+                    return False
+                target, alias_similarity = row
+            else:
+                target, alias_similarity = normalize(canonical), 1.0
+                if target not in self.spellings:
+                    self.add_many([canonical])
+            target = self.aliases.get(target, target)
+            if target == key:
+                return False
+
+            self._unindex(key)
+            self.connection.execute("DELETE FROM vocabulary WHERE label = ?", (key,))
+            # Aliases of the merged label follow it to its canonical label
+            self.connection.execute("UPDATE aliases SET canonical = ? WHERE canonical = ? AND status = ?",
+                                    (target, key, APPROVED))
+            for other, other_canonical in list(self.aliases.items()):
+                if other_canonical == key:
+                    self.aliases[other] = target
+            self._store_alias(key, target, alias_similarity, APPROVED)
+            self.flush()
+            return True
+
+    def reject(self, alias) -> bool:
+        """
+        Keeps 'alias' as a label of its own; it isn't proposed again.
+        """
+        with self.lock:
+            updated = self.connection.execute("UPDATE aliases SET status = ? WHERE alias = ? AND status = ?",
+                                              (REJECTED, normalize(alias), PROPOSED)).rowcount
+            self.flush()
+            return updated == 1
+
+    def stats(self):
+        return {"labels": len(self.spellings), "lookups": self.lookups, "aliased": self.aliased, "added": self.added,
+                "proposals": len(self.proposals())}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reviews the merges of the label vocabulary.")
+    parser.add_argument("path", help="Path of the label vocabulary database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("proposals", help="List the proposed merges.")
+    approve = commands.add_parser("approve", help="Approve a proposed merge, or merge a label into another one.")
+    approve.add_argument("alias")
+    approve.add_argument("canonical", nargs="?", help="Label to merge into, e.g. 'Kubernetes' for 'K8s'.")
+    reject = commands.add_parser("reject", help="Keep a proposed alias as a label of its own.")
+    reject.add_argument("alias")
+    seed = commands.add_parser("seed", help="Add the labels of the catalog and propose merges between them.")
+    seed.add_argument("catalog", help="Path of the catalog database.")
+    args = parser.parse_args(argv)
+
+    canonicalizer = LabelCanonicalizer(args.path)
+    try:
+        if args.command == "proposals":
+            for alias, canonical, value in canonicalizer.proposals():
+                print(f"{alias}\t-> {canonical}\t{value:.2f}")
+        elif args.command == "approve":
+            if not canonicalizer.approve(args.alias, args.canonical):
+                print(f"No proposal for {args.alias}.")
+        elif args.command == "reject":
+            if not canonicalizer.reject(args.alias):
+                print(f"No proposal for {args.alias}.")
+        else:
+            from catalog import Catalog, split_labels
+
+            catalog = Catalog(args.catalog)
+            try:
+                labels = Counter(label for _, book_labels, _ in catalog.find() for label in split_labels(book_labels))
+            finally:
+                catalog.close()
+            # The most used spelling becomes the canonical one
+            for label, _ in sorted(labels.items(), key=lambda item: (-item[1], item[0])):
+                canonicalizer.canonical(label)
+            print(f"Vocabulary: {canonicalizer.stats()}")
+    finally:
+        canonicalizer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,94 @@
 # This class can find labels from a book description. It uses the ChatGPT API in order to do it.
-from openai import OpenAI
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from deadline import CircuitBreaker, timeout_kwargs
+from label_cache import LabelCache
+from tracing import current_span, record_usage
+from typing import TYPE_CHECKING
+import json
 import os
+import re
+import time
+
+if TYPE_CHECKING:
+    # Only for type hints; importing openai takes longer than the rest of the reminder's startup
+    from openai import OpenAI
+    from label_canonicalizer import LabelCanonicalizer
+    from pre_labeler import PreLabeler
+
+SYSTEM_PROMPT = ("Analyze the book data provided and suggest 1 to 3 labels or themes that best characterize the book. "
+                 "Consider the title and the description to determine the overarching theme discussed in the book. "
+                 "If the theme can be described in a specific and a generic term, provide only the specific term. "
+                 "Valid responses may look like 'Java' or 'Algorithms, Data Structures'."
+                 )
+
+BATCH_SYSTEM_PROMPT = (SYSTEM_PROMPT + " "
+                       "You receive several books as a JSON list, each with an 'id'. "
+                       "Answer with a JSON object of the form {\"results\": [{\"id\": 0, \"labels\": \"Java\"}]} "
+                       "that contains one entry for every id."
+                       )
+
+STRUCTURED_SYSTEM_PROMPT = ("Suggest 1 to 3 labels or themes that best characterize the book, based on its title and "
+                            "description. If the theme can be described in a specific and a generic term, provide only "
+                            "the specific term. Answer like {\"labels\": [\"Algorithms\", \"Data Structures\"]}."
+                            )
+
+# Strict structured output; 1 to 3 labels are asked for in the prompt and enforced when the answer is read
+LABELS_SCHEMA = {
+    "name": "book_labels",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {"labels": {"type": "array", "items": {"type": "string"}}},
+        "required": ["labels"],
+        "additionalProperties": False,
+    },
+}
+
+# Three labels in JSON fit easily; a rambling answer is cut off instead of billed
+STRUCTURED_MAX_TOKENS = 40
+# Longer marketing texts cost prompt tokens, but rarely change the labels
+DESCRIPTION_LIMIT = 600
+MAX_LABELS = 3
+
+LABELS_KEY = re.compile(r'"labels"\s*:\s*')
 
 
 class Labeler:
 
-    def __init__(self, openai_client: OpenAI, simulate: bool = False):
+    def __init__(self, openai_client: OpenAI, simulate: bool = False, cache: LabelCache = None,
+                 pre_labeler: PreLabeler = None, breaker: CircuitBreaker = None, structured: bool = False,
+                 max_tokens: int = STRUCTURED_MAX_TOKENS, description_limit: int = DESCRIPTION_LIMIT,
+                 canonicalizer: LabelCanonicalizer = None):
+        """
+        With 'structured', get_labels() asks for a JSON label list, capped at 'max_tokens' and with the
+        description cut to 'description_limit' characters, and stops reading as soon as the list is complete.
+        """
         self.simulate = simulate
         self.openai_client = openai_client
+        self.cache = cache
+        # Asked before OpenAI; its confident guesses save the request
+        self.pre_labeler = pre_labeler
+        # Titles of the books whose labels were guessed, so the catalog doesn't train the pre-labeler with them
+        self.guessed_titles = set()
+        # Skips OpenAI after repeated failures; the email is then sent without labels
+        self.breaker = breaker
+        self.structured = structured
+        self.max_tokens = max_tokens
+        self.description_limit = description_limit
+        # Maps every label to its canonical spelling, e.g. 'Kubernets' to 'Kubernetes'
+        self.canonicalizer = canonicalizer
 
     def get_labels(self, title, author, description) -> str:
+        return self.canonicalize(self.request_labels(title, author, description))
+
+    def canonicalize(self, labels):
+        if self.canonicalizer is None or not labels:
+            return labels
+        return self.canonicalizer.canonicalize(labels)
+
+    def request_labels(self, title, author, description) -> str:
         print("Getting labels for the book:\n" +
               f"Title: {title}\n" +
               f"Author: {author}\n" +
@@ -19,28 +98,306 @@ class Labeler:
             print("Simulating the labeler...")
             return "Label 1, Label 2, Label 3"
 
-        chat_completion = self.openai_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": ("Analyze the book data provided and suggest 1 to 3 labels or themes that best characterize the book. "
-                                "Consider the title and the description to determine the overarching theme discussed in the book. "
-                                "If the theme can be described in a specific and a generic term, provide only the specific term. "
-                                "Valid responses may look like 'Java' or 'Algorithms, Data Structures'."
-                                )
-                },
-                {
-                    "role": "user",
-                    "content": "Title: {}\nAuthor: {}\nDescription: {}""".format(title, author, description)
-                }
-            ],
-            model=os.environ.get("OPENAI_MODEL"),
-        )
+        model = os.environ.get("OPENAI_MODEL")
+        system_prompt = STRUCTURED_SYSTEM_PROMPT if self.structured else SYSTEM_PROMPT
+
+        # Cache first, then the pre-labeler, like get_labels_batch()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(title, author, description, system_prompt, model)
+            cached_labels = self.cache.get(cache_key)
+            if cached_labels is not None:
+                print("Using cached labels: {}".format(cached_labels))
+                current_span().add("cache_hits")
+                return cached_labels
+
+        guessed_labels = self.pre_label(title, description)
+        if guessed_labels is not None:
+            return guessed_labels
 
-        print("Used model: {}".format(chat_completion.model))
+        if self.openai_client is None:
+            print("No OpenAI client configured, skipping the labels.")
+            return ""
 
-        response = chat_completion.choices[0].message.content
+        if self.breaker is not None and not self.breaker.allow():
+            print("OpenAI failed repeatedly, skipping the labels.")
+            return ""
+
+        timeout = timeout_kwargs()
+        started = time.perf_counter()
+        if self.structured:
+            response = self.stream_labels(title, author, description, model, timeout)
+        else:
+            with self.guarded():
+                chat_completion = self.openai_client.chat.completions.create(
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": SYSTEM_PROMPT
+                        },
+                        {
+                            "role": "user",
+                            "content": "Title: {}\nAuthor: {}\nDescription: {}""".format(title, author, description)
+                        }
+                    ],
+                    model=model,
+                    **timeout,
+                )
+            current_span().add("openai_requests")
+            record_usage(chat_completion)
+
+            print("Used model: {}".format(chat_completion.model))
+
+            response = chat_completion.choices[0].message.content
 
         print("Received response: {}".format(response))
 
+        if cache_key is not None and response:
+            self.cache.put(cache_key, response, time.perf_counter() - started)
+
         return response
+
+    def stream_labels(self, title, author, description, model, timeout) -> str:
+        """
+        Requests the labels as a JSON list and streams the answer only until the list is complete.
+        Returns the labels comma-separated, like the free-text answer.
+        """
+        with self.guarded():
+            stream = self.openai_client.chat.completions.create(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": STRUCTURED_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": "Title: {}\nAuthor: {}\nDescription: {}".format(
+                            title, author, compact_description(description, self.description_limit))
+                    }
+                ],
+                model=model,
+                max_tokens=self.max_tokens,
+                response_format={"type": "json_schema", "json_schema": LABELS_SCHEMA},
+                stream=True,
+                stream_options={"include_usage": True},
+                **timeout,
+            )
+            try:
+                labels, content = read_label_stream(stream)
+            finally:
+                # Stops the generation of whatever would still follow the label list
+                stream.close()
+        current_span().add("openai_requests")
+
+        if labels is None:
+            raise ValueError("No label list in the response: {!r}".format(content))
+        return ", ".join(labels)
+
+    @contextmanager
+    def guarded(self):
+        """
+        Tells the circuit breaker whether the OpenAI request within succeeded.
+        """
+        try:
+            yield
+        except Exception:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def pre_label(self, title, description):
+        if self.pre_labeler is None:
+            return None
+        guessed_labels = self.pre_labeler.get_labels(title, description)
+        if guessed_labels is not None:
+            print("Using pre-labelled labels: {}".format(guessed_labels))
+            current_span().add("pre_labeled")
+            self.guessed_titles.add(title)
+        return guessed_labels
+
+    def get_labels_batch(self, books, chunk_size: int = 20, max_workers: int = 4) -> list:
+        """
+        Labels many (title, author, description) tuples with one chat completion per chunk of 'chunk_size' books.
+        Returns the labels in the order of 'books'. Books that are missing from a chunk's answer
+        are labelled one by one; books that can't be labelled at all get an empty string.
+        """
+        books = [tuple(book) for book in books]
+        return [self.canonicalize(labels) for labels in self.request_labels_batch(books, chunk_size, max_workers)]
+
+    def request_labels_batch(self, books, chunk_size, max_workers) -> list:
+        if self.simulate:
+            return ["Label 1, Label 2, Label 3"] * len(books)
+
+        model = os.environ.get("OPENAI_MODEL")
+        labels = [None] * len(books)
+
+        if self.cache is not None:
+            for index, (title, author, description) in enumerate(books):
+                labels[index] = self.cache.get(self.cache.key(title, author, description, SYSTEM_PROMPT, model))
+
+        for index, (title, author, description) in enumerate(books):
+            if labels[index] is None:
+                labels[index] = self.pre_label(title, description)
+
+        pending = [index for index, label in enumerate(labels) if label is None]
+        chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+        print(f"Labelling {len(pending)} of {len(books)} books in {len(chunks)} requests.")
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for chunk, chunk_labels in zip(chunks, executor.map(lambda c: self._label_chunk(books, c, model), chunks)):
+                for index, label in zip(chunk, chunk_labels):
+                    labels[index] = label
+
+        return labels
+
+    def _label_chunk(self, books, chunk, model):
+        started = time.perf_counter()
+        try:
+            if self.breaker is not None and not self.breaker.allow():
+                raise RuntimeError("OpenAI failed repeatedly")
+            timeout = timeout_kwargs()
+            with self.guarded():
+                chat_completion = self.openai_client.chat.completions.create(
+                    messages=batch_messages(books, chunk),
+                    model=model,
+                    response_format={"type": "json_object"},
+                    **timeout,
+                )
+            current_span().add("openai_requests")
+            record_usage(chat_completion)
+            answers = parse_batch_response(chat_completion.choices[0].message.content)
+        except Exception as e:
+            print(f"Could not label a chunk of {len(chunk)} books due to exception: {e}")
+            answers = {}
+        latency = (time.perf_counter() - started) / len(chunk)
+
+        chunk_labels = []
+        for index in chunk:
+            title, author, description = books[index]
+            label = answers.get(index)
+            if label is None:
+                # Per-book fallback for entries that are missing or unreadable in the chunk's answer
+                try:
+                    label = self.request_labels(title, author, description)
+                except Exception as e:
+                    print(f"Could not get labels for '{title}' due to exception: {e}")
+                    label = ""
+            elif self.cache is not None:
+                self.cache.put(self.cache.key(title, author, description, SYSTEM_PROMPT, model), label, latency)
+            chunk_labels.append(label)
+        return chunk_labels
+
+    def write_batch_file(self, books, path, chunk_size: int = 20):
+        """
+        Writes the chunked requests for 'books' as a JSONL input file for the OpenAI Batch API.
+        """
+        books = [tuple(book) for book in books]
+        with open(path, "w", encoding="utf-8") as file:
+            for start in range(0, len(books), chunk_size):
+                chunk = list(range(start, min(start + chunk_size, len(books))))
+                request = {
+                    "custom_id": f"books-{chunk[0]}-{chunk[-1]}",
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": os.environ.get("OPENAI_MODEL"),
+                        "messages": batch_messages(books, chunk),
+                        "response_format": {"type": "json_object"},
+                    },
+                }
+                file.write(json.dumps(request) + "\n")
+
+
+def compact_description(description, limit: int = DESCRIPTION_LIMIT) -> str:
+    """
+    Collapses the whitespace of 'description' and cuts it at a word boundary after at most 'limit' characters.
+    """
+    description = " ".join((description or "").split())
+    if len(description) <= limit:
+        return description
+    return description[:limit].rsplit(" ", 1)[0] + " ..."
+
+
+def complete_labels(content):
+    """
+    Returns the labels of a streamed JSON answer once its label list is complete, otherwise None.
+    """
+    key = LABELS_KEY.search(content)
+    if key is None:
+        return None
+    try:
+        labels, _ = json.JSONDecoder().raw_decode(content, key.end())
+    except ValueError:
+        return None
+    if not isinstance(labels, list):
+        return None
+    labels = [label.strip() for label in labels if isinstance(label, str) and label.strip()]
+    return labels[:MAX_LABELS] or None
+
+
+def read_label_stream(stream):
+    """
+    Reads the chunks of a streamed chat completion until the label list is complete.
+    Returns the labels, or None if the answer has no valid list, and the content read so far.
+    """
+    content = ""
+    for chunk in stream:
+        # With 'include_usage', the last chunk has no choices, only the usage; it's only seen if nothing stopped early
+        record_usage(chunk)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        content += delta
+        if "]" in delta:
+            labels = complete_labels(content)
+            if labels is not None:
+                return labels, content
+    return complete_labels(content), content
+
+
+def batch_messages(books, indices):
+    return [
+        {
+            "role": "system",
+            "content": BATCH_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": json.dumps([{"id": index, "title": books[index][0], "author": books[index][1],
+                                    "description": books[index][2]} for index in indices])
+        }
+    ]
+
+
+def parse_batch_response(content) -> dict:
+    """
+    Returns a dict from book id to labels. Entries without an id or labels are skipped.
+    """
+    answers = {}
+    for result in json.loads(content).get("results", []):
+        if isinstance(result, dict) and isinstance(result.get("id"), int) and isinstance(result.get("labels"), str):
+            answers[result["id"]] = result["labels"]
+    return answers
+
+
+def read_batch_results(path, count: int) -> list:
+    """
+    Reads a JSONL output file of the OpenAI Batch API for a file written by write_batch_file().
+    Returns the labels for 'count' books; books without a usable answer get None.
+    """
+    labels = [None] * count
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                body = json.loads(line)["response"]["body"]
+                answers = parse_batch_response(body["choices"][0]["message"]["content"])
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                continue
+            for index, label in answers.items():
+                if 0 <= index < count:
+                    labels[index] = label
+    return labels
@@ -0,0 +1,220 @@
+# This class sends one email to many recipients over a small pool of reused, authenticated SMTP connections.
+import contextvars
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from queue import Empty, Queue
+
+# Errors that only concern a single message; the connection can still be used afterwards
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+SENT = "sent"
+
+
+def build_message(sender, recipient, subject, html_body, images=(), text_body=None) -> str:
+    """
+    'images' are (content id, bytes, subtype) attachments that the HTML refers to as 'cid:<content id>'.
+    A 'text_body' is added as plain text part; 'html_body' may be None for plain text emails.
+    """
+    msg = MIMEMultipart("related" if images else "alternative")
+    msg["From"] = sender
+    msg["To"] = recipient
+    msg["Subject"] = subject
+
+    if text_body is not None:
+        msg.attach(MIMEText(text_body, "plain"))
+    if html_body is not None:
+        msg.attach(MIMEText(html_body, "html"))
+    for content_id, data, subtype in images:
+        image = MIMEImage(data, _subtype=subtype)
+        image.add_header("Content-ID", f"<{content_id}>")
+        image.add_header("Content-Disposition", "inline")
+        msg.attach(image)
+    return msg.as_string()
+
+
+class EnvelopeQueue:
+    """
+    Hands out the envelopes of any iterable, e.g. a generator that reads them from disk, one at a time.
+    """
+
+    def __init__(self, envelopes):
+        self.envelopes = iter(envelopes)
+        self.lock = threading.Lock()
+
+    def get_nowait(self):
+        with self.lock:
+            try:
+                return next(self.envelopes)
+            except StopIteration:
+                raise Empty from None
+
+
+class Results(dict):
+    """
+    The results of a delivery, passed on to 'on_result' as soon as they are known.
+    """
+
+    def __init__(self, on_result=None):
+        super().__init__()
+        self.on_result = on_result
+
+    def __setitem__(self, recipient, result):
+        super().__setitem__(recipient, result)
+        if self.on_result is None:
+            return
+        try:
+            self.on_result(recipient, result)
+        except Exception as e:
+            # Raised into the sending loop, it would count as a broken connection and send the message again
+            print(f"Could not record the result for {recipient}: {e}")
+
+
+class MailDelivery:
+
+    def __init__(self, connection_factory, username: str, password: str, pool_size: int = 4,
+                 max_messages_per_connection: int = 100, max_messages_per_second: float = None):
+        """
+        'connection_factory' returns a new smtplib.SMTP (or SMTP_SSL) connection that can be used as a context manager.
+        """
+        self.connection_factory = connection_factory
+        self.username = username
+        self.password = password
+        self.pool_size = pool_size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.max_messages_per_second = max_messages_per_second
+        self.rate_lock = threading.Lock()
+        self.next_send_at = 0.0
+        # Connections that were opened and authenticated in advance by warm_up()
+        self.warm_connections = Queue()
+
+    def warm_up(self):
+        """
+        Opens and authenticates one connection ahead of time, e.g. while the email body is still being built.
+        """
+        self.warm_connections.put(self._connect())
+
+    def close(self):
+        """
+        Closes warmed-up connections that weren't needed.
+        """
+        while (warm := self._next(self.warm_connections)) is not None:
+            self._disconnect(warm[0])
+
+    def send(self, subject, html_body, recipients, images=()) -> dict:
+        """
+        Sends the email to every recipient. Returns a dict from recipient to 'sent' or the error.
+        """
+        envelopes = [(recipient, build_message(self.username, recipient, subject, html_body, images))
+                     for recipient in recipients]
+        return self.deliver(envelopes)
+
+    def deliver(self, envelopes, on_result=None) -> dict:
+        """
+        Sends prepared (recipient, message) envelopes. Returns a dict from recipient to 'sent' or the error.
+        The message may also be a function that builds it, so that it is only built when it is sent.
+        'envelopes' may be a generator; the envelopes are only taken from it when they are sent.
+        'on_result(recipient, result)' is called by the sending thread as soon as a message was sent or failed.
+        """
+        pending = EnvelopeQueue(envelopes)
+        results = Results(on_result)
+        workers = max(1, min(self.pool_size, len(envelopes))) if hasattr(envelopes, "__len__") else self.pool_size
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Each worker runs in a copy of the caller's context, so the active deadline and span reach it
+            errors = [future.result() for future in [executor.submit(contextvars.copy_context().run, self._work,
+                                                                     pending, results) for _ in range(workers)]]
+        # Envelopes are only left when no worker could connect; logging in once per recipient would lock the account
+        error = next((error for error in errors if error is not None), None)
+        while error is not None and (envelope := self._next(pending)) is not None:
+            results[envelope[0]] = f"failed: {error}"
+        return dict(results)
+
+    def _work(self, pending, results):
+        """
+        Sends envelopes until none are left. Returns the error if the worker couldn't connect, else None.
+        """
+        envelope = None
+        retried = False
+        while True:
+            if envelope is None:
+                envelope, retried = self._next(pending), False
+            if envelope is None:
+                return None
+            try:
+                connection, server = self._connection()
+            except Exception as e:
+                # Only this worker stops; the others keep sending the envelopes that are left
+                print(f"Could not connect to the SMTP server: {e}")
+                results[envelope[0]] = f"failed: {e}"
+                return e
+            try:
+                sent = 0
+                while envelope is not None:
+                    recipient, message = envelope
+                    if callable(message):
+                        message = message()
+                    self._throttle()
+                    try:
+                        server.sendmail(self.username, recipient, message)
+                        results[recipient] = SENT
+                    except MESSAGE_ERRORS as e:
+                        results[recipient] = f"failed: {e}"
+                    sent += 1
+                    retried = False
+                    # Open a new connection once the per-connection cap is reached
+                    envelope = self._next(pending) if sent < self.max_messages_per_connection else None
+            except Exception as e:
+                # The connection is gone, e.g. a warm or reused one that the server closed meanwhile.
+                # The current message is tried once more on a new connection before it counts as failed.
+                if retried:
+                    results[envelope[0]] = f"failed: {e}"
+                    envelope = None
+                else:
+                    print(f"The SMTP connection failed, retrying on a new one: {e}")
+                    retried = True
+            finally:
+                self._disconnect(connection)
+
+    def _connection(self):
+        """
+        Returns a warmed-up (connection, server), or else opens and authenticates a new one.
+        """
+        warm = self._next(self.warm_connections)
+        return warm if warm is not None else self._connect()
+
+    def _connect(self):
+        connection = self.connection_factory()
+        server = connection.__enter__()
+        try:
+            server.login(self.username, self.password)
+        except BaseException:
+            connection.__exit__(None, None, None)
+            raise
+        return connection, server
+
+    @staticmethod
+    def _disconnect(connection):
+        try:
+            connection.__exit__(None, None, None)
+        except Exception as e:
+            print(f"Could not close the SMTP connection: {e}")
+
+    def _next(self, pending):
+        try:
+            return pending.get_nowait()
+        except Empty:
+            return None
+
+    def _throttle(self):
+        if not self.max_messages_per_second:
+            return
+        with self.rate_lock:
+            now = time.monotonic()
+            wait = self.next_send_at - now
+            self.next_send_at = max(now, self.next_send_at) + 1 / self.max_messages_per_second
+        if wait > 0:
+            time.sleep(wait)
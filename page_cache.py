@@ -0,0 +1,98 @@
+# This class keeps gzip-compressed snapshots of fetched pages together with their HTTP validators,
+# so that the next fetch can be a conditional GET.
+import gzip
+import hashlib
+import json
+import os
+import time
+
+
+class PageCache:
+
+    def __init__(self, directory: str, max_age: float = 7 * 24 * 3600, max_bytes: int = 10 * 1024 * 1024):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def lookup(self, url):
+        """
+        Returns the stored snapshot of 'url' as a dict with 'body', 'etag' and 'last_modified',
+        or None if there is no snapshot or it is older than 'max_age'.
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            if time.time() - meta["stored_at"] > self.max_age:
+                self._remove(url)
+                return None
+            with gzip.open(body_path, "rt", encoding="utf-8") as file:
+                meta["body"] = file.read()
+            return meta
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """
+        Stores 'body' for 'url' if the server sent validators; pages without them can't be revalidated.
+        """
+        if not etag and not last_modified:
+            return
+        meta_path, body_path = self._paths(url)
+        with gzip.open(body_path, "wt", encoding="utf-8") as file:
+            file.write(body)
+        with open(meta_path, "w", encoding="utf-8") as file:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified, "stored_at": time.time()}, file)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes expired snapshots, then the oldest ones until the compressed size fits into 'max_bytes'.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.directory, name)
+            body_path = meta_path[:-len(".json")] + ".html.gz"
+            try:
+                with open(meta_path, "r", encoding="utf-8") as file:
+                    stored_at = json.load(file)["stored_at"]
+                size = os.path.getsize(body_path)
+            except (OSError, ValueError, KeyError):
+                stored_at, size = 0, 0
+            entries.append((stored_at, size, meta_path, body_path))
+
+        now = time.time()
+        total = sum(size for _, size, _, _ in entries)
+        for stored_at, size, meta_path, body_path in sorted(entries):
+            if now - stored_at <= self.max_age and total <= self.max_bytes:
+                break
+            for path in (meta_path, body_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _remove(self, url):
+        for path in self._paths(url):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".html.gz"
@@ -0,0 +1,309 @@
+# Shrinks the rendered email before it is sent: strips Packt's markup, scripts and hidden elements from the
+# snippets, minifies the HTML and keeps only the CSS rules that match something. Cover images can be fetched
+# concurrently, cached, downscaled and attached as CID images, so the mail client doesn't load them remotely.
+import contextvars
+import gzip
+import hashlib
+import html
+import io
+import json
+import mimetypes
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from tracing import current_span
+
+# Attributes that change how the email looks or works; everything else (itemprop, data-*, ids, ...) is dropped.
+# Inline styles are what most mail clients respect, so only elements they hide are dropped, not the styles.
+KEPT_ATTRIBUTES = {"href", "src", "alt", "title", "width", "height", "colspan", "rowspan", "rows", "cols", "style"}
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# Whitespace next to these tags doesn't render, so it can be dropped instead of collapsed
+BLOCK_ELEMENTS = {"html", "head", "body", "style", "div", "p", "h1", "h2", "h3", "h4", "h5", "h6", "table", "tr",
+                  "th", "td", "thead", "tbody", "ul", "ol", "li", "textarea", "button", "br", "hr"}
+# Their text is copied by the reader, e.g. the details line into the spreadsheet, and must stay as it is
+PREFORMATTED_ELEMENTS = {"textarea", "pre"}
+DROPPED_ELEMENTS = {"script", "noscript", "template"}
+
+CLASS_ATTRIBUTE = re.compile(r'\bclass\s*=\s*(["\'])(.*?)\1', re.DOTALL)
+TAG_NAME = re.compile(r"<([a-zA-Z][a-zA-Z0-9]*)")
+HIDDEN_STYLE = re.compile(r"display\s*:\s*none", re.IGNORECASE)
+CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+CSS_COLON = re.compile(r"\s*:\s*")
+CSS_CLASS = re.compile(r"\.([\w-]+)")
+CSS_TAG = re.compile(r"(?:^|[\s>+~])([a-zA-Z][a-zA-Z0-9]*)")
+STYLE_ELEMENT = re.compile(r"<style\b[^>]*>(.*?)</style\s*>", re.DOTALL | re.IGNORECASE)
+REMOTE_IMAGE = re.compile(r'(<img\b[^>]*?\bsrc=")(https?://[^"]+)(")')
+# Many mail clients block SVG attachments, so SVG images keep their remote URL
+LINKED_SUBTYPES = {"svg+xml"}
+
+
+def minify_css(stylesheet, classes, tags) -> str:
+    """
+    Returns the rules of 'stylesheet' whose selectors only use the given classes and tags, without whitespace.
+    """
+    rules = []
+    for selectors, declarations in CSS_RULE.findall(CSS_COMMENT.sub("", stylesheet)):
+        used = [selector.strip() for selector in selectors.split(",")
+                if set(CSS_CLASS.findall(selector)) <= classes
+                and {tag.lower() for tag in CSS_TAG.findall(selector)} <= tags]
+        declarations = ";".join(CSS_COLON.sub(":", d.strip()) for d in declarations.split(";") if d.strip())
+        if used and declarations:
+            rules.append(f"{','.join(used)}{{{declarations}}}")
+    return "".join(rules)
+
+
+class PayloadMinifier(HTMLParser):
+    """
+    Writes the parsed HTML back without comments, scripts, hidden elements, unused attributes and classes,
+    and with whitespace collapsed. The stylesheet is reduced to the rules that match the document.
+    """
+
+    def __init__(self, classes, tags, kept_classes):
+        """
+        'classes' and 'tags' occur in the document; only the 'kept_classes' are used by its stylesheet.
+        """
+        super().__init__(convert_charrefs=False)
+        self.classes = classes
+        self.tags = tags
+        self.kept_classes = kept_classes
+        self.out = []
+        self.skip_depth = 0
+        self.preformatted_depth = 0
+        self.in_style = False
+        self.stylesheet = []
+        self.pending_space = False
+        self.previous_tag = "html"
+
+    def emit_tag(self, tag, markup):
+        # A space between two inline elements is kept, e.g. between '<span>5</span> <span>(2 reviews)</span>'
+        if self.pending_space and tag not in BLOCK_ELEMENTS and self.previous_tag not in BLOCK_ELEMENTS:
+            self.out.append(" ")
+        self.pending_space = False
+        self.previous_tag = tag
+        self.out.append(markup)
+
+    def attributes(self, attrs):
+        kept = []
+        for name, value in attrs:
+            if name == "class":
+                value = " ".join(c for c in (value or "").split() if c in self.kept_classes)
+                if not value:
+                    continue
+            elif name not in KEPT_ATTRIBUTES:
+                continue
+            kept.append(f' {name}="{html.escape(value, quote=True)}"' if value is not None else f" {name}")
+        return "".join(kept)
+
+    def start(self, tag, attrs, self_closing):
+        if self.skip_depth:
+            if tag not in VOID_ELEMENTS and not self_closing:
+                self.skip_depth += 1
+            return
+        hidden = any(name == "style" and value and HIDDEN_STYLE.search(value) for name, value in attrs)
+        if tag in DROPPED_ELEMENTS or hidden:
+            if tag not in VOID_ELEMENTS and not self_closing:
+                self.skip_depth = 1
+            return
+        if tag == "style":
+            self.in_style = True
+            return
+        if tag in PREFORMATTED_ELEMENTS:
+            self.preformatted_depth += 1
+        self.emit_tag(tag, f"<{tag}{self.attributes(attrs)}{'/' if self_closing else ''}>")
+
+    def handle_starttag(self, tag, attrs):
+        self.start(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        self.start(tag, attrs, tag not in VOID_ELEMENTS)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+        if tag == "style":
+            self.in_style = False
+            css = minify_css("".join(self.stylesheet), self.classes, self.tags)
+            if css:
+                self.emit_tag(tag, f"<style>{css}</style>")
+            return
+        if tag in PREFORMATTED_ELEMENTS:
+            self.preformatted_depth -= 1
+        self.emit_tag(tag, f"</{tag}>")
+
+    def text(self, data):
+        if self.skip_depth:
+            return
+        if self.in_style:
+            self.stylesheet.append(data)
+            return
+        if self.preformatted_depth:
+            self.out.append(data)
+            return
+        collapsed = re.sub(r"\s+", " ", data)
+        if collapsed.startswith(" "):
+            self.pending_space = True
+        collapsed = collapsed.strip()
+        if not collapsed:
+            return
+        if self.pending_space and self.previous_tag not in BLOCK_ELEMENTS:
+            self.out.append(" ")
+        self.out.append(collapsed)
+        self.pending_space = data[-1].isspace()
+        self.previous_tag = "#text"
+
+    def handle_data(self, data):
+        self.text(data)
+
+    def handle_entityref(self, name):
+        self.text(f"&{name};")
+
+    def handle_charref(self, name):
+        self.text(f"&#{name};")
+
+    def handle_decl(self, decl):
+        self.out.append(f"<!{decl}>")
+
+    def handle_comment(self, data):
+        pass
+
+
+def minify_html(document) -> str:
+    classes = {c for _, value in CLASS_ATTRIBUTE.findall(document) for c in value.split()}
+    tags = {tag.lower() for tag in TAG_NAME.findall(document)}
+    stylesheet = CSS_COMMENT.sub("", "".join(STYLE_ELEMENT.findall(document)))
+    stylesheet_classes = {c for selectors, _ in CSS_RULE.findall(stylesheet) for c in CSS_CLASS.findall(selectors)}
+    minifier = PayloadMinifier(classes, tags, classes & stylesheet_classes)
+    minifier.feed(document)
+    minifier.close()
+    return "".join(minifier.out)
+
+
+class ImageCache:
+    """
+    Keeps downloaded and downscaled images on disk, keyed by URL and width, as gzip body plus JSON metadata.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, url, max_width):
+        key = hashlib.sha256(f"{url}\x1f{max_width}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".gz"), os.path.join(self.directory, key + ".json")
+
+    def get(self, url, max_width):
+        body_path, meta_path = self.paths(url, max_width)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                subtype = json.load(file)["subtype"]
+            with gzip.open(body_path, "rb") as file:
+                return file.read(), subtype
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, url, max_width, data, subtype):
+        body_path, meta_path = self.paths(url, max_width)
+        with gzip.open(body_path, "wb") as file:
+            file.write(data)
+        with open(meta_path, "w", encoding="utf-8") as file:
+            json.dump({"url": url, "subtype": subtype}, file)
+
+
+def downscale(data, max_width):
+    """
+    Shrinks raster images wider than 'max_width' with Pillow. Without Pillow, or for e.g. SVGs, 'data' is kept.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width <= max_width:
+            return data
+        image_format = image.format
+        image.thumbnail((max_width, image.height))
+        out = io.BytesIO()
+        image.save(out, format=image_format, optimize=True)
+    except Exception as e:
+        print(f"Could not downscale an image: {e}")
+        return data
+    return out.getvalue() if out.tell() < len(data) else data
+
+
+def image_subtype(url, content_type):
+    content_type = (content_type or "").split(";")[0].strip()
+    if not content_type.startswith("image/"):
+        content_type = mimetypes.guess_type(url)[0] or "image/png"
+    return content_type.removeprefix("image/")
+
+
+def embed_images(document, fetch, cache: ImageCache = None, max_width: int = 300, max_workers: int = 4):
+    """
+    Downloads the remote images of 'document' concurrently with 'fetch(url) -> (bytes, content type)' and
+    points their 'src' to CID attachments. Every URL is attached once, however often it's used.
+    Returns the document and a list of (content id, bytes, subtype) attachments. SVG images and images
+    that can't be downloaded keep their remote URL.
+    """
+    urls = list(dict.fromkeys(match.group(2) for match in REMOTE_IMAGE.finditer(html.unescape(document))))
+
+    def load(url):
+        if image_subtype(url, None) in LINKED_SUBTYPES:
+            return None
+        cached = cache.get(url, max_width) if cache is not None else None
+        if cached is not None:
+            return cached
+        data, content_type = fetch(url)
+        subtype = image_subtype(url, content_type)
+        if subtype in LINKED_SUBTYPES:
+            return None
+        data = downscale(data, max_width)
+        if cache is not None:
+            cache.put(url, max_width, data, subtype)
+        return data, subtype
+
+    def try_load(url):
+        try:
+            return load(url)
+        except Exception as e:
+            print(f"Could not embed the image {url}: {e}")
+            return None
+
+    content_ids = {}
+    attachments = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls) or 1))) as executor:
+        # Each image is fetched in a copy of the caller's context, so the active deadline and span reach it
+        futures = [executor.submit(contextvars.copy_context().run, try_load, url) for url in urls]
+        for index, (url, image) in enumerate(zip(urls, (future.result() for future in futures))):
+            if image is not None:
+                content_ids[url] = f"image{index}@packt-reminder"
+                attachments.append((content_ids[url], *image))
+
+    def replace(match):
+        content_id = content_ids.get(html.unescape(match.group(2)))
+        return f"{match.group(1)}cid:{content_id}{match.group(3)}" if content_id else match.group(0)
+
+    return REMOTE_IMAGE.sub(replace, document), attachments
+
+
+def optimize_email(document, fetch=None, cache: ImageCache = None, max_width: int = 300):
+    """
+    Minifies the rendered email and, with a 'fetch' function, embeds its images. Returns the HTML and the
+    image attachments, and prints the size of the payload before and after.
+    """
+    before = len(document.encode("utf-8"))
+    optimized = minify_html(document)
+    attachments = []
+    if fetch is not None:
+        optimized, attachments = embed_images(optimized, fetch, cache, max_width)
+    after = len(optimized.encode("utf-8"))
+    image_bytes = sum(len(data) for _, data, _ in attachments)
+    current_span().set(bytes_before=before, bytes_after=after, images=len(attachments), image_bytes=image_bytes)
+    print(f"Email payload: {before} bytes before, {after} bytes after optimizing"
+          + (f", plus {image_bytes} bytes in {len(attachments)} embedded images." if attachments else "."))
+    return optimized, attachments
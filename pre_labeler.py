@@ -0,0 +1,171 @@
+# This class guesses the labels of a book from the labels of similar books in the catalog, fully offline.
+# It compares TF-IDF vectors of title and description with its nearest neighbours and is only trusted
+# when most of them agree and are similar enough, so the Labeler can skip the OpenAI request for obvious books.
+import argparse
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN = re.compile(r"[a-z0-9][a-z0-9+#]*")
+STOP_WORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "into", "is", "it", "its",
+              "of", "on", "or", "that", "the", "this", "to", "with", "you", "your", "free", "ebook", "edition",
+              "learn", "learning", "guide", "book", "master", "mastering", "beginning", "hands"}
+# Words of the title say more about the topic than the marketing text of the description
+TITLE_WEIGHT = 2
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall((text or "").casefold()) if token not in STOP_WORDS]
+
+
+def normalize_labels(labels):
+    return frozenset(label.strip().casefold() for label in (labels or "").split(",") if label.strip())
+
+
+class PreLabeler:
+
+    def __init__(self, min_confidence: float = 0.8, min_similarity: float = 0.3, neighbours: int = 5,
+                 min_votes: float = 2):
+        """
+        A guess is confident when its neighbours with the same labels hold 'min_confidence' of the similarity
+        of all 'neighbours', and the closest of them is at least 'min_similarity' similar. Their similarity
+        must also add up to 'min_votes' times 'min_similarity', so a single, barely similar book isn't trusted.
+        """
+        self.min_confidence = min_confidence
+        self.min_similarity = min_similarity
+        self.neighbours = neighbours
+        self.min_votes = min_votes
+        self.idf = {}
+        self.labels = []
+        self.index = defaultdict(list)
+        self.predictions = 0
+        self.skipped = 0
+
+    def terms(self, title, description):
+        counts = Counter(tokenize(description))
+        for token in tokenize(title):
+            counts[token] += TITLE_WEIGHT
+        return counts
+
+    def vector(self, counts):
+        weights = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+    def fit(self, examples):
+        """
+        Learns from (title, description, labels) examples, e.g. the history of the catalog. Returns self.
+        """
+        examples = [(title, description, labels) for title, description, labels in examples if normalize_labels(labels)]
+        documents = [self.terms(title, description) for title, description, _ in examples]
+        document_frequency = Counter(term for counts in documents for term in counts)
+        self.idf = {term: math.log((1 + len(documents)) / (1 + frequency)) + 1
+                    for term, frequency in document_frequency.items()}
+        self.labels = [labels.strip() for _, _, labels in examples]
+        # Inverted index from term to (document, weight), so a guess only looks at documents sharing a term
+        self.index = defaultdict(list)
+        for document_id, counts in enumerate(documents):
+            for term, weight in self.vector(counts).items():
+                self.index[term].append((document_id, weight))
+        return self
+
+    def predict(self, title, description):
+        """
+        Returns the labels of the most similar books and the confidence of this guess between 0 and 1;
+        it is 0 if the books with these labels aren't similar enough in sum.
+        """
+        scores = defaultdict(float)
+        for term, weight in self.vector(self.terms(title, description)).items():
+            for document_id, document_weight in self.index.get(term, ()):
+                scores[document_id] += weight * document_weight
+
+        nearest = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self.neighbours]
+        if not nearest or nearest[0][1] < self.min_similarity:
+            return "", 0.0
+
+        votes = defaultdict(float)
+        spelling = {}
+        for document_id, similarity in nearest:
+            key = normalize_labels(self.labels[document_id])
+            votes[key] += similarity
+            spelling.setdefault(key, self.labels[document_id])
+        best = max(votes, key=votes.get)
+        if votes[best] < self.min_votes * self.min_similarity:
+            return spelling[best], 0.0
+        return spelling[best], votes[best] / sum(votes.values())
+
+    def get_labels(self, title, description):
+        """
+        Returns the guessed labels if the guess is confident enough, otherwise None.
+        """
+        labels, confidence = self.predict(title, description)
+        self.predictions += 1
+        if confidence < self.min_confidence:
+            return None
+        self.skipped += 1
+        return labels
+
+    def stats(self):
+        return {
+            "predictions": self.predictions,
+            "skipped": self.skipped,
+            "skip_rate": self.skipped / self.predictions if self.predictions else 0.0,
+        }
+
+    @classmethod
+    def from_catalog(cls, catalog, **kwargs):
+        # Only the labels of the LLM are learned; learning its own guesses would repeat its mistakes
+        return cls(**kwargs).fit((book.title, book.description, labels)
+                                 for book, labels, _ in catalog.find(unique_books=True, guessed=False))
+
+
+def evaluate(examples, holdout: float = 0.2, **kwargs):
+    """
+    Trains on the older examples and guesses the newest 'holdout' share of them. Returns the skip rate
+    and how often the confident guesses agree with the labels of the LLM, exactly or in at least one label.
+    """
+    examples = list(examples)
+    split = len(examples) - max(1, round(len(examples) * holdout))
+    pre_labeler = PreLabeler(**kwargs).fit(examples[:split])
+
+    exact = partial = 0
+    for title, description, labels in examples[split:]:
+        guess = pre_labeler.get_labels(title, description)
+        if guess is None:
+            continue
+        exact += normalize_labels(guess) == normalize_labels(labels)
+        partial += bool(normalize_labels(guess) & normalize_labels(labels))
+
+    skipped = pre_labeler.skipped
+    return {
+        "held_out": len(examples) - split,
+        "skip_rate": pre_labeler.stats()["skip_rate"],
+        "agreement": exact / skipped if skipped else 0.0,
+        "partial_agreement": partial / skipped if skipped else 0.0,
+    }
+
+
+def main(argv=None):
+    from catalog import Catalog
+
+    parser = argparse.ArgumentParser(description="Evaluates the pre-labeler against the labels in the catalog.")
+    parser.add_argument("path", help="Path of the catalog database.")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of the newest books to guess.")
+    parser.add_argument("--min-confidence", type=float, default=0.8)
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.path)
+    try:
+        examples = [(book.title, book.description, labels)
+                    for book, labels, _ in catalog.find(unique_books=True, guessed=False)]
+    finally:
+        catalog.close()
+
+    result = evaluate(examples, args.holdout, min_confidence=args.min_confidence)
+    print(f"Guessed {result['held_out']} held-out books: skipped the LLM for {result['skip_rate']:.1%}, "
+          f"agreement {result['agreement']:.1%} (at least one label: {result['partial_agreement']:.1%}).")
+    return result
+
+
+if __name__ == "__main__":
+    main()
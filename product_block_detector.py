@@ -0,0 +1,31 @@
+# This class watches an HTML stream and tells when the Packt product block has been received completely.
+from html.parser import HTMLParser
+
+
+class ProductBlockDetector(HTMLParser):
+
+    def __init__(self, parent_class: str = "product__info", block_class: str = "main-product"):
+        super().__init__(convert_charrefs=False)
+        self.parent_class = parent_class
+        self.block_class = block_class
+        self.complete = False
+        # Open divs as a stack of flags: (is parent, is block)
+        self.open_divs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "div" or self.complete:
+            return
+        classes = (dict(attrs).get("class") or "").split()
+        inside_parent = any(is_parent for is_parent, _ in self.open_divs)
+        is_block = inside_parent and self.block_class in classes and not self.inside_block()
+        self.open_divs.append((self.parent_class in classes, is_block))
+
+    def handle_endtag(self, tag):
+        if tag != "div" or self.complete or not self.open_divs:
+            return
+        _, is_block = self.open_divs.pop()
+        if is_block:
+            self.complete = True
+
+    def inside_block(self):
+        return any(is_block for _, is_block in self.open_divs)
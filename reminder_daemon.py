@@ -0,0 +1,81 @@
+# This class keeps the reminder running and only sends an email when the giveaway has changed.
+# It polls on a schedule with jitter and remembers the fingerprint of the last books it sent in a state file.
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+
+
+def fingerprint(books) -> str:
+    """
+    Hash of the extracted product fragments; unrelated changes of the page, e.g. the countdown, don't change it.
+    """
+    digest = hashlib.sha256()
+    for book in books:
+        digest.update((book.snippet or book.title).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+class ReminderDaemon:
+
+    def __init__(self, poll, on_change, state_path: str, interval: float = 600, jitter: float = 60):
+        """
+        'poll' is an async function returning the current books, 'on_change' an async function that
+        labels and sends them. Both are called with the warm clients of the caller.
+        """
+        self.poll = poll
+        self.on_change = on_change
+        self.state_path = state_path
+        self.interval = interval
+        self.jitter = jitter
+        self.polls = 0
+        self.changes = 0
+
+    def load_fingerprint(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                return json.load(file).get("fingerprint")
+        except (OSError, ValueError):
+            return None
+
+    def save_fingerprint(self, value):
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"fingerprint": value, "changed_at": time.time()}, file)
+        os.replace(temporary_path, self.state_path)
+
+    async def check_once(self) -> bool:
+        """
+        Polls once and runs 'on_change' if the books differ from the last ones sent. Returns True if they did.
+        """
+        self.polls += 1
+        books = await self.poll()
+        current = fingerprint(books)
+        if current == self.load_fingerprint():
+            print("Giveaway unchanged.")
+            return False
+
+        print("Giveaway changed, sending the reminder.")
+        await self.on_change(books)
+        # Only remembered after a successful run, so a failed send is retried on the next poll
+        self.save_fingerprint(current)
+        self.changes += 1
+        return True
+
+    def next_delay(self) -> float:
+        return max(0.0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+    async def run(self, max_polls: int = None):
+        while max_polls is None or self.polls < max_polls:
+            try:
+                await self.check_once()
+            except Exception as e:
+                print(f"Poll failed due to exception: {e}")
+            if max_polls is not None and self.polls >= max_polls:
+                break
+            delay = self.next_delay()
+            print(f"Next poll in {delay:.0f} seconds.")
+            await asyncio.sleep(delay)
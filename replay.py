@@ -0,0 +1,191 @@
+# Replays the extraction of the email body builder over a directory of archived page snapshots, e.g. the pages
+# kept by the run checkpoints, to check that a change of Packt's markup or of the parser doesn't lose fields.
+# The snapshots are parsed by a pool of processes without labelling, and every result is streamed to a JSONL
+# file. Snapshots whose content, parser and extraction code are unchanged since the last replay keep their
+# previous result.
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from book_record import NOT_AVAILABLE
+
+SNAPSHOT_SUFFIXES = (".html", ".htm", ".html.gz")
+FIELDS = ("title", "author", "publication_year", "description", "snippet")
+# The modules whose code decides what is extracted from a page
+EXTRACTOR_MODULES = ("email_body_builder", "book_record")
+
+# The builder of this worker process, created once by init_worker
+builder = None
+
+
+def snapshot_paths(directory):
+    """
+    Returns the paths of all snapshots below 'directory', sorted.
+    """
+    paths = []
+    for parent, _, names in os.walk(directory):
+        paths.extend(os.path.join(parent, name) for name in names if name.endswith(SNAPSHOT_SUFFIXES))
+    return sorted(paths)
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extractor_version():
+    """
+    Returns a hash over the sources of the extraction modules, so a change of the code invalidates earlier results.
+    """
+    digest = hashlib.sha256()
+    for name in EXTRACTOR_MODULES:
+        with open(importlib.util.find_spec(name).origin, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def read_snapshot(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    if path.endswith(".gz"):
+        data = gzip.decompress(data)
+    return data.decode("utf-8", errors="replace")
+
+
+def init_worker(parser):
+    from email_body_builder import EmailBodyBuilder
+
+    global builder
+    # Without an OpenAI client nothing is labelled; only extract_book is used anyway
+    builder = EmailBodyBuilder(None, parser=parser)
+
+
+def replay_snapshot(job):
+    """
+    Extracts the book of one snapshot. 'job' is (path, content hash, extractor version). Returns the record
+    of the result.
+    """
+    path, sha256, extractor = job
+    record = {"path": path, "sha256": sha256, "parser": builder.parser, "extractor": extractor}
+    try:
+        content = read_snapshot(path)
+        started = time.perf_counter()
+        book = builder.extract_book(content)
+        record["parse_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["missing"] = list(FIELDS)
+        return record
+
+    for field in FIELDS[:-1]:
+        record[field] = getattr(book, field)
+    record["snippet_bytes"] = len(book.snippet.encode("utf-8"))
+    record["missing"] = [field for field in FIELDS if getattr(book, field) in (NOT_AVAILABLE, "")]
+    return record
+
+
+def load_results(path):
+    """
+    Returns the records of an earlier replay by snapshot path; an unreadable file counts as no replay.
+    """
+    results = {}
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    results[record["path"]] = record
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except OSError:
+        pass
+    return results
+
+
+def replay(directory, output, parser="scoped", workers=None, force=False):
+    """
+    Replays all snapshots below 'directory' and writes one JSON line per snapshot to 'output'.
+    Unless 'force' is set, snapshots with the same content hash, parser and extractor version as in the
+    existing 'output' are skipped. Returns a summary with the number of replayed and skipped snapshots
+    and missing fields.
+    """
+    started = time.perf_counter()
+    previous = {} if force else load_results(output)
+    extractor = extractor_version()
+    reused, jobs = [], []
+    for path in snapshot_paths(directory):
+        sha256 = content_hash(path)
+        record = previous.get(path)
+        if (record is not None and record.get("sha256") == sha256 and record.get("parser") == parser
+                and record.get("extractor") == extractor):
+            reused.append(record)
+        else:
+            jobs.append((path, sha256, extractor))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    missing = Counter()
+    errors = 0
+    temporary_path = output + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        def write(record):
+            nonlocal errors
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            missing.update(record.get("missing", ()))
+            errors += "error" in record
+
+        for record in reused:
+            write(record)
+        if workers == 1:
+            # A pool isn't worth starting for one worker
+            init_worker(parser)
+            for job in jobs:
+                write(replay_snapshot(job))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(parser,)) as executor:
+                # Big chunks keep the overhead per snapshot low, several per worker keep them all busy
+                chunksize = max(1, len(jobs) // (workers * 4))
+                for record in executor.map(replay_snapshot, jobs, chunksize=chunksize):
+                    write(record)
+    os.replace(temporary_path, output)
+
+    return {
+        "snapshots": len(reused) + len(jobs),
+        "replayed": len(jobs),
+        "skipped": len(reused),
+        "errors": errors,
+        "missing": dict(missing),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replays the extraction over a directory of archived page snapshots.")
+    parser.add_argument("directory", help="Directory with .html, .htm or .html.gz snapshots, searched recursively.")
+    parser.add_argument("--output", default="replay_results.jsonl", help="JSONL file with one result per snapshot.")
+    parser.add_argument("--parser", choices=("scoped", "full"), default="scoped")
+    parser.add_argument("--workers", type=int, help="Worker processes, by default one per CPU.")
+    parser.add_argument("--force", action="store_true", help="Replay unchanged snapshots as well.")
+    parser.add_argument("--strict", action="store_true", help="Exit with 1 if a field is missing in any snapshot.")
+    args = parser.parse_args(argv)
+
+    summary = replay(args.directory, args.output, args.parser, args.workers, args.force)
+    print(f"Replayed {summary['replayed']} of {summary['snapshots']} snapshots in {summary['seconds']} seconds "
+          f"({summary['skipped']} unchanged, {summary['errors']} errors).")
+    for field, count in sorted(summary["missing"].items()):
+        print(f"Missing {field}: {count} snapshots")
+    if args.strict and (summary["missing"] or summary["errors"]):
+        sys.exit(1)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Checkpoints the output of every stage of a day's run (raw page, extracted books, labels) in a run directory,
+# and keeps the finished messages in a durable outbox. A failed run is resumed from its last checkpoint, so the
+# page isn't fetched and the books aren't labelled again, and a message that was sent is never sent twice.
+import gzip
+import hashlib
+import json
+import os
+from datetime import date as Date
+from book_record import BookRecord
+from mail_delivery import SENT
+
+
+def write_atomically(path, data: bytes):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+class Outbox:
+
+    def __init__(self, directory: str):
+        self.pending_directory = os.path.join(directory, "pending")
+        self.sent_directory = os.path.join(directory, "sent")
+        self.sealed_path = os.path.join(directory, "sealed")
+        os.makedirs(self.pending_directory, exist_ok=True)
+        os.makedirs(self.sent_directory, exist_ok=True)
+
+    @staticmethod
+    def key(recipient) -> str:
+        return hashlib.sha256(recipient.strip().casefold().encode("utf-8")).hexdigest()[:32] + ".json"
+
+    def put(self, recipient, message) -> bool:
+        """
+        Spools the message for 'recipient'. Returns False if the recipient already has one, pending or sent.
+        """
+        key = self.key(recipient)
+        if any(os.path.exists(os.path.join(directory, key)) for directory in (self.pending_directory, self.sent_directory)):
+            return False
+        message = message() if callable(message) else message
+        write_atomically(os.path.join(self.pending_directory, key),
+                         json.dumps({"recipient": recipient, "message": message}).encode("utf-8"))
+        return True
+
+    def put_many(self, envelopes) -> int:
+        return sum(self.put(recipient, message) for recipient, message in envelopes)
+
+    def seal(self):
+        """
+        Marks the outbox as complete; from now on, a retry only sends what is in it.
+        """
+        write_atomically(self.sealed_path, b"")
+
+    @property
+    def sealed(self) -> bool:
+        return os.path.exists(self.sealed_path)
+
+    @property
+    def complete(self) -> bool:
+        return self.sealed and not os.listdir(self.pending_directory)
+
+    def pending(self):
+        """
+        Yields the (key, recipient, message) of all messages that weren't sent yet, reading one file at a time.
+        """
+        for key in sorted(os.listdir(self.pending_directory)):
+            if not key.endswith(".json"):
+                continue
+            with open(os.path.join(self.pending_directory, key), "r", encoding="utf-8") as file:
+                envelope = json.load(file)
+            yield key, envelope["recipient"], envelope["message"]
+
+    def mark_sent(self, key):
+        os.replace(os.path.join(self.pending_directory, key), os.path.join(self.sent_directory, key))
+
+    def drain(self, deliver) -> dict:
+        """
+        Sends the pending messages with 'deliver(envelopes, on_result) -> results', e.g. MailDelivery.deliver,
+        and moves every message out of the spool as soon as 'on_result' reports it as sent, so a drain that is
+        interrupted doesn't send it again. Failed messages stay for the next retry. Returns the results.
+        The envelopes are a generator, so a message is only read from the spool when it is sent.
+        """
+        def on_result(recipient, result):
+            if result == SENT:
+                self.mark_sent(self.key(recipient))
+
+        return deliver(((recipient, message) for _, recipient, message in self.pending()), on_result)
+
+
+class RunCheckpoint:
+
+    def __init__(self, root: str, day: Date = None, name: str = None):
+        """
+        Keeps the run in the directory 'name' below 'root', by default the ISO date of 'day' (today).
+        """
+        self.directory = os.path.join(root, name or (day or Date.today()).isoformat())
+        os.makedirs(self.directory, exist_ok=True)
+        self.outbox = Outbox(os.path.join(self.directory, "outbox"))
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def save_page(self, content: str):
+        write_atomically(self.path("page.html.gz"), gzip.compress(content.encode("utf-8")))
+
+    def load_page(self):
+        try:
+            with gzip.open(self.path("page.html.gz"), "rb") as file:
+                return file.read().decode("utf-8")
+        except OSError:
+            return None
+
+    def save_json(self, name, value):
+        write_atomically(self.path(name), json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def load_json(self, name):
+        try:
+            with open(self.path(name), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def save_books(self, books):
+        self.save_json("books.json", [book.to_dict() for book in books])
+
+    def load_books(self):
+        books = self.load_json("books.json")
+        return None if books is None else [BookRecord.from_dict(book) for book in books]
+
+    def save_entries(self, entries):
+        self.save_json("entries.json", [[book.to_dict(), labels, date] for book, labels, date in entries])
+
+    def load_entries(self):
+        entries = self.load_json("entries.json")
+        return None if entries is None else [(BookRecord.from_dict(book), labels, date) for book, labels, date in entries]
+
+
+def pending_outboxes(root: str):
+    """
+    Returns the sealed outboxes of all days below 'root' that still have unsent messages.
+    """
+    if not os.path.isdir(root):
+        return []
+    outboxes = []
+    for day in sorted(os.listdir(root)):
+        directory = os.path.join(root, day, "outbox")
+        if os.path.isdir(directory):
+            outbox = Outbox(directory)
+            if outbox.sealed and not outbox.complete:
+                outboxes.append(outbox)
+    return outboxes
@@ -1,76 +1,793 @@
+# Heavy dependencies (openai, requests, tenacity, bs4, smtplib, httpx) are imported by the stage that needs them,
+# so that a run only pays for what it uses. benchmark.py checks the startup time against a budget.
+import argparse
+import asyncio
+import codecs
+import functools
 import os
-import smtplib
-import ssl
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import requests
-from bs4 import BeautifulSoup
+from datetime import date as Date, timedelta
 from dotenv import load_dotenv
+import deadline
 from email_body_builder import EmailBodyBuilder
-from time import sleep
-from openai import OpenAI
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type,
-)
-
-
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10),
-    retry=retry_if_exception_type(requests.exceptions.RequestException),
-)
-def fetch_website_content(url):
+from email_renderer import HtmlEmail, render_html, render_text, today
+from giveaway_sources import PacktSource, create_session, create_sources, fetch_sources
+from label_cache import LabelCache
+from page_cache import PageCache
+from product_block_detector import ProductBlockDetector
+from reminder_daemon import ReminderDaemon, fingerprint
+import tracing
+
+PACKT_URL = "https://www.packtpub.com/free-learning"
+
+# Share of the run's deadline that each stage may use at most; sending gets whatever is left
+FETCH_SHARE = 0.4
+LABEL_SHARE = 0.3
+RETRY_MIN_WAIT = 4
+# An attempt that starts with less time left than this would hardly get an answer before the deadline
+RETRY_MIN_ATTEMPT_TIME = 1
+
+
+def fetch_website_content(url, stream=False, cache=None, http=None, rate_limiter=None):
+    """
+    Fetches the page with retries. A 'rate_limiter' is waited for before every attempt.
+    """
+    return retrying_fetch()(url, stream=stream, cache=cache, http=http, rate_limiter=rate_limiter)
+
+
+@functools.cache
+def retrying_fetch():
+    """
+    Builds the retrying fetch on first use, so that requests and tenacity aren't imported at startup.
+    """
+    import httpx
+    import requests
+    from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+
+    return retry(
+        stop=stop_after_attempt(3) | out_of_time,
+        wait=wait_exponential(multiplier=1, min=RETRY_MIN_WAIT, max=10),
+        retry=retry_if_exception_type((requests.exceptions.RequestException, httpx.HTTPError)),
+        before_sleep=lambda retry_state: tracing.current_span().add("retries"),
+    )(fetch_once)
+
+
+def out_of_time(retry_state):
+    # After the upcoming wait, another attempt would only start at or after the active deadline. It would
+    # then raise DeadlineExceeded instead of the error of the last attempt.
+    active = deadline.current.get()
+    wait = max(retry_state.upcoming_sleep, RETRY_MIN_WAIT)
+    return active is not None and active.remaining() < wait + RETRY_MIN_ATTEMPT_TIME
+
+
+def http_get(url, http=None, **kwargs):
+    """
+    Sends the GET through the shared transport 'http', or else with requests.
+    """
+    if http is not None:
+        return http.get(url, **kwargs)
+    import requests
+
+    return requests.get(url, **kwargs)
+
+
+def fetch_once(url, stream=False, cache=None, http=None, rate_limiter=None):
+    if rate_limiter is not None:
+        rate_limiter.wait(url)
     try:
-        response = requests.get(url)
+        if cache is not None:
+            return fetch_with_cache(url, cache, stream, http)
+        if stream:
+            return fetch_product_block(url, http=http)
+        response = http_get(url, http, **deadline.timeout_kwargs())
         response.raise_for_status()
+        tracing.current_span().set(bytes=len(response.content))
         return response.text
     except Exception as e:
         print(f"An error occurred: {e}")
         raise e
 
 
-def send_email_via_gmail(subject, html_body):
-    gmail_user = os.environ["GMAIL_USERNAME"]
-    gmail_password = os.environ["GMAIL_APP_PASSWORD"]
-    recipient = os.environ["RECIPIENT_EMAIL"]
+def fetch_with_cache(url, cache, stream=False, http=None):
+    """
+    Sends a conditional GET with the validators of the cached snapshot and serves the snapshot on '304 Not Modified'.
+    """
+    entry = cache.lookup(url)
+    headers = cache.conditional_headers(entry)
+
+    if stream:
+        content, response = fetch_product_block(url, headers=headers, return_response=True, http=http)
+    else:
+        kwargs = {"headers": headers} if headers else {}
+        response = http_get(url, http, **kwargs, **deadline.timeout_kwargs())
+        content = None
 
-    print(f"Sending email to {recipient}.")
+    if response.status_code == 304 and entry:
+        cache.hits += 1
+        tracing.current_span().set(not_modified=1)
+        print("Website not modified, using the cached snapshot.")
+        return entry["body"]
 
-    msg = MIMEMultipart("alternative")
-    msg["From"] = gmail_user
-    msg["To"] = recipient
-    msg["Subject"] = subject
+    response.raise_for_status()
+    if content is None:
+        content = response.text
+        tracing.current_span().set(bytes=len(response.content))
+    cache.misses += 1
+    cache.store(url, content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return content
+
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def fetch_product_block(url, headers=None, return_response=False, http=None):
+    """
+    Downloads 'url' in chunks and closes the connection as soon as the 'main-product' div has been closed.
+    Returns the page up to that point, or the whole page if the product block never shows up.
+    With 'return_response', a (content, response) tuple is returned and a '304 Not Modified' is left to the caller.
+    """
+    kwargs = {"headers": headers} if headers else {}
+    with http_get(url, http, stream=True, **kwargs, **deadline.timeout_kwargs()) as response:
+        if return_response and response.status_code == 304:
+            return None, response
+        response.raise_for_status()
+        # Same encoding that response.text would use; without a declared charset we assume UTF-8
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        detector = ProductBlockDetector()
+        chunks = []
+        received_bytes = 0
 
-    msg.attach(MIMEText(html_body, "html"))
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            # The timeout only limits each read, a slowly trickling page is stopped by the deadline
+            deadline.current_timeout()
+            received_bytes += len(chunk)
+            text = decoder.decode(chunk)
+            chunks.append(text)
+            detector.feed(text)
+            if detector.complete:
+                print(f"Product block received after {received_bytes} bytes, closing the connection.")
+                break
+        else:
+            chunks.append(decoder.decode(b"", final=True))
+            print(f"Product block not found, downloaded the whole page ({received_bytes} bytes).")
+        tracing.current_span().set(bytes=received_bytes)
+
+    content = "".join(chunks)
+    return (content, response) if return_response else content
+
+
+def env_flag(name):
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes")
+
+
+def create_gmail_delivery():
+    import smtplib
+    import ssl
+    from mail_delivery import MailDelivery
 
     context = ssl.create_default_context()
-    with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-        server.login(gmail_user, gmail_password)
-        server.sendmail(gmail_user, recipient, msg.as_string())
+    max_messages_per_second = os.environ.get("SMTP_MAX_MESSAGES_PER_SECOND")
+    return MailDelivery(
+        lambda: smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context, **deadline.timeout_kwargs()),
+        os.environ["GMAIL_USERNAME"],
+        os.environ["GMAIL_APP_PASSWORD"],
+        pool_size=int(os.environ.get("SMTP_POOL_SIZE", 4)),
+        max_messages_per_connection=int(os.environ.get("SMTP_MAX_MESSAGES_PER_CONNECTION", 100)),
+        max_messages_per_second=float(max_messages_per_second) if max_messages_per_second else None,
+    )
 
 
-def main():
-    load_dotenv(override=True)
+def recipient_addresses():
+    # RECIPIENT_EMAIL may contain several comma-separated addresses
+    return [r.strip() for r in os.environ["RECIPIENT_EMAIL"].split(",") if r.strip()]
+
+
+def send_email_via_gmail(subject, html_body, delivery=None, images=()):
+    recipients = recipient_addresses()
 
-    url = "https://www.packtpub.com/free-learning"
-    website_content = fetch_website_content(url)
+    print(f"Sending email to {', '.join(recipients)}.")
 
-    print(f"Fetched Packt website.")
+    if delivery is None:
+        delivery = create_gmail_delivery()
+    raise_on_failures(delivery.send(subject, html_body, recipients, images))
 
-    openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
 
-    email_builder = EmailBodyBuilder(openai_client)
-    email_body = email_builder.get_email_body(website_content)
+def raise_on_failures(results, hint=""):
+    """
+    Reports the results of a delivery in the log and the current span, and raises if a message wasn't sent.
+    """
+    from mail_delivery import SENT
 
-    send_email_via_gmail(
-        subject="Daily PacktPub Free Learning Book Reminder", html_body=email_body
+    failed = {recipient: result for recipient, result in results.items() if result != SENT}
+    print(f"Email sent to {len(results) - len(failed)} of {len(results)} recipients.")
+    tracing.current_span().set(recipients=len(results), failed_recipients=len(failed))
+    if failed:
+        raise RuntimeError(f"Could not send the email to: {failed}.{hint}")
+
+
+def fetch_image(url, http=None):
+    response = http_get(url, http, **deadline.timeout_kwargs())
+    response.raise_for_status()
+    return response.content, response.headers.get("Content-Type")
+
+
+def optimize_payload(html_body, http=None):
+    """
+    Minifies the email and, with EMBED_IMAGES, attaches its images. Returns the HTML and the image attachments.
+    The images are fetched through the shared transport 'http', if there is one.
+    """
+    from payload_optimizer import ImageCache, optimize_email
+
+    fetch = cache = None
+    if env_flag("EMBED_IMAGES"):
+        fetch = functools.partial(fetch_image, http=http)
+        if os.environ.get("IMAGE_CACHE_DIR"):
+            cache = ImageCache(os.environ["IMAGE_CACHE_DIR"])
+    return optimize_email(html_body, fetch, cache, max_width=int(os.environ.get("IMAGE_MAX_WIDTH", 300)))
+
+
+def create_page_cache():
+    if not os.environ.get("PAGE_CACHE_DIR"):
+        return None
+    return PageCache(
+        os.environ["PAGE_CACHE_DIR"],
+        max_age=float(os.environ.get("PAGE_CACHE_MAX_AGE", 7 * 24 * 3600)),
     )
 
+
+def create_http_transport():
+    """
+    Returns the HTTP transport that the page fetch and the OpenAI client share, if SHARED_HTTP_CLIENT is set.
+    """
+    if not env_flag("SHARED_HTTP_CLIENT"):
+        return None
+    from http_transport import HttpTransport
+
+    return HttpTransport(
+        http2=not env_flag("HTTP1_ONLY"),
+        max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", 10)),
+        keepalive_expiry=float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30)),
+    )
+
+
+def close_http_transport(http):
+    if http is not None:
+        print(f"HTTP connections: {http.stats()}")
+        http.close()
+
+
+def create_openai_client(http=None):
+    """
+    Returns None if no OpenAI API key is configured; the email is then sent without labels and openai is never imported.
+    With a shared transport 'http', the client sends its requests over the connections of the page fetch.
+    """
+    if not os.environ.get("OPENAI_API_KEY"):
+        return None
+    from openai import OpenAI
+
+    if http is not None:
+        return OpenAI(api_key=os.environ["OPENAI_API_KEY"], http_client=http.client)
+    return OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+
+
+def create_email_builder(http=None):
+    openai_client = create_openai_client(http)
+
+    label_cache = None
+    if os.environ.get("LABEL_CACHE_PATH"):
+        label_cache = LabelCache(
+            os.environ["LABEL_CACHE_PATH"],
+            ttl=float(os.environ.get("LABEL_CACHE_TTL", 30 * 24 * 3600)),
+            refresh=env_flag("LABEL_CACHE_REFRESH"),
+        )
+
+    breaker = None
+    if openai_client is not None:
+        # Without OPENAI_BREAKER_PATH, the state of the breaker only lasts for this run
+        breaker = deadline.CircuitBreaker(
+            os.environ.get("OPENAI_BREAKER_PATH"),
+            failure_threshold=int(os.environ.get("OPENAI_BREAKER_THRESHOLD", 3)),
+            reset_after=float(os.environ.get("OPENAI_BREAKER_RESET", 3600)),
+        )
+
+    return EmailBodyBuilder(openai_client, label_cache=label_cache, pre_labeler=create_pre_labeler(), breaker=breaker,
+                            structured_labels=env_flag("STRUCTURED_LABELS"), canonicalizer=create_canonicalizer())
+
+
+def create_canonicalizer():
+    """
+    Maps the labels to the canonical spellings of the vocabulary at LABEL_VOCABULARY_PATH, if it is set.
+    """
+    if not os.environ.get("LABEL_VOCABULARY_PATH"):
+        return None
+    from label_canonicalizer import LabelCanonicalizer
+
+    return LabelCanonicalizer(
+        os.environ["LABEL_VOCABULARY_PATH"],
+        min_similarity=float(os.environ.get("LABEL_MIN_SIMILARITY", 0.6)),
+        auto_merge=float(os.environ.get("LABEL_AUTO_MERGE", 0.9)),
+    )
+
+
+def create_checkpoint():
+    if not os.environ.get("CHECKPOINT_DIR"):
+        return None
+    from run_checkpoint import RunCheckpoint
+
+    return RunCheckpoint(os.environ["CHECKPOINT_DIR"])
+
+
+def create_run_deadline():
+    return deadline.Deadline(float(os.environ.get("RUN_DEADLINE", 300)))
+
+
+def stage(run_deadline, share=1.0):
+    """
+    Activates the deadline of a stage that may use 'share' of 'run_deadline'; a no-op without a run deadline.
+    """
+    return deadline.activate(run_deadline.stage(share) if run_deadline is not None else None)
+
+
+def create_pre_labeler():
+    """
+    Trains the local pre-labeler on the labelled books of the catalog, if PRE_LABEL is set.
+    """
+    if not env_flag("PRE_LABEL") or not os.environ.get("CATALOG_PATH"):
+        return None
+    from catalog import Catalog
+    from pre_labeler import PreLabeler
+
+    catalog = Catalog(os.environ["CATALOG_PATH"])
+    try:
+        return PreLabeler.from_catalog(
+            catalog, min_confidence=float(os.environ.get("PRE_LABEL_MIN_CONFIDENCE", 0.8)))
+    finally:
+        catalog.close()
+
+
+def close_email_builder(email_builder):
+    if email_builder.labeler.pre_labeler is not None:
+        print(f"Pre-labeler: {email_builder.labeler.pre_labeler.stats()}")
+    label_cache = email_builder.labeler.cache
+    if label_cache is not None:
+        print(f"Label cache: {label_cache.stats()}")
+        label_cache.close()
+    canonicalizer = email_builder.labeler.canonicalizer
+    if canonicalizer is not None:
+        print(f"Label vocabulary: {canonicalizer.stats()}")
+        canonicalizer.close()
+
+
+async def fetch_books(url, page_cache=None, checkpoint=None, http=None):
+    """
+    Returns the books of today: from the configured GIVEAWAY_SOURCES, fetched concurrently,
+    or else from the Packt page at 'url'. With a 'checkpoint', the books of an earlier run of today are reused.
+    The Packt page is fetched through the shared transport 'http', if there is one.
+    """
+    if checkpoint is not None:
+        books = checkpoint.load_books()
+        if books is not None:
+            print("Using the books of an earlier run of today.")
+            return books
+
+    books = await fetch_new_books(url, page_cache, checkpoint, http)
+    if checkpoint is not None:
+        checkpoint.save_books(books)
+    return books
+
+
+async def fetch_new_books(url, page_cache=None, checkpoint=None, http=None):
+    if os.environ.get("GIVEAWAY_SOURCES"):
+        # Fetching and parsing of the sources overlap, so they share one span
+        with tracing.tracer.span("fetch", sources=os.environ["GIVEAWAY_SOURCES"]):
+            # Without the shared transport, the sources still reuse the pooled connections of one session
+            session = create_session() if http is None else None
+            try:
+                # The same retrying, cached and streamed fetch as for the Packt page
+                fetch = functools.partial(fetch_website_content, stream=env_flag("STREAM_FETCH"), cache=page_cache,
+                                          http=http or session)
+                results = await asyncio.to_thread(fetch_sources, create_sources(os.environ["GIVEAWAY_SOURCES"]),
+                                                  fetch=fetch)
+            finally:
+                if session is not None:
+                    session.close()
+        books = [book for _, book, _ in results if book is not None]
+        if not books:
+            raise RuntimeError("None of the giveaway sources could be fetched.")
+        print(f"Fetched {len(books)} of {len(results)} giveaway sources.")
+        return books
+
+    website_content = checkpoint.load_page() if checkpoint is not None else None
+    if website_content is None:
+        with tracing.tracer.span("fetch", url=url):
+            website_content = await asyncio.to_thread(
+                fetch_website_content, url, stream=env_flag("STREAM_FETCH"), cache=page_cache, http=http
+            )
+
+        print(f"Fetched Packt website.")
+        if page_cache is not None:
+            print(f"Page cache: {page_cache.stats()}")
+        if checkpoint is not None:
+            checkpoint.save_page(website_content)
+
+    with tracing.tracer.span("parse"):
+        return [await asyncio.to_thread(PacktSource().extract, website_content)]
+
+
+async def label_books(books, email_builder, email=None):
+    """
+    Labels the books concurrently. Returns (book, labels, date) entries for today.
+    With an 'email', each book is rendered into it as soon as its labels arrived, while the next ones are labelled.
+    """
+    with tracing.tracer.span("label", books=len(books)):
+        label_requests = [asyncio.create_task(asyncio.to_thread(email_builder.get_labels, book)) for book in books]
+        entries = []
+        try:
+            for book, label_request in zip(books, label_requests):
+                entries.append((book, await label_request, today()))
+                if email is not None:
+                    email.add(*entries[-1])
+        finally:
+            # Nothing is left running when a request failed
+            await asyncio.gather(*label_requests, return_exceptions=True)
+    return entries
+
+
+def record_books(entries, guessed_titles=()):
+    if not os.environ.get("CATALOG_PATH"):
+        return
+    from catalog import Catalog
+
+    catalog = Catalog(os.environ["CATALOG_PATH"])
+    added = catalog.record_many(((book, book_labels, None) for book, book_labels, _ in entries), guessed_titles)
+    print(f"Added {added} books to the catalog.")
+    catalog.close()
+
+
+def render_for_subscriber(format, entries, http=None):
+    """
+    Returns the (html body, text body, images) of the email for subscribers who want 'format'.
+    """
+    if format == "text":
+        return None, render_text(entries), ()
+    html_body = render_html(entries)
+    if env_flag("OPTIMIZE_EMAIL"):
+        html_body, images = optimize_payload(html_body, http)
+        return html_body, None, images
+    return html_body, None, ()
+
+
+def load_subscriber_index():
+    from subscribers import SubscriberStore
+
+    store = SubscriberStore(os.environ["SUBSCRIBERS_PATH"])
+    try:
+        return store.index()
+    finally:
+        store.close()
+
+
+def send_to_subscribers(entries, subject, delivery, http=None):
+    """
+    Sends every subscriber of SUBSCRIBERS_PATH the books that match their labels, in their format.
+    """
+    raise_on_failures(delivery.deliver(create_envelopes(entries, subject, delivery.username, http)))
+
+
+async def wait_for_warm_up(smtp_warm_up):
+    if smtp_warm_up is None:
+        return
+    try:
+        await smtp_warm_up
+    except Exception as e:
+        # Not fatal, the delivery opens a new connection when sending
+        print(f"Could not open the SMTP connection in advance: {e}")
+
+
+def create_envelopes(entries, subject, sender, http=None):
+    """
+    Returns the (recipient, message) envelopes for the subscribers or else for RECIPIENT_EMAIL.
+    """
+    from mail_delivery import build_message
+    from subscribers import fan_out
+
+    if os.environ.get("SUBSCRIBERS_PATH"):
+        index = load_subscriber_index()
+        envelopes = fan_out(index, entries, sender, subject, functools.partial(render_for_subscriber, http=http))
+        print(f"Sending email to {len(envelopes)} of {len(index)} subscribers.")
+        return envelopes
+    html_body, _, images = render_for_subscriber("html", entries, http)
+    return [(recipient, functools.partial(build_message, sender, recipient, subject, html_body, images))
+            for recipient in recipient_addresses()]
+
+
+def send_via_outbox(entries, subject, delivery, outbox, http=None):
+    """
+    Spools the messages in the outbox, unless an earlier run of today already did, and sends what is pending.
+    """
+    if not outbox.sealed:
+        added = outbox.put_many(create_envelopes(entries, subject, delivery.username, http))
+        outbox.seal()
+        print(f"Added {added} messages to the outbox.")
+    drain_outbox(outbox, delivery)
+
+
+def drain_outbox(outbox, delivery):
+    raise_on_failures(outbox.drain(delivery.deliver), " The messages stay in the outbox for a retry.")
+
+
+async def send_entries(entries, subject, delivery, smtp_warm_up=None, outbox=None, http=None, email=None):
+    """
+    Renders the (book, labels, date) entries into one email and sends it, using the connection of 'smtp_warm_up'.
+    With SUBSCRIBERS_PATH, every subscriber gets the entries that match their labels instead.
+    With an 'outbox', the messages are spooled there first and only removed once they were sent.
+    Embedded images are fetched through the shared transport 'http', if there is one.
+    An 'email' (HtmlEmail) that the entries were already rendered into, e.g. while labelling, isn't rendered again.
+    """
+    if outbox is not None:
+        await wait_for_warm_up(smtp_warm_up)
+        with tracing.tracer.span("send"):
+            await asyncio.to_thread(send_via_outbox, entries, subject, delivery, outbox, http)
+        return
+
+    if os.environ.get("SUBSCRIBERS_PATH"):
+        await wait_for_warm_up(smtp_warm_up)
+        with tracing.tracer.span("send"):
+            await asyncio.to_thread(send_to_subscribers, entries, subject, delivery, http)
+        return
+
+    with tracing.tracer.span("render", books=len(entries)) as span:
+        email_body = email.render() if email is not None else render_html(entries)
+        span.set(bytes=len(email_body))
+
+    images = ()
+    if env_flag("OPTIMIZE_EMAIL"):
+        with tracing.tracer.span("optimize"):
+            email_body, images = await asyncio.to_thread(optimize_payload, email_body, http)
+
+    await wait_for_warm_up(smtp_warm_up)
+
+    with tracing.tracer.span("send"):
+        await asyncio.to_thread(
+            send_email_via_gmail,
+            subject=subject,
+            html_body=email_body,
+            delivery=delivery,
+            images=images,
+        )
+
+
+async def send_reminder(books, email_builder, delivery, smtp_warm_up, run_deadline=None, checkpoint=None, http=None):
+    """
+    Labels the books, records them in the catalog and sends the email, using the connection of 'smtp_warm_up'.
+    With a 'checkpoint', the labels of an earlier run of today are reused and the email goes through its outbox.
+    """
+    entries = checkpoint.load_entries() if checkpoint is not None else None
+    email = None
+    if entries is None:
+        email = HtmlEmail()
+        with stage(run_deadline, LABEL_SHARE):
+            entries = await label_books(books, email_builder, email)
+        record_books(entries, email_builder.labeler.guessed_titles)
+        if checkpoint is not None:
+            checkpoint.save_entries(entries)
+    else:
+        print("Using the labels of an earlier run of today.")
+
+    with stage(run_deadline):
+        await send_entries(entries, "Daily PacktPub Free Learning Book Reminder", delivery, smtp_warm_up,
+                           checkpoint.outbox if checkpoint is not None else None, http, email)
+
+
+async def main_async():
+    """
+    Runs the reminder as a pipeline: the SMTP connection is opened and authenticated
+    while the website is fetched, parsed and labelled, and the OpenAI client is created while it is fetched.
+    """
+    load_dotenv(override=True)
+    tracing.configure_from_env()
+    run_deadline = create_run_deadline()
+
+    checkpoint = create_checkpoint()
+    if checkpoint is not None and checkpoint.outbox.complete:
+        print("The reminder of today was already sent.")
+        return
+
+    delivery = create_gmail_delivery()
+    with stage(run_deadline):
+        smtp_warm_up = asyncio.create_task(asyncio.to_thread(delivery.warm_up))
+
+    http = create_http_transport()
+    # Importing openai and opening the label databases takes as long as a fetch, so it runs alongside it
+    email_builder_task = asyncio.create_task(asyncio.to_thread(create_email_builder, http))
+    try:
+        with stage(run_deadline, FETCH_SHARE):
+            books = await fetch_books(PACKT_URL, create_page_cache(), checkpoint, http)
+        email_builder = await email_builder_task
+        await send_reminder(books, email_builder, delivery, smtp_warm_up, run_deadline, checkpoint, http)
+    finally:
+        await asyncio.gather(smtp_warm_up, return_exceptions=True)
+        delivery.close()
+        [email_builder] = await asyncio.gather(email_builder_task, return_exceptions=True)
+        if not isinstance(email_builder, BaseException):
+            close_email_builder(email_builder)
+        close_http_transport(http)
+        tracing.tracer.flush()
+
     print("Reminder email was sent.")
 
 
+async def run_daemon(max_polls=None):
+    """
+    Keeps the clients warm and polls the giveaway on a schedule. The reminder is only
+    labelled and sent when the extracted books have changed since the last email.
+    Every giveaway is sent through the outbox of a checkpoint named after its fingerprint, so when some
+    recipients failed, the next poll neither labels the books again nor sends them to the others twice.
+    """
+    from run_checkpoint import RunCheckpoint
+
+    load_dotenv(override=True)
+    tracing.configure_from_env()
+
+    page_cache = create_page_cache()
+    # Polls and labels reuse the connections of the transport while they are kept alive
+    http = create_http_transport()
+    email_builder = create_email_builder(http)
+    delivery = create_gmail_delivery()
+
+    async def poll():
+        try:
+            # Every poll and every send gets the budget of a whole run
+            with stage(create_run_deadline(), FETCH_SHARE):
+                return await fetch_books(PACKT_URL, page_cache, http=http)
+        finally:
+            tracing.tracer.flush()
+
+    async def on_change(books):
+        checkpoint = RunCheckpoint(os.environ.get("CHECKPOINT_DIR", ".runs"), name=fingerprint(books)[:16])
+        run_deadline = create_run_deadline()
+        with stage(run_deadline):
+            smtp_warm_up = asyncio.create_task(asyncio.to_thread(delivery.warm_up))
+        try:
+            await send_reminder(books, email_builder, delivery, smtp_warm_up, run_deadline, checkpoint, http)
+        finally:
+            await asyncio.gather(smtp_warm_up, return_exceptions=True)
+            delivery.close()
+            tracing.tracer.flush()
+        print("Reminder email was sent.")
+
+    daemon = ReminderDaemon(
+        poll,
+        on_change,
+        state_path=os.environ.get("DAEMON_STATE_PATH", ".reminder_state.json"),
+        interval=float(os.environ.get("DAEMON_INTERVAL", 600)),
+        jitter=float(os.environ.get("DAEMON_JITTER", 60)),
+    )
+    try:
+        await daemon.run(max_polls)
+    finally:
+        close_email_builder(email_builder)
+        close_http_transport(http)
+
+
+async def record_async():
+    """
+    Fetches, labels and records the books of today in the catalog without sending an email,
+    for runs whose recipients only get the digest.
+    """
+    load_dotenv(override=True)
+    tracing.configure_from_env()
+    if not os.environ.get("CATALOG_PATH"):
+        raise RuntimeError("Recording the books needs a CATALOG_PATH.")
+
+    run_deadline = create_run_deadline()
+    http = create_http_transport()
+    email_builder = create_email_builder(http)
+    try:
+        with stage(run_deadline, FETCH_SHARE):
+            books = await fetch_books(PACKT_URL, create_page_cache(), http=http)
+        with stage(run_deadline, LABEL_SHARE):
+            record_books(await label_books(books, email_builder), email_builder.labeler.guessed_titles)
+    finally:
+        close_email_builder(email_builder)
+        close_http_transport(http)
+        tracing.tracer.flush()
+
+
+def digest_entries(days, until=None):
+    """
+    Returns the recorded (book, labels, date) entries of the 'days' days up to 'until' (today by default).
+    """
+    from catalog import Catalog
+
+    until = until or Date.today()
+    catalog = Catalog(os.environ["CATALOG_PATH"])
+    try:
+        return list(catalog.find(since=until - timedelta(days=days - 1), until=until))
+    finally:
+        catalog.close()
+
+
+async def send_digest(days):
+    """
+    Sends one email with the books of the last 'days' days. Everything comes from the catalog,
+    so nothing is fetched or labelled again.
+    """
+    load_dotenv(override=True)
+    tracing.configure_from_env()
+    if not os.environ.get("CATALOG_PATH"):
+        raise RuntimeError("The digest is built from the catalog, CATALOG_PATH must be set.")
+
+    with tracing.tracer.span("load", days=days) as span:
+        entries = await asyncio.to_thread(digest_entries, days)
+        span.set(books=len(entries))
+    if not entries:
+        print(f"No books were recorded in the last {days} days, no digest sent.")
+        tracing.tracer.flush()
+        return
+
+    delivery = create_gmail_delivery()
+    try:
+        with stage(create_run_deadline()):
+            await send_entries(entries, f"PacktPub Free Learning Digest: {len(entries)} Books of the Last {days} Days",
+                               delivery)
+    finally:
+        delivery.close()
+        tracing.tracer.flush()
+
+    print("Digest email was sent.")
+
+
+def drain_outboxes():
+    """
+    Sends what is left in the outboxes of earlier runs, without fetching, labelling or rendering anything.
+    """
+    from run_checkpoint import pending_outboxes
+
+    load_dotenv(override=True)
+    if not os.environ.get("CHECKPOINT_DIR"):
+        raise RuntimeError("The outboxes are kept in the run checkpoints, CHECKPOINT_DIR must be set.")
+    outboxes = pending_outboxes(os.environ["CHECKPOINT_DIR"])
+    if not outboxes:
+        print("All outboxes are empty.")
+        return
+    delivery = create_gmail_delivery()
+    try:
+        with deadline.activate(create_run_deadline()):
+            for outbox in outboxes:
+                drain_outbox(outbox, delivery)
+    finally:
+        delivery.close()
+
+
+def main():
+    asyncio.run(main_async())
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return number
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Sends a reminder email with the free book of the day.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and send the reminder whenever the giveaway changes.")
+    parser.add_argument("--record-only", action="store_true",
+                        help="Only record the books of today in the catalog, for a later digest.")
+    parser.add_argument("--digest", type=positive_int, metavar="DAYS",
+                        help="Send one email with the books recorded in the catalog during the last DAYS days.")
+    parser.add_argument("--drain-outbox", action="store_true",
+                        help="Only send the messages that earlier runs left in the outbox of CHECKPOINT_DIR.")
+    args = parser.parse_args()
+    if args.drain_outbox:
+        drain_outboxes()
+    elif args.daemon:
+        asyncio.run(run_daemon())
+    elif args.digest is not None:
+        asyncio.run(send_digest(args.digest))
+    elif args.record_only:
+        asyncio.run(record_async())
+    else:
+        main()
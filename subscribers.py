@@ -0,0 +1,185 @@
+# This class keeps the subscribers of the reminder with the labels they want or don't want and their format.
+# An inverted index from label to subscribers routes each book to its recipients with a few set lookups,
+# and every distinct email is rendered once and shared by all subscribers who get it.
+import argparse
+import sqlite3
+from collections import defaultdict
+from functools import partial
+from catalog import split_labels
+from mail_delivery import build_message
+
+FORMATS = ("html", "text")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscribers (
+    email TEXT PRIMARY KEY COLLATE NOCASE,
+    format TEXT NOT NULL DEFAULT 'html'
+);
+CREATE TABLE IF NOT EXISTS subscriber_labels (
+    email TEXT NOT NULL COLLATE NOCASE REFERENCES subscribers (email) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    include INTEGER NOT NULL,
+    PRIMARY KEY (email, label)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_label(label):
+    return label.strip().casefold()
+
+
+class SubscriberIndex:
+
+    def __init__(self):
+        self.formats = {}
+        # Subscribers without include rules get every book that none of their exclude rules matches
+        self.everything = set()
+        self.included = defaultdict(set)
+        self.excluded = defaultdict(set)
+
+    def add(self, email, format="html", include=(), exclude=()):
+        self.formats[email] = format
+        include = [normalize_label(label) for label in include]
+        if not include:
+            self.everything.add(email)
+        for label in include:
+            self.included[label].add(email)
+        for label in exclude:
+            self.excluded[normalize_label(label)].add(email)
+
+    def __len__(self):
+        return len(self.formats)
+
+    def route(self, labels) -> set:
+        """
+        Returns the subscribers that want a book with the comma-separated 'labels'.
+        """
+        labels = [normalize_label(label) for label in split_labels(labels)]
+        recipients = set(self.everything)
+        for label in labels:
+            recipients |= self.included.get(label, set())
+        for label in labels:
+            recipients -= self.excluded.get(label, set())
+        return recipients
+
+    def groups(self, entries) -> dict:
+        """
+        Routes (book, labels, date) entries. Returns a dict from (format, indexes of the entries) to the
+        subscribers who get exactly these books in this format; subscribers who get no book are left out.
+        """
+        books_of = defaultdict(list)
+        for index, (_, labels, _) in enumerate(entries):
+            for email in self.route(labels):
+                books_of[email].append(index)
+
+        groups = defaultdict(list)
+        for email, indexes in books_of.items():
+            groups[(self.formats[email], tuple(indexes))].append(email)
+        return groups
+
+
+def fan_out(index: SubscriberIndex, entries, sender, subject, render):
+    """
+    Returns the (recipient, message) envelopes for all subscribers. 'render(format, entries)' returns the
+    (html body, text body, images) of one email and is called once per distinct email. The messages are
+    built lazily by the delivery, so they don't all have to fit into memory at once.
+    """
+    envelopes = []
+    for (format, indexes), recipients in index.groups(entries).items():
+        html_body, text_body, images = render(format, [entries[i] for i in indexes])
+        envelopes.extend(
+            (recipient, partial(build_message, sender, recipient, subject, html_body, images, text_body))
+            for recipient in recipients)
+    return envelopes
+
+
+class SubscriberStore:
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def add(self, email: str, include=(), exclude=(), format: str = "html"):
+        """
+        Adds the subscriber or replaces their rules. 'include' and 'exclude' are labels; without 'include',
+        every book is sent, and 'exclude' wins over 'include'.
+        """
+        self.add_many([(email, include, exclude, format)])
+
+    def add_many(self, subscribers):
+        """
+        Adds (email, include, exclude, format) subscribers in one transaction.
+        """
+        with self.connection:
+            for email, include, exclude, format in subscribers:
+                self._insert(email, include, exclude, format)
+
+    def _insert(self, email, include, exclude, format):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format '{format}', expected one of {FORMATS}")
+        self.connection.execute(
+            "INSERT INTO subscribers (email, format) VALUES (?, ?) ON CONFLICT (email) DO UPDATE SET format = ?",
+            (email, format, format))
+        self.connection.execute("DELETE FROM subscriber_labels WHERE email = ?", (email,))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO subscriber_labels (email, label, include) VALUES (?, ?, ?)",
+            [(email, normalize_label(label), 1) for label in include]
+            + [(email, normalize_label(label), 0) for label in exclude])
+
+    def remove(self, email: str) -> bool:
+        with self.connection:
+            return self.connection.execute("DELETE FROM subscribers WHERE email = ?", (email,)).rowcount == 1
+
+    def subscribers(self):
+        """
+        Yields (email, include, exclude, format) for every subscriber, ordered by email.
+        """
+        rows = self.connection.execute(
+            "SELECT s.email, s.format, group_concat(CASE WHEN l.include THEN l.label END), "
+            "group_concat(CASE WHEN NOT l.include THEN l.label END) "
+            "FROM subscribers s LEFT JOIN subscriber_labels l ON l.email = s.email GROUP BY s.email ORDER BY s.email")
+        for email, format, include, exclude in rows:
+            yield email, split_labels(include), split_labels(exclude), format
+
+    def index(self) -> SubscriberIndex:
+        index = SubscriberIndex()
+        for email, include, exclude, format in self.subscribers():
+            index.add(email, format, include, exclude)
+        return index
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manages the subscribers of the reminder.")
+    parser.add_argument("path", help="Path of the subscriber database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Add a subscriber or replace their rules.")
+    add.add_argument("email")
+    add.add_argument("--include", default="", help="Comma-separated labels; without, every book is sent.")
+    add.add_argument("--exclude", default="", help="Comma-separated labels that are never sent.")
+    add.add_argument("--format", choices=FORMATS, default="html")
+    remove = commands.add_parser("remove", help="Remove a subscriber.")
+    remove.add_argument("email")
+    commands.add_parser("list", help="List the subscribers.")
+    args = parser.parse_args(argv)
+
+    store = SubscriberStore(args.path)
+    try:
+        if args.command == "add":
+            store.add(args.email, split_labels(args.include), split_labels(args.exclude), args.format)
+        elif args.command == "remove":
+            if not store.remove(args.email):
+                print(f"No subscriber {args.email}.")
+        else:
+            for email, include, exclude, format in store.subscribers():
+                print(f"{email}\t{format}\tinclude: {', '.join(include) or 'everything'}\texclude: {', '.join(exclude)}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
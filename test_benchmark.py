@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+import unittest
+from benchmark import BENCHMARKS, LAZY_MODULES, find_regressions, main, measure_import_time
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_find_regressions(self):
+        baseline = {"parse": {"wall_seconds": 0.010}, "label": {"wall_seconds": 0.001}}
+        results = {"parse": {"wall_seconds": 0.013}, "label": {"wall_seconds": 0.0011}, "send": {"wall_seconds": 1.0}}
+
+        self.assertEqual(find_regressions(results, baseline, threshold=0.25), {"parse": 1.3})
+        self.assertEqual(find_regressions(results, baseline, threshold=0.5), {})
+
+    def test_covers_all_stages(self):
+        for name in ("parse", "regex_cleanup", "label", "send", "end_to_end"):
+            self.assertIn(name, BENCHMARKS)
+
+    def test_startup_does_not_import_heavy_modules(self):
+        import_seconds, modules = measure_import_time("run_reminder")
+
+        self.assertGreater(import_seconds, 0)
+        self.assertIn("email_body_builder", modules)
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_main_writes_results_and_fails_on_regression(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            baseline = os.path.join(directory, "baseline.json")
+            with open(baseline, "w", encoding="utf-8") as file:
+                json.dump({"results": {"regex_cleanup": {"wall_seconds": 1e-9}}}, file)
+
+            exit_code = main(["--only", "regex_cleanup", "--output", output, "--baseline", baseline])
+
+            with open(output, "r", encoding="utf-8") as file:
+                results = json.load(file)["results"]
+
+        self.assertEqual(exit_code, 1)
+        self.assertGreater(results["regex_cleanup"]["wall_seconds"], 0)
+        self.assertIn("peak_bytes", results["regex_cleanup"])
+
+
+if __name__ == "__main__":
+    unittest.main()
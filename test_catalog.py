@@ -0,0 +1,124 @@
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from book_record import BookRecord
+from catalog import Catalog
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = Catalog(":memory:")
+        self.kubernetes = BookRecord(title="Kubernetes in Production", author="Jane Doe", publication_year="2022",
+                                     description="Run clusters")
+        self.java = BookRecord(title="Learn Java 21", author="John Roe", publication_year="2023", description="Java")
+
+    def tearDown(self):
+        self.catalog.close()
+
+    def test_record_is_idempotent(self):
+        self.assertTrue(self.catalog.record(self.kubernetes, "Kubernetes, DevOps", date(2023, 5, 1)))
+        self.assertFalse(self.catalog.record(self.kubernetes, "Kubernetes, DevOps", date(2023, 5, 1)))
+
+        self.assertEqual(len(list(self.catalog.find())), 1)
+
+    def test_failed_extractions_are_not_recorded(self):
+        self.assertFalse(self.catalog.record(BookRecord(), "Kubernetes", date(2023, 5, 1)))
+
+        self.assertEqual(list(self.catalog.find()), [])
+
+    def test_find_by_label_and_date(self):
+        self.catalog.record_many([
+            (self.kubernetes, "Kubernetes, DevOps", date(2022, 12, 31)),
+            (self.java, "Java", date(2023, 2, 1)),
+            (self.kubernetes, "Kubernetes", date(2024, 3, 4)),
+        ])
+
+        found = list(self.catalog.find(label="kubernetes", since=date(2023, 1, 1)))
+
+        self.assertEqual(found, [(self.kubernetes, "Kubernetes", "04.03.2024")])
+
+    def test_find_by_title_author_and_year(self):
+        self.catalog.record_many([
+            (self.kubernetes, "Kubernetes", date(2023, 1, 1)),
+            (self.java, "Java", date(2023, 1, 2)),
+        ])
+
+        self.assertEqual([entry[0].title for entry in self.catalog.find(title="learn java 21")], ["Learn Java 21"])
+        self.assertEqual([entry[0].title for entry in self.catalog.find(author="Jane Doe")], ["Kubernetes in Production"])
+        self.assertEqual([entry[0].title for entry in self.catalog.find(year=2023)], ["Learn Java 21"])
+
+    def test_re_giveaways_are_one_book(self):
+        renamed = BookRecord(title="Kubernetes  in Production", author="Jane Doe", publication_year="2022",
+                             description="Run clusters")
+        self.catalog.record(self.kubernetes, "Kubernetes", date(2023, 1, 1))
+        self.catalog.record(renamed, "Kubernetes", date(2024, 1, 1))
+
+        self.assertEqual(len(list(self.catalog.find())), 2)
+        self.assertEqual([entry[2] for entry in self.catalog.find(unique_books=True)], ["01.01.2024"])
+
+    def test_find_returns_the_stored_snippet(self):
+        book = BookRecord(title="Learn Java 21", author="John Roe", snippet="<div>Java</div>")
+        self.catalog.record(book, "Java", date(2023, 2, 1))
+
+        [(found, labels, day)] = self.catalog.find()
+
+        self.assertEqual(found.snippet, "<div>Java</div>")
+        self.assertEqual(labels, "Java")
+
+    def test_find_can_leave_out_guessed_labels(self):
+        self.catalog.record(self.kubernetes, "Kubernetes", date(2023, 1, 1))
+        self.catalog.record(self.java, "Java", date(2023, 1, 2), guessed=True)
+
+        self.assertEqual(len(list(self.catalog.find())), 2)
+        self.assertEqual([book for book, _, _ in self.catalog.find(guessed=False)], [self.kubernetes])
+
+    def test_find_returns_the_source_website(self):
+        other = BookRecord(title="Free Go", author="Ann Smith", source_name="Other Site", source_url="https://example.com")
+        self.catalog.record(other, "Go", date(2023, 2, 1))
+
+        [(book, _, _)] = self.catalog.find()
+        self.assertEqual((book.source_name, book.source_url), ("Other Site", "https://example.com"))
+
+    def test_adds_the_snippet_and_source_to_an_old_catalog(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalog.sqlite")
+            connection = sqlite3.connect(path)
+            connection.executescript(
+                "CREATE TABLE giveaways (id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL, date TEXT NOT NULL, "
+                "source TEXT NOT NULL, price TEXT NOT NULL, labels TEXT NOT NULL, UNIQUE (date, source, book_id));")
+            connection.close()
+
+            catalog = Catalog(path)
+            catalog.record(self.java, "Java", date(2023, 2, 1))
+            # Like a giveaway recorded before the migration
+            catalog.connection.execute("UPDATE giveaways SET source_name = '', source_url = ''")
+            self.assertEqual([entry[0] for entry in catalog.find()], [self.java])
+            catalog.close()
+
+    def test_export_tsv_in_details_line_order(self):
+        self.catalog.record(self.java, "Java", date(2023, 2, 1))
+        output = io.StringIO()
+
+        count = self.catalog.export(output)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(output.getvalue(),
+                         "Learn Java 21\tJohn Roe\t2023\tJava\tJava\tPackt\tEPUB, PDF, MOBI\t01.02.2023\tPackt Giveaway\t0\n")
+
+    def test_export_csv_with_header(self):
+        self.catalog.record(self.kubernetes, "Kubernetes, DevOps", date(2023, 2, 1))
+        output = io.StringIO()
+
+        self.catalog.export(output, delimiter=",", header=True)
+
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("title,author,"))
+        self.assertIn('"Kubernetes, DevOps"', lines[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
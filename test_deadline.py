@@ -0,0 +1,159 @@
+import os
+import smtplib
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from deadline import CircuitBreaker, Deadline, DeadlineExceeded, activate, current_timeout, timeout_kwargs
+from email_body_builder import EmailBodyBuilder
+from book_record import BookRecord
+from http_stand_in import HttpStandIn
+from mail_delivery import MailDelivery, SENT
+from smtp_stand_in import SmtpStandIn
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_stages_share_the_budget(self):
+        clock = FakeClock()
+        run_deadline = Deadline(100, clock)
+
+        fetch = run_deadline.stage(0.4)
+        self.assertEqual(fetch.remaining(), 40)
+        clock.now += 10
+        # The 30 seconds the fetch didn't need are left to the later stages
+        self.assertEqual(run_deadline.stage(0.3).remaining(), 30)
+        self.assertEqual(run_deadline.stage(1.0).remaining(), 90)
+        clock.now += 85
+        self.assertEqual(run_deadline.stage(0.3).remaining(), 5)
+
+    def test_timeout_of_the_active_deadline(self):
+        clock = FakeClock()
+
+        self.assertIsNone(current_timeout())
+        self.assertEqual(timeout_kwargs(), {})
+        with activate(Deadline(5, clock)):
+            self.assertEqual(timeout_kwargs(), {"timeout": 5})
+            clock.now += 5
+            with self.assertRaises(DeadlineExceeded):
+                current_timeout()
+        self.assertEqual(timeout_kwargs(), {})
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "breaker.json")
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_breaker(self):
+        return CircuitBreaker(self.path, failure_threshold=2, reset_after=60, clock=self.clock)
+
+    def test_opens_after_repeated_failures_and_survives_a_restart(self):
+        breaker = self.create_breaker()
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertFalse(breaker.allow())
+        self.assertFalse(self.create_breaker().allow())
+
+    def test_lets_one_trial_through_after_the_reset_time(self):
+        breaker = self.create_breaker()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.clock.now += 60
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+
+        self.assertTrue(self.create_breaker().allow())
+        self.assertEqual(self.create_breaker().failures, 0)
+
+
+class TestRetryDeadline(unittest.TestCase):
+
+    def test_no_retry_whose_wait_outlasts_the_deadline(self):
+        from run_reminder import out_of_time
+        clock = FakeClock()
+        with activate(Deadline(8, clock)):
+            self.assertFalse(out_of_time(SimpleNamespace(upcoming_sleep=4)))
+            # The third attempt waits 8 seconds, which the deadline doesn't leave anymore
+            self.assertTrue(out_of_time(SimpleNamespace(upcoming_sleep=8)))
+        self.assertFalse(out_of_time(SimpleNamespace(upcoming_sleep=8)))
+
+
+class TestDeadlineWithStandIns(unittest.TestCase):
+    """
+    Network calls under a deadline against local servers that hang for longer than the deadline.
+    """
+
+    def assertFinishedWithin(self, started, seconds):
+        self.assertLess(time.monotonic() - started, seconds)
+
+    def test_fetch_gives_up_at_the_deadline(self):
+        from run_reminder import fetch_website_content
+        with HttpStandIn(b"<html></html>", delay=3) as server, activate(Deadline(0.5)):
+            started = time.monotonic()
+            with patch("builtins.print"), self.assertRaises(Exception):
+                fetch_website_content(server.url)
+
+            self.assertFinishedWithin(started, 2)
+            # No retry is started when it couldn't finish before the deadline
+            self.assertEqual(len(server.requests), 1)
+
+    def test_labels_are_skipped_after_openai_timed_out_repeatedly(self):
+        from openai import OpenAI
+        book = BookRecord(title="Learn Java 21", author="Author", description="Java")
+        with HttpStandIn(b"{}", content_type="application/json", delay=3) as server:
+            client = OpenAI(api_key="test", base_url=server.url + "/v1", max_retries=0)
+            builder = EmailBodyBuilder(client, breaker=CircuitBreaker(failure_threshold=2))
+
+            started = time.monotonic()
+            with patch("builtins.print"):
+                for _ in range(3):
+                    with activate(Deadline(0.3)):
+                        self.assertEqual(builder.get_labels(book), "")
+
+            self.assertFinishedWithin(started, 2.5)
+            self.assertEqual(len(server.requests), 2)
+            self.assertTrue(builder.labeler.breaker.is_open)
+
+    def test_smtp_connection_gives_up_at_the_deadline(self):
+        with SmtpStandIn(greeting_delay=3) as server:
+            delivery = MailDelivery(lambda: smtplib.SMTP("127.0.0.1", server.port, **timeout_kwargs()),
+                                    "sender@example.com", "password", pool_size=2)
+
+            started = time.monotonic()
+            with activate(Deadline(0.3)):
+                results = delivery.send("Subject", "<p>Body</p>", ["a@example.com", "b@example.com"])
+
+            self.assertFinishedWithin(started, 2)
+            self.assertEqual(set(results), {"a@example.com", "b@example.com"})
+            self.assertNotIn(SENT, results.values())
+
+    def test_slow_servers_within_the_deadline_still_work(self):
+        with SmtpStandIn(greeting_delay=0.1) as server:
+            delivery = MailDelivery(lambda: smtplib.SMTP("127.0.0.1", server.port, **timeout_kwargs()),
+                                    "sender@example.com", "password")
+            with activate(Deadline(5)):
+                self.assertEqual(delivery.send("Subject", "<p>Body</p>", ["a@example.com"]), {"a@example.com": SENT})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import MagicMock
-from email_body_builder import EmailBodyBuilder
+from email_body_builder import EmailBodyBuilder, scoped_product_info_region
 from datetime import datetime
 
 class TestEmailBodyBuilder(unittest.TestCase):
@@ -110,6 +110,40 @@ class TestEmailBodyBuilder(unittest.TestCase):
 
         self.assertIn("https://www.packtpub.com/images/star--100-white.svg", email_body)
 
+    def test_scoped_parser_matches_full_parser(self):
+        with open('test_website_data.html', 'r', encoding='utf-8') as file:
+            website_content = file.read()
+
+        full_builder = EmailBodyBuilder(MagicMock(), parser="full")
+        full_builder.labeler.get_labels = MagicMock(return_value="Label 1, Label 2, Label 3")
+
+        self.assertEqual(self.builder.parser, "scoped")
+        self.assertEqual(full_builder.get_email_body(website_content), self.builder.get_email_body(website_content))
+
+    def test_scoped_region_falls_back_without_product_info(self):
+        self.assertIsNone(scoped_product_info_region("<html><body><div class=\"other-info\"></div></body></html>"))
+
+        website_content = "<div class=\"product__info--wide\"><div class=\"main-product\">Teaser</div></div>"
+        self.assertIsNone(scoped_product_info_region(website_content))
+        email_body = self.builder.get_email_body(website_content)
+        self.assertIn("<p>Unfortunately, no matching snippet found.</p>", email_body)
+
+    def test_extract_book(self):
+        with open('test_website_data.html', 'r', encoding='utf-8') as file:
+            website_content = file.read()
+
+        book = self.builder.extract_book(website_content)
+
+        self.assertEqual(book.title, "Mastering Scientific Computing with R")
+        self.assertEqual(book.author, "Paul Gerrard")
+        self.assertEqual(book.publication_year, "2015")
+        self.assertIn("https://www.packtpub.com/images/star--100-white.svg", book.snippet)
+        self.builder.labeler.get_labels.assert_not_called()
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ValueError):
+            EmailBodyBuilder(MagicMock(), parser="lxml")
+
     def test_get_email_body_with_openai_exception(self):
         # Simulate a valid HTML content with the expected structure
         website_content = """
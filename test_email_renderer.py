@@ -0,0 +1,59 @@
+import unittest
+from book_record import BookRecord
+from email_renderer import CompiledTemplate, NO_SNIPPET, details_line, render_html, render_text, today
+
+
+class TestEmailRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.book = BookRecord(title="Sample Title", author="Sample Author", publication_year="2023",
+                               description="Sample Description", snippet="<div class=\"main-product\">Book</div>")
+
+    def test_compiled_template_keeps_other_braces(self):
+        template = CompiledTemplate("th {\n  color: red;\n}\n<td>{title}</td>{ title }")
+
+        self.assertEqual(template.names, ["title"])
+        self.assertEqual(template.render(title="Java"), "th {\n  color: red;\n}\n<td>Java</td>{ title }")
+
+    def test_details_line(self):
+        self.assertEqual(
+            details_line(self.book, "Java", "18.10.2026"),
+            "Sample Title\tSample Author\t2023\tSample Description\tJava\tPackt\tEPUB, PDF, MOBI\t18.10.2026\tPackt Giveaway\t0",
+        )
+
+    def test_render_html_with_several_books(self):
+        other_book = BookRecord(title="Other Title", snippet="")
+
+        email_html = render_html([(self.book, "Java", "18.10.2026"), (other_book, "", "19.10.2026")])
+
+        self.assertEqual(email_html.count("<h2><a href=\"https://www.packtpub.com/free-learning\">"), 2)
+        self.assertIn("<div class=\"main-product\">Book</div>", email_html)
+        self.assertIn(NO_SNIPPET, email_html)
+        self.assertIn("<td>Sample Title</td>", email_html)
+        self.assertIn("<td>Other Title</td>", email_html)
+        self.assertIn(details_line(self.book, "Java", "18.10.2026") + "\n" + details_line(other_book, "", "19.10.2026"),
+                      email_html)
+
+    def test_render_text(self):
+        text = render_text([(self.book, "Java", today())])
+
+        self.assertIn("Today at PacktPub Free Learning: Sample Title", text)
+        self.assertIn("Labels: Java", text)
+        self.assertNotIn("<div", text)
+
+    def test_books_of_earlier_days_are_headed_by_their_date(self):
+        digest = [(self.book, "Java", "01.10.2026"), (BookRecord(title="Other Title", source_name="Other Site"), "", "02.10.2026")]
+
+        self.assertIn("On 01.10.2026 at PacktPub Free Learning: Sample Title", render_text(digest))
+        self.assertIn(">On 02.10.2026 at Other Site:</a></h2>", render_html(digest))
+        self.assertNotIn("Today at", render_html(digest))
+
+    def test_book_record_is_frozen_and_round_trips(self):
+        with self.assertRaises(AttributeError):
+            self.book.title = "Changed"
+        self.assertFalse(hasattr(self.book, "__dict__"))
+        self.assertEqual(BookRecord.from_dict(self.book.to_dict()), self.book)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import contextvars
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from book_record import BookRecord
+from giveaway_sources import (GiveawaySource, HostRateLimiter, PacktSource, SOURCES, create_sources,
+                              fetch_sources)
+
+
+class FakeSource(GiveawaySource):
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+
+    def extract(self, website_content) -> BookRecord:
+        return BookRecord(title=website_content, source=self.name)
+
+
+class TestGiveawaySources(unittest.TestCase):
+
+    def create_session(self, pages, delay=0.0):
+        session = MagicMock()
+
+        def get(url, timeout=None):
+            time.sleep(delay)
+            if isinstance(pages[url], Exception):
+                raise pages[url]
+            return MagicMock(text=pages[url])
+
+        session.get.side_effect = get
+        return session
+
+    def test_packt_is_registered(self):
+        self.assertIs(SOURCES["packt"], PacktSource)
+        self.assertIsInstance(create_sources("packt")[0], PacktSource)
+        with self.assertRaises(ValueError):
+            create_sources("packt, unknown")
+
+    def test_packt_source_extracts_the_book(self):
+        with open("test_website_data.html", "r", encoding="utf-8") as file:
+            book = PacktSource().extract(file.read())
+
+        self.assertEqual(book.title, "Mastering Scientific Computing with R")
+
+    def test_fetches_sources_concurrently_through_one_session(self):
+        sources = [FakeSource(f"source{i}", f"https://host{i}.example.com/free") for i in range(4)]
+        session = self.create_session({source.url: f"Book {i}" for i, source in enumerate(sources)}, delay=0.2)
+
+        started = time.monotonic()
+        results = fetch_sources(sources, session=session, max_workers=4)
+
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual([book.title for _, book, _ in results], ["Book 0", "Book 1", "Book 2", "Book 3"])
+        self.assertEqual(session.get.call_count, 4)
+
+    def test_failing_source_does_not_block_the_others(self):
+        sources = [FakeSource("broken", "https://broken.example.com"), FakeSource("working", "https://ok.example.com")]
+        session = self.create_session({"https://broken.example.com": ConnectionError("down"),
+                                       "https://ok.example.com": "Book"})
+
+        results = fetch_sources(sources, session=session)
+
+        self.assertIsNone(results[0][1])
+        self.assertIsInstance(results[0][2], ConnectionError)
+        self.assertEqual(results[1][1].title, "Book")
+
+    def test_fetch_function_runs_in_the_callers_context(self):
+        sources = [FakeSource(f"source{i}", f"https://host{i}.example.com/free") for i in range(2)]
+        run = contextvars.ContextVar("run")
+        run.set("today")
+
+        results = fetch_sources(sources, fetch=lambda url, rate_limiter: f"{run.get()} {url}")
+
+        self.assertEqual([book.title for _, book, _ in results],
+                         ["today https://host0.example.com/free", "today https://host1.example.com/free"])
+
+    def test_abstract_source_cannot_be_created(self):
+        with self.assertRaises(TypeError):
+            GiveawaySource()
+
+    def test_host_rate_limit(self):
+        rate_limiter = HostRateLimiter(min_interval=0.1)
+        started = time.monotonic()
+
+        threads = [threading.Thread(target=rate_limiter.wait, args=("https://same.example.com/page",)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rate_limiter.wait("https://other.example.com/page")
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertLess(time.monotonic() - started, 0.3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import json
+import ssl
+import unittest
+from openai import OpenAI
+from http_stand_in import HttpStandIn
+from http_transport import HttpTransport
+from run_reminder import fetch_website_content
+
+CERTIFICATE = "test_cert.pem"
+
+
+class TestHttpTransport(unittest.TestCase):
+
+    def setUp(self):
+        with open("test_website_data.html", "rb") as f:
+            self.page = f.read()
+        self.context = ssl.create_default_context(cafile=CERTIFICATE)
+
+    def test_page_fetch_and_openai_share_one_connection(self):
+        completion = {"id": "1", "object": "chat.completion", "created": 0, "model": "fake", "choices": [
+            {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "R"}}]}
+        with HttpStandIn(json.dumps(completion).encode(), "application/json", certfile=CERTIFICATE) as server, \
+                HttpTransport(verify=self.context) as http:
+            for _ in range(3):
+                self.assertEqual(http.get(f"{server.url}/free-learning").status_code, 200)
+            client = OpenAI(api_key="test", base_url=f"{server.url}/v1", http_client=http.client, max_retries=0)
+            answer = client.chat.completions.create(messages=[{"role": "user", "content": "Labels?"}], model="fake")
+
+        self.assertEqual(answer.choices[0].message.content, "R")
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(http.stats(), {"requests": 4, "connections": 1, "tls_handshakes": 1, "reused": 3,
+                                        "reuse_rate": 0.75, "http_versions": {"HTTP/1.1": 4}})
+
+    def test_fetch_website_content_through_the_transport(self):
+        with HttpStandIn(self.page, certfile=CERTIFICATE) as server, HttpTransport(verify=self.context) as http:
+            content = fetch_website_content(server.url, http=http)
+            streamed = fetch_website_content(server.url, stream=True, http=http)
+
+        self.assertEqual(content, self.page.decode("utf-8"))
+        self.assertIn('<div class="grid product-info main-product">', streamed)
+        self.assertLess(len(streamed), len(content))
+        self.assertEqual(http.stats()["tls_handshakes"], 1)
+
+    def test_expired_connections_are_not_reused(self):
+        with HttpStandIn(b"<html></html>", certfile=CERTIFICATE) as server, \
+                HttpTransport(verify=self.context, max_keepalive_connections=0) as http:
+            for _ in range(3):
+                http.get(server.url).raise_for_status()
+
+        self.assertEqual(server.connections, 3)
+        self.assertEqual(http.stats()["reused"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
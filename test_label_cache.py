@@ -0,0 +1,57 @@
+import time
+import unittest
+from label_cache import LabelCache
+
+
+class TestLabelCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LabelCache(":memory:")
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_key_normalizes_book_fields(self):
+        key = LabelCache.key("Learn  Java", "Author", "Some\ndescription", "prompt", "gpt-4o-mini")
+
+        self.assertEqual(key, LabelCache.key(" learn java ", "AUTHOR", "Some description", "prompt", "gpt-4o-mini"))
+        self.assertNotEqual(key, LabelCache.key("Learn Java", "Author", "Some description", "other prompt", "gpt-4o-mini"))
+        self.assertNotEqual(key, LabelCache.key("Learn Java", "Author", "Some description", "prompt", "gpt-4o"))
+
+    def test_hit_and_miss_statistics(self):
+        self.assertIsNone(self.cache.get("key"))
+        self.cache.put("key", "Java", latency=1.5)
+
+        self.assertEqual(self.cache.get("key"), "Java")
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5, "saved_seconds": 1.5})
+
+    def test_expired_entries_are_misses(self):
+        self.cache.ttl = 0
+        self.cache.put("key", "Java", latency=1.0)
+        time.sleep(0.01)
+
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.max_entries = 2
+        self.cache.put("first", "A", latency=1.0)
+        time.sleep(0.01)
+        self.cache.put("second", "B", latency=1.0)
+        time.sleep(0.01)
+        self.cache.get("first")
+        time.sleep(0.01)
+        self.cache.put("third", "C", latency=1.0)
+
+        self.assertEqual(self.cache.get("first"), "A")
+        self.assertIsNone(self.cache.get("second"))
+        self.assertEqual(self.cache.get("third"), "C")
+
+    def test_refresh_ignores_cached_labels(self):
+        self.cache.put("key", "Java", latency=1.0)
+        self.cache.refresh = True
+
+        self.assertIsNone(self.cache.get("key"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from label_canonicalizer import LabelCanonicalizer, normalize
+from labeler import Labeler
+
+
+class TestLabelCanonicalizer(unittest.TestCase):
+
+    def setUp(self):
+        self.canonicalizer = LabelCanonicalizer(":memory:")
+        self.canonicalizer.add_many(["Kubernetes", "Machine Learning", "Data Structures", "Java"])
+
+    def tearDown(self):
+        self.canonicalizer.close()
+
+    def test_normalize_ignores_case_and_separators(self):
+        self.assertEqual(normalize("  Machine_Learning "), "machine learning")
+        self.assertEqual(normalize("CI/CD"), "ci cd")
+
+    def test_known_spellings_are_mapped_to_the_vocabulary(self):
+        self.assertEqual(self.canonicalizer.canonical("kubernetes"), "Kubernetes")
+        self.assertEqual(self.canonicalizer.canonical("machine-learning"), "Machine Learning")
+        self.assertEqual(self.canonicalizer.stats()["added"], 0)
+
+    def test_near_identical_spellings_are_merged(self):
+        self.assertEqual(self.canonicalizer.canonical("Data Structure"), "Data Structures")
+        self.assertEqual(len(self.canonicalizer), 4)
+        self.assertEqual(self.canonicalizer.proposals(), [])
+
+    def test_similar_labels_are_proposed_until_approved(self):
+        self.assertEqual(self.canonicalizer.canonical("Kubernets"), "Kubernets")
+        [(alias, canonical, _)] = self.canonicalizer.proposals()
+        self.assertEqual((alias, canonical), ("Kubernets", "Kubernetes"))
+
+        self.assertTrue(self.canonicalizer.approve("Kubernets"))
+        self.assertEqual(self.canonicalizer.canonical("Kubernets"), "Kubernetes")
+        self.assertEqual(self.canonicalizer.proposals(), [])
+        self.assertEqual(len(self.canonicalizer), 4)
+
+    def test_rejected_labels_stay_and_are_not_proposed_again(self):
+        self.canonicalizer.canonical("Kubernets")
+        self.assertTrue(self.canonicalizer.reject("Kubernets"))
+
+        self.assertEqual(self.canonicalizer.canonical("Kubernets"), "Kubernets")
+        self.assertEqual(self.canonicalizer.proposals(), [])
+        self.assertFalse(self.canonicalizer.approve("Kubernets"))
+
+    def test_approve_merges_into_any_label(self):
+        self.canonicalizer.canonical("K8s")
+
+        self.assertTrue(self.canonicalizer.approve("K8s", "Kubernetes"))
+        self.assertEqual(self.canonicalizer.canonicalize("K8s, kubernetes, Java"), "Kubernetes, Java")
+
+    def test_approve_a_label_that_was_never_seen(self):
+        # The first new label builds the trigram index
+        self.canonicalizer.canonical("Rust")
+
+        self.assertTrue(self.canonicalizer.approve("K8s", "Kubernetes"))
+        self.assertEqual(self.canonicalizer.canonical("k8s"), "Kubernetes")
+        self.assertEqual(self.canonicalizer.match("K8s"), (None, 0.0))
+
+    def test_approve_an_alias_into_another_label(self):
+        self.canonicalizer.canonical("K8s")
+        self.assertTrue(self.canonicalizer.approve("K8s", "Kubernetes"))
+
+        self.assertTrue(self.canonicalizer.approve("K8s", "Java"))
+        self.assertEqual(self.canonicalizer.canonical("K8s"), "Java")
+        self.assertEqual(len(self.canonicalizer), 4)
+
+    def test_unrelated_labels_are_added(self):
+        self.assertEqual(self.canonicalizer.canonical("Quantum Computing"), "Quantum Computing")
+        self.assertEqual(self.canonicalizer.match("quantum computer")[0], "quantum computing")
+        self.assertEqual(self.canonicalizer.match("Rust"), (None, 0.0))
+
+    def test_vocabulary_and_aliases_are_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "labels.sqlite")
+            canonicalizer = LabelCanonicalizer(path)
+            canonicalizer.add_many(["Kubernetes"])
+            canonicalizer.canonical("K8s")
+            canonicalizer.approve("K8s", "Kubernetes")
+            canonicalizer.close()
+
+            canonicalizer = LabelCanonicalizer(path)
+            try:
+                self.assertEqual(canonicalizer.canonical("k8s"), "Kubernetes")
+                self.assertEqual(len(canonicalizer), 1)
+            finally:
+                canonicalizer.close()
+
+    def test_new_labels_are_committed_in_batches_and_on_close(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "labels.sqlite")
+            canonicalizer = LabelCanonicalizer(path)
+            canonicalizer.canonical("Kubernetes")
+            canonicalizer.canonical("Kubernets")
+            self.assertEqual(canonicalizer.uncommitted, 3)
+            canonicalizer.close()
+
+            canonicalizer = LabelCanonicalizer(path)
+            try:
+                self.assertEqual(len(canonicalizer), 2)
+                self.assertEqual(len(canonicalizer.proposals()), 1)
+                with patch("label_canonicalizer.COMMIT_EVERY", 2):
+                    canonicalizer.canonical("Java")
+                    canonicalizer.canonical("Rust")
+                self.assertEqual(canonicalizer.uncommitted, 0)
+            finally:
+                canonicalizer.connection.close()
+
+            canonicalizer = LabelCanonicalizer(path)
+            try:
+                self.assertEqual(len(canonicalizer), 4)
+            finally:
+                canonicalizer.close()
+
+    def test_labeler_canonicalizes_its_answers(self):
+        labeler = Labeler(None, simulate=True, canonicalizer=self.canonicalizer)
+        self.canonicalizer.add_many(["Label 1"])
+        self.canonicalizer.canonical("Label 2")
+        self.canonicalizer.approve("Label 2", "Label 1")
+
+        self.assertEqual(labeler.get_labels("Title", "Author", "Description"), "Label 1, Label 3")
+        self.assertEqual(labeler.get_labels_batch([("Title", "Author", "Description")]), ["Label 1, Label 3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,68 @@
+import json
+import os
+import tempfile
+import threading
 import unittest
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
-from labeler import Labeler
+from labeler import SYSTEM_PROMPT, Labeler, compact_description, read_batch_results
+from label_cache import LabelCache
+
+
+class FakeBatchClient:
+    """
+    Labels every book in a batch request with 'Label <id>', except the ids in 'skip_ids'.
+    """
+
+    def __init__(self, skip_ids=(), broken_answer=False):
+        self.skip_ids = set(skip_ids)
+        self.broken_answer = broken_answer
+        self.batch_requests = []
+        self.single_requests = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, model=None, response_format=None):
+        if response_format is None:
+            with self.lock:
+                self.single_requests += 1
+            return self.completion("Single Label")
+
+        books = json.loads(messages[1]["content"])
+        with self.lock:
+            self.batch_requests.append([book["id"] for book in books])
+        if self.broken_answer:
+            return self.completion("{\"results\": [")
+        results = [{"id": book["id"], "labels": f"Label {book['id']}"} for book in books if book["id"] not in self.skip_ids]
+        return self.completion(json.dumps({"results": results}))
+
+    def completion(self, content):
+        return SimpleNamespace(model="fake", choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeStreamingClient:
+    """
+    Streams 'pieces' as chunks of a chat completion and counts how many of them were read.
+    """
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+        self.closed = False
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return self
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.read += 1
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    def close(self):
+        self.closed = True
 
 
 class TestLabeler(unittest.TestCase):
@@ -37,6 +99,127 @@ class TestLabeler(unittest.TestCase):
                 model=unittest.mock.ANY
             )
 
+    def test_get_labels_uses_cache(self):
+        cache = LabelCache(":memory:")
+        labeler = Labeler(openai_client=MagicMock(), cache=cache)
+        labeler.openai_client.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content="Java"))])
+
+        self.assertEqual(labeler.get_labels(self.title, self.author, self.description), "Java")
+        self.assertEqual(labeler.get_labels(self.title, self.author, self.description), "Java")
+
+        labeler.openai_client.chat.completions.create.assert_called_once()
+        self.assertEqual(cache.stats()["hits"], 1)
+        cache.close()
+
+    def test_cached_labels_come_before_the_pre_labeler_on_both_paths(self):
+        cache = LabelCache(":memory:")
+        cache.put(cache.key(self.title, self.author, self.description, SYSTEM_PROMPT, os.environ.get("OPENAI_MODEL")),
+                  "Cached", 0.1)
+        pre_labeler = MagicMock()
+        pre_labeler.get_labels.return_value = "Guessed"
+        labeler = Labeler(openai_client=MagicMock(), cache=cache, pre_labeler=pre_labeler)
+
+        self.assertEqual(labeler.get_labels(self.title, self.author, self.description), "Cached")
+        self.assertEqual(labeler.get_labels_batch([(self.title, self.author, self.description)]), ["Cached"])
+        self.assertEqual(labeler.get_labels_batch([("Other", self.author, self.description)]), ["Guessed"])
+
+        pre_labeler.get_labels.assert_called_once_with("Other", self.description)
+        self.assertEqual(labeler.guessed_titles, {"Other"})
+        cache.close()
+
+    def test_get_labels_batch_in_chunks(self):
+        client = FakeBatchClient()
+        labeler = Labeler(openai_client=client)
+        books = [(f"Title {i}", "Author", "Description") for i in range(7)]
+
+        labels = labeler.get_labels_batch(books, chunk_size=3, max_workers=2)
+
+        self.assertEqual(labels, [f"Label {i}" for i in range(7)])
+        self.assertEqual(sorted(client.batch_requests), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(client.single_requests, 0)
+
+    def test_get_labels_batch_falls_back_per_book(self):
+        client = FakeBatchClient(skip_ids={1})
+        labeler = Labeler(openai_client=client)
+        books = [(f"Title {i}", "Author", "Description") for i in range(3)]
+
+        labels = labeler.get_labels_batch(books, chunk_size=3)
+
+        self.assertEqual(labels, ["Label 0", "Single Label", "Label 2"])
+        self.assertEqual(client.single_requests, 1)
+
+    def test_get_labels_batch_falls_back_on_unreadable_answer(self):
+        client = FakeBatchClient(broken_answer=True)
+        labeler = Labeler(openai_client=client)
+
+        labels = labeler.get_labels_batch([("Title", "Author", "Description")] * 2)
+
+        self.assertEqual(labels, ["Single Label", "Single Label"])
+
+    def test_get_labels_batch_uses_cache(self):
+        cache = LabelCache(":memory:")
+        client = FakeBatchClient()
+        labeler = Labeler(openai_client=client, cache=cache)
+        books = [(f"Title {i}", "Author", "Description") for i in range(3)]
+
+        labeler.get_labels_batch(books[:2])
+        labels = labeler.get_labels_batch(books)
+
+        self.assertEqual(labels, ["Label 0", "Label 1", "Label 2"])
+        self.assertEqual(client.batch_requests, [[0, 1], [2]])
+        cache.close()
+
+    def test_batch_file_round_trip(self):
+        labeler = Labeler(openai_client=None)
+        books = [(f"Title {i}", "Author", "Description") for i in range(3)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, "input.jsonl")
+            output_path = os.path.join(directory, "output.jsonl")
+            labeler.write_batch_file(books, input_path, chunk_size=2)
+
+            with open(input_path, "r", encoding="utf-8") as file:
+                requests = [json.loads(line) for line in file]
+            self.assertEqual([request["custom_id"] for request in requests], ["books-0-1", "books-2-2"])
+
+            # Answer the first request only, as the Batch API would for a partly failed batch
+            answer = {"results": [{"id": 0, "labels": "Java"}, {"id": 1, "labels": "Go"}]}
+            with open(output_path, "w", encoding="utf-8") as file:
+                file.write(json.dumps({"custom_id": "books-0-1", "response": {"body": {
+                    "choices": [{"message": {"content": json.dumps(answer)}}]}}}) + "\n")
+                file.write(json.dumps({"custom_id": "books-2-2", "error": {"message": "failed"}}) + "\n")
+
+            self.assertEqual(read_batch_results(output_path, len(books)), ["Java", "Go", None])
+
+    def test_structured_labels_stop_streaming_at_the_complete_list(self):
+        client = FakeStreamingClient(['{"lab', 'els": ["Algo', 'rithms", "Data ', 'Structures"]', "}", "\n\n\n"])
+        labeler = Labeler(openai_client=client, structured=True, max_tokens=30, description_limit=20)
+
+        labels = labeler.get_labels(self.title, self.author, "A  long\n\ndescription of algorithms and more")
+
+        self.assertEqual(labels, "Algorithms, Data Structures")
+        self.assertEqual(client.read, 4)
+        self.assertTrue(client.closed)
+        request = client.requests[0]
+        self.assertEqual(request["max_tokens"], 30)
+        self.assertTrue(request["stream"])
+        self.assertEqual(request["response_format"]["type"], "json_schema")
+        self.assertTrue(request["messages"][1]["content"].endswith("Description: A long description ..."))
+
+    def test_structured_labels_are_capped_and_validated(self):
+        labeler = Labeler(openai_client=FakeStreamingClient(['{"labels": ["A", " ", "B", "C", "D"]}']), structured=True)
+        self.assertEqual(labeler.get_labels(self.title, self.author, self.description), "A, B, C")
+
+        for pieces in (['{"labels": []}'], ['{"labels": ["A"'], ["Java, Go"]):
+            labeler = Labeler(openai_client=FakeStreamingClient(pieces), structured=True)
+            with self.assertRaises(ValueError):
+                labeler.get_labels(self.title, self.author, self.description)
+
+    def test_compact_description(self):
+        self.assertEqual(compact_description(" Short\n text "), "Short text")
+        self.assertEqual(compact_description("one two three four", limit=12), "one two ...")
+
     def test_get_labels_simulation(self):
         self.labeler.simulate = True
         labels = self.labeler.get_labels(self.title, self.author, self.description)
@@ -0,0 +1,181 @@
+import smtplib
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from mail_delivery import MailDelivery, SENT, build_message
+from smtp_stand_in import SmtpStandIn
+
+
+class TestMailDelivery(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SmtpStandIn(rejected_recipients={"unknown@example.com"})
+        self.server.__enter__()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+
+    def create_delivery(self, **kwargs):
+        return MailDelivery(lambda: smtplib.SMTP("127.0.0.1", self.server.port), "sender@example.com", "password", **kwargs)
+
+    def test_build_message_attaches_images_by_content_id(self):
+        message = build_message("sender@example.com", "a@example.com", "Subject",
+                                '<img src="cid:image0@packt-reminder">', [("image0@packt-reminder", b"GIF89a", "gif")])
+
+        self.assertIn("multipart/related", message)
+        self.assertIn("Content-ID: <image0@packt-reminder>", message)
+        self.assertIn("Content-Type: image/gif", message)
+        self.assertNotIn("multipart/related", build_message("sender@example.com", "a@example.com", "Subject", "<p/>"))
+
+    def test_sends_to_all_recipients_over_reused_connections(self):
+        recipients = [f"recipient{i}@example.com" for i in range(20)]
+
+        results = self.create_delivery(pool_size=2).send("Subject", "<p>Body</p>", recipients)
+
+        self.assertEqual(results, {recipient: SENT for recipient in recipients})
+        self.assertEqual(len(self.server.messages), 20)
+        self.assertLessEqual(self.server.connections, 2)
+        delivered_to, data = self.server.messages[0]
+        self.assertIn(b"Subject: Subject", data)
+        self.assertIn(f"To: {delivered_to[0]}".encode("ascii"), data)
+
+    def test_reconnects_after_max_messages_per_connection(self):
+        recipients = [f"recipient{i}@example.com" for i in range(6)]
+
+        self.create_delivery(pool_size=1, max_messages_per_connection=2).send("Subject", "<p>Body</p>", recipients)
+
+        self.assertEqual(self.server.connections, 3)
+
+    def test_takes_envelopes_from_a_generator_while_sending(self):
+        taken = []
+
+        def envelopes():
+            for i in range(5):
+                # Every envelope is only taken once the one before it was sent
+                self.assertEqual(len(self.server.messages), len(taken))
+                taken.append(i)
+                yield f"recipient{i}@example.com", "Subject: Test\r\n\r\nBody"
+
+        results = self.create_delivery(pool_size=1).deliver(envelopes())
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(self.server.messages), 5)
+
+    def test_reports_every_result_as_soon_as_it_is_known(self):
+        reported = []
+
+        def on_result(recipient, result):
+            # The message was sent before the delivery is over
+            self.assertEqual(len(self.server.messages), len(reported) + (result == SENT))
+            reported.append((recipient, result))
+
+        results = self.create_delivery(pool_size=1).deliver(
+            [(recipient, "Subject: Test\r\n\r\nBody") for recipient in ("a@example.com", "unknown@example.com")],
+            on_result)
+
+        self.assertEqual(dict(reported), results)
+        self.assertEqual(len(reported), 2)
+
+    def test_reports_rejected_recipients(self):
+        results = self.create_delivery().send("Subject", "<p>Body</p>", ["a@example.com", "unknown@example.com"])
+
+        self.assertEqual(results["a@example.com"], SENT)
+        self.assertIn("550", results["unknown@example.com"])
+
+    def test_rate_limit(self):
+        started = time.monotonic()
+
+        self.create_delivery(max_messages_per_second=20).send(
+            "Subject", "<p>Body</p>", [f"recipient{i}@example.com" for i in range(5)])
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_warm_up_connection_is_reused(self):
+        delivery = self.create_delivery(pool_size=1)
+        delivery.warm_up()
+        self.assertEqual(self.server.connections, 1)
+
+        results = delivery.send("Subject", "<p>Body</p>", ["a@example.com", "b@example.com"])
+
+        self.assertEqual(results, {"a@example.com": SENT, "b@example.com": SENT})
+        self.assertEqual(self.server.connections, 1)
+
+    def test_close_releases_unused_warm_up_connection(self):
+        connection = MagicMock()
+        delivery = MailDelivery(lambda: connection, "sender@example.com", "password")
+        delivery.warm_up()
+
+        delivery.close()
+
+        connection.__enter__.return_value.login.assert_called_once_with("sender@example.com", "password")
+        connection.__exit__.assert_called_once()
+
+    def test_message_is_retried_once_on_a_new_connection(self):
+        broken = MagicMock()
+        broken.__enter__.return_value.sendmail.side_effect = smtplib.SMTPServerDisconnected("Connection lost")
+        connections = [broken]
+
+        def connection_factory():
+            return connections.pop() if connections else smtplib.SMTP("127.0.0.1", self.server.port)
+
+        delivery = MailDelivery(connection_factory, "sender@example.com", "password", pool_size=1)
+        results = delivery.send("Subject", "<p>Body</p>", ["a@example.com", "b@example.com"])
+
+        self.assertEqual(results, {"a@example.com": SENT, "b@example.com": SENT})
+
+    def test_dead_warm_up_connection_is_replaced(self):
+        delivery = self.create_delivery(pool_size=1)
+        delivery.warm_up()
+        _, server = delivery.warm_connections.queue[0]
+        # Like a server that dropped the idle connection
+        server.sock.shutdown(socket.SHUT_RDWR)
+
+        results = delivery.send("Subject", "<p>Body</p>", ["a@example.com"])
+
+        self.assertEqual(results, {"a@example.com": SENT})
+        self.assertEqual(self.server.connections, 2)
+
+    def test_message_fails_if_the_retry_fails_as_well(self):
+        broken = MagicMock()
+        broken.__enter__.return_value.sendmail.side_effect = smtplib.SMTPServerDisconnected("Connection lost")
+
+        delivery = MailDelivery(lambda: broken, "sender@example.com", "password", pool_size=1)
+        results = delivery.send("Subject", "<p>Body</p>", ["a@example.com", "b@example.com"])
+
+        self.assertIn("Connection lost", results["a@example.com"])
+        self.assertIn("Connection lost", results["b@example.com"])
+        self.assertEqual(broken.__enter__.return_value.sendmail.call_count, 4)
+
+    def test_worker_without_connection_leaves_the_rest_to_the_others(self):
+        attempts = []
+        lock = threading.Lock()
+
+        def connection_factory():
+            with lock:
+                attempts.append(None)
+                if len(attempts) == 1:
+                    raise ConnectionRefusedError("Connection refused")
+            return smtplib.SMTP("127.0.0.1", self.server.port)
+
+        delivery = MailDelivery(connection_factory, "sender@example.com", "password", pool_size=2)
+        results = delivery.send("Subject", "<p>Body</p>", [f"recipient{i}@example.com" for i in range(10)])
+
+        self.assertEqual(list(results.values()).count(SENT), 9)
+        self.assertEqual(len(self.server.messages), 9)
+
+    def test_failed_login_fails_all_messages_at_once(self):
+        connection = MagicMock()
+        connection.__enter__.return_value.login.side_effect = smtplib.SMTPAuthenticationError(535, b"Bad credentials")
+
+        delivery = MailDelivery(lambda: connection, "sender@example.com", "password", pool_size=1)
+        results = delivery.send("Subject", "<p>Body</p>", [f"recipient{i}@example.com" for i in range(10)])
+
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all("Bad credentials" in result for result in results.values()))
+        connection.__enter__.return_value.login.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import time
+import unittest
+from page_cache import PageCache
+
+
+class TestPageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = PageCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_and_lookup(self):
+        self.cache.store("https://example.com", "<p>Grüße</p>", etag='"abc"', last_modified="Sat, 18 Oct 2026 06:00:00 GMT")
+
+        entry = self.cache.lookup("https://example.com")
+
+        self.assertEqual(entry["body"], "<p>Grüße</p>")
+        self.assertEqual(self.cache.conditional_headers(entry), {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Sat, 18 Oct 2026 06:00:00 GMT",
+        })
+
+    def test_pages_without_validators_are_not_stored(self):
+        self.cache.store("https://example.com", "<p>Body</p>")
+
+        self.assertIsNone(self.cache.lookup("https://example.com"))
+        self.assertEqual(self.cache.conditional_headers(None), {})
+
+    def test_expired_snapshot_is_removed(self):
+        self.cache.max_age = 0
+        self.cache.store("https://example.com", "<p>Body</p>", etag='"abc"')
+        time.sleep(0.01)
+
+        self.assertIsNone(self.cache.lookup("https://example.com"))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_oldest_snapshots_are_evicted_above_max_bytes(self):
+        self.cache.store("https://example.com/1", "1" * 1000, etag='"1"')
+        time.sleep(0.01)
+        single_size = sum(os.path.getsize(os.path.join(self.directory.name, name))
+                          for name in os.listdir(self.directory.name) if name.endswith(".gz"))
+        self.cache.max_bytes = single_size
+        self.cache.store("https://example.com/2", "2" * 1000, etag='"2"')
+
+        self.assertIsNone(self.cache.lookup("https://example.com/1"))
+        self.assertEqual(self.cache.lookup("https://example.com/2")["body"], "2" * 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
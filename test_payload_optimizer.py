@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from email_body_builder import EmailBodyBuilder
+from payload_optimizer import ImageCache, embed_images, minify_css, minify_html, optimize_email
+
+
+class TestPayloadOptimizer(unittest.TestCase):
+
+    def test_minify_html_strips_markup_that_does_not_render(self):
+        document = """<html><head><style>
+              .used { color: red; } /* comment */
+              .unused { color: blue; }
+            </style></head>
+            <body>
+              <!-- comment -->
+              <div class="used other" itemprop="image" data-id="1" id="x">
+                <a href="https://example.com/?a=1&amp;b=2">Link</a>
+                <span style="font-weight: bold">5</span>
+                <span>(2 reviews)</span>
+                <script>alert("x")</script>
+                <div style="display:none"><button>Share</button></div>
+                <img alt="Cover" class="product-image" src="/cover.jpg"></img>
+              </div>
+            </body></html>"""
+
+        self.assertEqual(
+            minify_html(document),
+            '<html><head><style>.used{color:red}</style></head><body><div class="used">'
+            '<a href="https://example.com/?a=1&amp;b=2">Link</a> <span style="font-weight: bold">5</span> '
+            '<span>(2 reviews)</span> '
+            '<img alt="Cover" src="/cover.jpg"></div></body></html>')
+
+    def test_minify_html_keeps_the_details_line_as_it_is(self):
+        document = '<body>\n  <p/>\n  <textarea rows="5">Title\tAuthor  &amp;  Co\n</textarea>\n</body>'
+
+        self.assertEqual(minify_html(document), '<body><p/><textarea rows="5">Title\tAuthor  &amp;  Co\n</textarea></body>')
+
+    def test_minify_css_keeps_rules_of_used_classes_and_tags(self):
+        stylesheet = "th, td { padding: 8px; } tr:hover { color: red; } .a .b { margin: 0; } ul { margin: 0; }"
+
+        self.assertEqual(minify_css(stylesheet, {"a"}, {"td", "tr"}), "td{padding:8px}tr:hover{color:red}")
+
+    def test_optimized_email_keeps_the_book(self):
+        with open("test_website_data.html", "r", encoding="utf-8") as f:
+            email_body = EmailBodyBuilder(openai_client=None).get_email_body(f.read())
+
+        optimized, images = optimize_email(email_body)
+
+        self.assertEqual(images, [])
+        self.assertLess(len(optimized), len(email_body) / 2)
+        self.assertIn("<h3>Free eBook - Mastering Scientific Computing with R</h3>", optimized)
+        self.assertIn('<div class="product-info__rating">', optimized)
+        self.assertIn("<td>Mastering Scientific Computing with R</td>", optimized)
+        self.assertNotIn("Add to playlist", optimized)
+        self.assertNotIn("itemprop", optimized)
+
+    def test_embed_images_attaches_every_url_once(self):
+        fetched = []
+
+        def fetch(url):
+            fetched.append(url)
+            if "missing" in url:
+                raise OSError("404")
+            return b"GIF89a", "image/gif"
+
+        document = ('<img src="https://example.com/star.png"><img src="https://example.com/star.png">'
+                    '<img src="https://example.com/cover.gif"><img src="https://example.com/missing.png">'
+                    '<img src="cid:already-attached">')
+
+        with patch("builtins.print"):
+            embedded, images = embed_images(document, fetch)
+
+        self.assertEqual(sorted(fetched), ["https://example.com/cover.gif", "https://example.com/missing.png",
+                                           "https://example.com/star.png"])
+        self.assertEqual(embedded, '<img src="cid:image0@packt-reminder"><img src="cid:image0@packt-reminder">'
+                                   '<img src="cid:image1@packt-reminder"><img src="https://example.com/missing.png">'
+                                   '<img src="cid:already-attached">')
+        self.assertEqual(images, [("image0@packt-reminder", b"GIF89a", "gif"), ("image1@packt-reminder", b"GIF89a", "gif")])
+
+    def test_embed_images_uses_the_image_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ImageCache(os.path.join(directory, "images"))
+            document = '<img src="https://example.com/cover.gif">'
+
+            _, first = embed_images(document, lambda url: (b"GIF89a", None), cache)
+            _, second = embed_images(document, lambda url: self.fail("fetched again"), cache)
+
+        self.assertEqual(first, [("image0@packt-reminder", b"GIF89a", "gif")])
+        self.assertEqual(second, first)
+
+    def test_svg_images_keep_their_remote_url(self):
+        fetched = []
+
+        def fetch(url):
+            fetched.append(url)
+            return b"<svg/>", "image/svg+xml"
+
+        document = '<img src="https://example.com/star.svg"><img src="https://example.com/badge">'
+        embedded, images = embed_images(document, fetch)
+
+        self.assertEqual(embedded, document)
+        self.assertEqual(images, [])
+        self.assertEqual(fetched, ["https://example.com/badge"])
+
+
+if __name__ == "__main__":
+    unittest.main()
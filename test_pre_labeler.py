@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from labeler import Labeler
+from pre_labeler import PreLabeler, evaluate, tokenize
+
+HISTORY = [
+    ("Learn Java 17", "Build applications with Java, the JVM and Spring", "Java"),
+    ("Java Coding Problems", "Solve everyday problems with modern Java", "Java"),
+    ("Modern Java in Action", "Streams, lambdas and the Java module system", "Java"),
+    ("Kubernetes in Production", "Run and scale Kubernetes clusters", "Kubernetes, DevOps"),
+    ("The Kubernetes Workshop", "Deploy containers on Kubernetes", "Kubernetes, DevOps"),
+    ("Python for Data Analysis", "Analyse data with pandas and Python", "Python, Data Analysis"),
+    ("Machine Learning with Python", "Train models with scikit-learn and Python", "Python, Machine Learning"),
+]
+
+
+class TestPreLabeler(unittest.TestCase):
+
+    def setUp(self):
+        self.pre_labeler = PreLabeler().fit(HISTORY)
+
+    def test_tokenize_drops_stop_words_and_keeps_language_names(self):
+        self.assertEqual(tokenize("Learn C# and C++ for Beginners"), ["c#", "c++", "beginners"])
+
+    def test_confident_for_an_obvious_book(self):
+        self.assertEqual(self.pre_labeler.get_labels("Learn Java 21", "The new features of Java 21"), "Java")
+        self.assertEqual(self.pre_labeler.stats(), {"predictions": 1, "skipped": 1, "skip_rate": 1.0})
+
+    def test_defers_when_the_neighbours_disagree_or_nothing_matches(self):
+        labels, confidence = self.pre_labeler.predict("Python in Production", "Data, models and Kubernetes")
+
+        self.assertLess(confidence, 0.8)
+        self.assertIsNone(self.pre_labeler.get_labels("Python in Production", "Data, models and Kubernetes"))
+        self.assertIsNone(self.pre_labeler.get_labels("Quantum Computing", "Qubits and gates"))
+        self.assertEqual(self.pre_labeler.stats()["skipped"], 0)
+
+    def test_single_weak_neighbour_is_not_trusted(self):
+        history = [("Rust in Action", "Systems programming with Rust and Cargo", "Rust"),
+                   ("Learn Go", "Concurrency with goroutines", "Go"),
+                   ("Kubernetes in Production", "Run and scale Kubernetes clusters", "Kubernetes")]
+        book = ("Embedded Systems", "Systems programming on microcontrollers")
+
+        self.assertEqual(PreLabeler(min_votes=0).fit(history).predict(*book), ("Rust", 1.0))
+        self.assertEqual(PreLabeler().fit(history).predict(*book), ("Rust", 0.0))
+
+    def test_guessed_labels_are_not_learned_from_the_catalog(self):
+        from catalog import Catalog
+        from book_record import BookRecord
+        catalog = Catalog(":memory:")
+        catalog.record(BookRecord(title="Learn Java 17", author="A", description="Java and the JVM"), "Java")
+        catalog.record(BookRecord(title="Java 21 Recipes", author="B", description="Java"), "Kotlin", guessed=True)
+
+        pre_labeler = PreLabeler.from_catalog(catalog)
+        catalog.close()
+
+        self.assertEqual(pre_labeler.labels, ["Java"])
+
+    def test_labeler_remembers_guessed_books(self):
+        labeler = Labeler(None, pre_labeler=self.pre_labeler)
+
+        with patch("builtins.print"):
+            labeler.get_labels("Learn Java 21", "Author", "The new features of Java 21")
+            labeler.get_labels("Quantum Computing", "Author", "Qubits and gates")
+
+        self.assertEqual(labeler.guessed_titles, {"Learn Java 21"})
+
+    def test_evaluate_reports_skip_rate_and_agreement(self):
+        history = HISTORY + [("Java Memory Management", "Garbage collection in the Java JVM", "Java"),
+                             ("Quantum Computing", "Qubits and gates", "Quantum Computing")]
+
+        result = evaluate(history, holdout=0.2)
+
+        self.assertEqual(result, {"held_out": 2, "skip_rate": 0.5, "agreement": 1.0, "partial_agreement": 1.0})
+
+    def test_labeler_skips_openai_for_confident_guesses(self):
+        openai_client = MagicMock()
+        openai_client.chat.completions.create.return_value.choices[0].message.content = "Quantum Computing"
+        labeler = Labeler(openai_client, pre_labeler=self.pre_labeler)
+
+        with patch("builtins.print"):
+            self.assertEqual(labeler.get_labels("Learn Java 21", "Author", "The new features of Java 21"), "Java")
+            openai_client.chat.completions.create.assert_not_called()
+            self.assertEqual(labeler.get_labels("Quantum Computing", "Author", "Qubits and gates"), "Quantum Computing")
+            openai_client.chat.completions.create.assert_called_once()
+
+    def test_labeler_uses_guesses_without_openai_client(self):
+        labeler = Labeler(None, pre_labeler=self.pre_labeler)
+
+        with patch("builtins.print"):
+            self.assertEqual(labeler.get_labels_batch([("Learn Java 21", "Author", "Java 21"),
+                                                       ("Quantum Computing", "Author", "Qubits")]), ["Java", ""])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from product_block_detector import ProductBlockDetector
+
+
+class TestProductBlockDetector(unittest.TestCase):
+
+    def test_completes_when_main_product_closes(self):
+        detector = ProductBlockDetector()
+        detector.feed("<html><body><div class=\"product__info\"><div class=\"grid main-product\">")
+        detector.feed("<div class=\"row\"><h3>Title</h3></div>")
+        self.assertFalse(detector.complete)
+        detector.feed("</div>")
+        self.assertTrue(detector.complete)
+
+    def test_ignores_main_product_outside_of_product_info(self):
+        detector = ProductBlockDetector()
+        detector.feed("<div class=\"main-product\"><p>Teaser</p></div>")
+        self.assertFalse(detector.complete)
+
+    def test_handles_tags_split_across_chunks(self):
+        with open("test_website_data.html", "r", encoding="utf-8") as file:
+            website_content = file.read()
+
+        detector = ProductBlockDetector()
+        position = 0
+        while not detector.complete and position < len(website_content):
+            detector.feed(website_content[position:position + 1000])
+            position += 1000
+
+        self.assertTrue(detector.complete)
+        self.assertLess(position, len(website_content))
+        self.assertIn("Mastering Scientific Computing with R", website_content[:position])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from book_record import BookRecord
+from reminder_daemon import ReminderDaemon, fingerprint
+
+
+class TestReminderDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.directory.name, "state.json")
+        self.pages = []
+        self.sent = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_daemon(self, fail_sending=False):
+        async def poll():
+            return self.pages.pop(0)
+
+        async def on_change(books):
+            if fail_sending:
+                raise ConnectionError("SMTP down")
+            self.sent.append(books)
+
+        return ReminderDaemon(poll, on_change, self.state_path, interval=0, jitter=0)
+
+    def test_sends_only_when_the_books_change(self):
+        first = [BookRecord(title="First", snippet="<div>First</div>")]
+        second = [BookRecord(title="Second", snippet="<div>Second</div>")]
+        self.pages = [first, list(first), second, list(second)]
+
+        daemon = self.create_daemon()
+        asyncio.run(daemon.run(max_polls=4))
+
+        self.assertEqual(self.sent, [first, second])
+        self.assertEqual((daemon.polls, daemon.changes), (4, 2))
+
+    def test_state_survives_a_restart(self):
+        book = [BookRecord(title="First", snippet="<div>First</div>")]
+        self.pages = [book, book]
+
+        asyncio.run(self.create_daemon().run(max_polls=1))
+        asyncio.run(self.create_daemon().run(max_polls=1))
+
+        self.assertEqual(len(self.sent), 1)
+
+    def test_failed_send_is_retried_on_next_poll(self):
+        book = [BookRecord(title="First", snippet="<div>First</div>")]
+        self.pages = [book, book]
+
+        asyncio.run(self.create_daemon(fail_sending=True).run(max_polls=1))
+        asyncio.run(self.create_daemon().run(max_polls=1))
+
+        self.assertEqual(self.sent, [book])
+
+    def test_fingerprint_ignores_fields_outside_the_snippet(self):
+        self.assertEqual(fingerprint([BookRecord(title="A", snippet="<div>X</div>")]),
+                         fingerprint([BookRecord(title="B", snippet="<div>X</div>")]))
+        self.assertNotEqual(fingerprint([BookRecord(snippet="<div>X</div>")]),
+                            fingerprint([BookRecord(snippet="<div>Y</div>")]))
+
+    def test_delay_with_jitter(self):
+        daemon = ReminderDaemon(None, None, self.state_path, interval=600, jitter=60)
+
+        with patch("random.uniform", return_value=-60):
+            self.assertEqual(daemon.next_delay(), 540)
+
+
+if __name__ == "__main__":
+    unittest.main()
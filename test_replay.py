@@ -0,0 +1,87 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from replay import main, replay
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshots = os.path.join(self.directory.name, "snapshots")
+        self.output = os.path.join(self.directory.name, "replay.jsonl")
+        os.makedirs(os.path.join(self.snapshots, "2024-05-02"))
+        with open("test_website_data.html", "r", encoding="utf-8") as f:
+            self.page = f.read()
+        shutil.copy("test_website_data.html", os.path.join(self.snapshots, "2024-05-01.html"))
+        with gzip.open(os.path.join(self.snapshots, "2024-05-02", "page.html.gz"), "wt", encoding="utf-8") as f:
+            f.write(self.page)
+        with open(os.path.join(self.snapshots, "redesign.html"), "w", encoding="utf-8") as f:
+            f.write('<html><div class="product__info"><h3>New markup</h3></div></html>')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def records(self):
+        with open(self.output, encoding="utf-8") as f:
+            return {os.path.relpath(record["path"], self.snapshots): record for record in map(json.loads, f)}
+
+    def test_replay_extracts_fields_and_flags_missing_ones(self):
+        summary = replay(self.snapshots, self.output, workers=1)
+        records = self.records()
+
+        self.assertEqual(summary["replayed"], 3)
+        self.assertEqual(summary["missing"], {field: 1 for field in ("title", "author", "publication_year",
+                                                                     "description", "snippet")})
+        self.assertEqual(records["2024-05-01.html"]["title"], "Mastering Scientific Computing with R")
+        self.assertEqual(records["2024-05-01.html"]["missing"], [])
+        self.assertGreater(records["2024-05-01.html"]["parse_ms"], 0)
+        self.assertEqual(records[os.path.join("2024-05-02", "page.html.gz")]["title"],
+                         "Mastering Scientific Computing with R")
+        self.assertIn("title", records["redesign.html"]["missing"])
+
+    def test_rerun_only_replays_changed_snapshots(self):
+        replay(self.snapshots, self.output, workers=1)
+        self.assertEqual(replay(self.snapshots, self.output, workers=1)["skipped"], 3)
+
+        with open(os.path.join(self.snapshots, "redesign.html"), "w", encoding="utf-8") as f:
+            f.write(self.page)
+        summary = replay(self.snapshots, self.output, workers=1)
+
+        self.assertEqual((summary["replayed"], summary["skipped"]), (1, 2))
+        self.assertEqual(summary["missing"], {})
+        self.assertEqual(len(self.records()), 3)
+        self.assertEqual(replay(self.snapshots, self.output, parser="full", workers=1)["replayed"], 3)
+        self.assertEqual(replay(self.snapshots, self.output, parser="full", workers=1, force=True)["replayed"], 3)
+
+    def test_changed_extraction_code_replays_all_snapshots(self):
+        replay(self.snapshots, self.output, workers=1)
+
+        with patch("replay.extractor_version", return_value="changed"):
+            self.assertEqual(replay(self.snapshots, self.output, workers=1)["replayed"], 3)
+            self.assertEqual(replay(self.snapshots, self.output, workers=1)["skipped"], 3)
+        self.assertEqual(replay(self.snapshots, self.output, workers=1)["replayed"], 3)
+
+    def test_process_pool_gives_the_same_results(self):
+        replay(self.snapshots, self.output, workers=1)
+        in_process = self.records()
+
+        summary = replay(self.snapshots, self.output, workers=2, force=True)
+        in_pool = self.records()
+
+        self.assertEqual(summary["replayed"], 3)
+        for record in list(in_process.values()) + list(in_pool.values()):
+            record.pop("parse_ms")
+        self.assertEqual(in_pool, in_process)
+
+    def test_strict_fails_on_missing_fields(self):
+        with self.assertRaises(SystemExit):
+            main([self.snapshots, "--output", self.output, "--workers", "1", "--strict"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import smtplib
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch, MagicMock
+from book_record import BookRecord
+from mail_delivery import SENT
+from run_checkpoint import Outbox, RunCheckpoint, pending_outboxes
+from run_reminder import drain_outboxes, main
+
+
+class TestRunCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @staticmethod
+    def deliver_all(envelopes, on_result, failed=()):
+        results = {}
+        for recipient, _ in envelopes:
+            results[recipient] = "failed: 550" if recipient in failed else SENT
+            on_result(recipient, results[recipient])
+        return results
+
+    def test_checkpoints_survive_a_new_run(self):
+        book = BookRecord(title="Learn Java 21", description="Java for everyone")
+        checkpoint = RunCheckpoint(self.root, date(2024, 5, 1))
+        checkpoint.save_page("<html>Ümlaut</html>")
+        checkpoint.save_books([book])
+        checkpoint.save_entries([(book, "Java", "01.05.2024")])
+
+        resumed = RunCheckpoint(self.root, date(2024, 5, 1))
+
+        self.assertEqual(resumed.load_page(), "<html>Ümlaut</html>")
+        self.assertEqual(resumed.load_books()[0].title, "Learn Java 21")
+        self.assertEqual([(b.description, labels, d) for b, labels, d in resumed.load_entries()],
+                         [("Java for everyone", "Java", "01.05.2024")])
+        self.assertIsNone(RunCheckpoint(self.root, date(2024, 5, 2)).load_books())
+
+    def test_outbox_never_spools_a_recipient_twice(self):
+        outbox = Outbox(os.path.join(self.root, "outbox"))
+        build = MagicMock(return_value="message")
+
+        self.assertEqual(outbox.put_many([("a@example.com", build), ("b@example.com", "message")]), 2)
+        outbox.drain(self.deliver_all)
+
+        self.assertEqual(outbox.put_many([("A@example.com ", build), ("c@example.com", "message")]), 1)
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual([recipient for _, recipient, _ in outbox.pending()], ["c@example.com"])
+
+    def test_drain_keeps_failed_messages_for_a_retry(self):
+        outbox = Outbox(os.path.join(self.root, "2024-05-01", "outbox"))
+        outbox.put_many([("a@example.com", "first"), ("b@example.com", "second")])
+        outbox.seal()
+
+        outbox.drain(lambda envelopes, on_result: self.deliver_all(envelopes, on_result, failed={"b@example.com"}))
+
+        self.assertFalse(outbox.complete)
+        self.assertEqual(len(pending_outboxes(self.root)), 1)
+        delivered = []
+
+        def deliver(envelopes, on_result):
+            delivered.extend(envelopes)
+            return self.deliver_all(delivered, on_result)
+
+        pending_outboxes(self.root)[0].drain(deliver)
+        self.assertEqual(delivered, [("b@example.com", "second")])
+        self.assertTrue(outbox.complete)
+        self.assertEqual(pending_outboxes(self.root), [])
+
+    def test_interrupted_drain_keeps_what_was_sent(self):
+        outbox = Outbox(os.path.join(self.root, "outbox"))
+        outbox.put_many([("a@example.com", "first"), ("b@example.com", "second"), ("c@example.com", "third")])
+
+        sent = []
+
+        def deliver(envelopes, on_result):
+            for recipient, _ in envelopes:
+                if len(sent) == 2:
+                    raise TimeoutError("deadline exceeded")
+                sent.append(recipient)
+                on_result(recipient, SENT)
+
+        with self.assertRaises(TimeoutError):
+            outbox.drain(deliver)
+
+        # The drain was interrupted at the third message; the two before it aren't sent again
+        self.assertEqual(len([key for key, _, _ in outbox.pending()]), 1)
+        self.assertNotIn(next(outbox.pending())[1], sent)
+
+    @patch("run_reminder.load_dotenv")
+    def test_drain_outboxes_needs_the_checkpoint_dir(self, _):
+        with patch.dict(os.environ), self.assertRaisesRegex(RuntimeError, "CHECKPOINT_DIR"):
+            os.environ.pop("CHECKPOINT_DIR", None)
+            drain_outboxes()
+
+    @patch("smtplib.SMTP_SSL")
+    @patch("openai.OpenAI")
+    @patch("requests.get")
+    def test_rerun_resumes_without_fetching_labelling_or_sending_twice(self, mock_requests_get, mock_openai,
+                                                                      mock_smtp_ssl):
+        with open("test_website_data.html", "r", encoding="utf-8") as f:
+            mock_requests_get.return_value = MagicMock(text=f.read())
+        create = mock_openai.return_value.chat.completions.create
+        create.return_value.choices[0].message.content = "R, Scientific Computing"
+        server = mock_smtp_ssl.return_value.__enter__.return_value
+        server.sendmail.side_effect = smtplib.SMTPDataError(451, "try again later")
+        environment = {"CHECKPOINT_DIR": self.root, "RECIPIENT_EMAIL": "a@example.com, b@example.com",
+                       "GMAIL_USERNAME": "testuser@gmail.com", "GMAIL_APP_PASSWORD": "testpassword",
+                       "OPENAI_API_KEY": "test_openai_api_key", "OPENAI_BREAKER_PATH": os.path.join(self.root, "b.json")}
+
+        with patch.dict(os.environ, environment), patch("run_reminder.load_dotenv"):
+            with self.assertRaises(RuntimeError):
+                main()
+            self.assertEqual(mock_requests_get.call_count, 1)
+            self.assertEqual(create.call_count, 1)
+
+            server.sendmail.side_effect = None
+            main()
+            main()
+
+        self.assertEqual(mock_requests_get.call_count, 1)
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(server.sendmail.call_count, 4)
+        self.assertEqual(sorted(call.args[1] for call in server.sendmail.call_args_list[2:]),
+                         ["a@example.com", "b@example.com"])
+        self.assertIn("Mastering Scientific Computing with R", server.sendmail.call_args.args[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
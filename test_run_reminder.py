@@ -1,8 +1,15 @@
 import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 import smtplib
-from run_reminder import fetch_website_content, send_email_via_gmail, main
+import asyncio
+from run_reminder import fetch_website_content, send_email_via_gmail, main, run_daemon, create_email_builder, \
+    record_async, send_digest, fetch_image, positive_int, label_books
+import threading
+import argparse
+import deadline
+from page_cache import PageCache
 from requests.exceptions import RequestException, ConnectionError, Timeout
 import requests
 from tenacity import RetryError
@@ -51,6 +58,16 @@ class TestRunReminder(unittest.TestCase):
         )
         self.assertEqual(mock_get.call_count, 3)
 
+    @patch("time.sleep")
+    @patch("requests.get")
+    def test_fetch_website_content_waits_for_the_rate_limiter_before_every_attempt(self, mock_get, _):
+        mock_get.side_effect = [ConnectionError("Connection failed"), MagicMock(text="Success HTML")]
+        rate_limiter = MagicMock()
+
+        self.assertEqual(fetch_website_content("http://example.com", rate_limiter=rate_limiter), "Success HTML")
+
+        self.assertEqual(rate_limiter.wait.call_count, 2)
+
     @patch("requests.get")
     def test_fetch_website_content_no_retry_on_non_request_exception(self, mock_get):
         """Tests that fetch_website_content does not retry on non-RequestException."""
@@ -79,6 +96,100 @@ class TestRunReminder(unittest.TestCase):
         self.assertEqual(result, "Success HTML")
         self.assertEqual(mock_get.call_count, 3)
 
+    @patch("requests.get")
+    def test_fetch_website_content_stream_stops_after_product_block(self, mock_get):
+        """Tests that the streaming fetch closes the connection once the product block is complete."""
+        with open("test_website_data.html", "rb") as f:
+            page = f.read()
+
+        mock_response = mock_get.return_value.__enter__.return_value
+        mock_response.encoding = "utf-8"
+        mock_response.raise_for_status.return_value = None
+        mock_response.iter_content.return_value = (
+            page[i:i + 4096] for i in range(0, len(page), 4096)
+        )
+
+        content = fetch_website_content("http://example.com", stream=True)
+
+        mock_get.assert_called_once_with("http://example.com", stream=True)
+        mock_get.return_value.__exit__.assert_called_once()
+        self.assertLess(len(content), len(page))
+        self.assertIn("Mastering Scientific Computing with R", content)
+        self.assertTrue(page.decode("utf-8").startswith(content))
+
+    @patch("requests.get")
+    def test_fetch_website_content_stream_falls_back_to_whole_page(self, mock_get):
+        """Tests that the streaming fetch reads everything when the product block never shows up."""
+        page = "<html><body><div class=\"other\">Grüße</div></body></html>".encode("utf-8")
+
+        mock_response = mock_get.return_value.__enter__.return_value
+        mock_response.encoding = None
+        mock_response.raise_for_status.return_value = None
+        # Split inside the multi-byte 'ü'
+        split = page.index("ü".encode("utf-8")) + 1
+        mock_response.iter_content.return_value = iter([page[:split], page[split:]])
+
+        content = fetch_website_content("http://example.com", stream=True)
+
+        self.assertEqual(content, page.decode("utf-8"))
+
+    @patch("requests.get")
+    def test_fetch_website_content_stream_retries_on_request_exception(self, mock_get):
+        """Tests that the streaming fetch keeps the retry semantics."""
+        success = MagicMock()
+        success.__enter__.return_value.encoding = "utf-8"
+        success.__enter__.return_value.iter_content.return_value = iter([b"<p>Done</p>"])
+        mock_get.side_effect = [Timeout("Timeout 1"), success]
+
+        content = fetch_website_content("http://example.com", stream=True)
+
+        self.assertEqual(content, "<p>Done</p>")
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("requests.get")
+    def test_fetch_website_content_serves_cached_snapshot_on_304(self, mock_get):
+        """Tests that a cached page is revalidated with a conditional GET and reused on 304."""
+        first_response = MagicMock(status_code=200, text="<p>Page</p>", headers={"ETag": '"v1"'})
+        not_modified = MagicMock(status_code=304)
+        mock_get.side_effect = [first_response, not_modified]
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PageCache(directory)
+            self.assertEqual(fetch_website_content("http://example.com", cache=cache), "<p>Page</p>")
+            self.assertEqual(fetch_website_content("http://example.com", cache=cache), "<p>Page</p>")
+
+        self.assertEqual(mock_get.call_args_list[0], unittest.mock.call("http://example.com"))
+        self.assertEqual(
+            mock_get.call_args_list[1],
+            unittest.mock.call("http://example.com", headers={"If-None-Match": '"v1"'}),
+        )
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+    @patch("requests.get")
+    def test_fetch_website_content_refreshes_cache_on_change(self, mock_get):
+        """Tests that a changed page replaces the cached snapshot."""
+        mock_get.side_effect = [
+            MagicMock(status_code=200, text="<p>Old</p>", headers={"ETag": '"v1"'}),
+            MagicMock(status_code=200, text="<p>New</p>", headers={"ETag": '"v2"'}),
+        ]
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PageCache(directory)
+            fetch_website_content("http://example.com", cache=cache)
+            self.assertEqual(fetch_website_content("http://example.com", cache=cache), "<p>New</p>")
+            self.assertEqual(cache.lookup("http://example.com")["etag"], '"v2"')
+
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 2})
+
+    @patch("openai.OpenAI")
+    def test_create_email_builder_without_openai_api_key(self, mock_openai):
+        del os.environ["OPENAI_API_KEY"]
+
+        email_builder = create_email_builder()
+
+        mock_openai.assert_not_called()
+        self.assertIsNone(email_builder.labeler.openai_client)
+
     @patch("smtplib.SMTP_SSL")
     def test_send_email_via_gmail(self, mock_smtp_ssl):
         """
@@ -108,10 +219,37 @@ class TestRunReminder(unittest.TestCase):
         self.assertIn("Test Subject", args[2])  # Subject should be in msg
         self.assertIn("Test Body", args[2])  # Body should be in msg
 
-    @patch("run_reminder.OpenAI")  # Mock the OpenAI client
+    @patch("smtplib.SMTP_SSL")
+    def test_send_email_via_gmail_to_several_recipients(self, mock_smtp_ssl):
+        """Tests that a comma-separated RECIPIENT_EMAIL sends one message per recipient."""
+        os.environ["RECIPIENT_EMAIL"] = "first@example.com, second@example.com"
+        os.environ["SMTP_POOL_SIZE"] = "1"
+        try:
+            send_email_via_gmail(subject="Test Subject", html_body="<p>Test Body</p>")
+        finally:
+            del os.environ["SMTP_POOL_SIZE"]
+
+        # One pooled connection with a single login serves both recipients
+        mock_smtp_ssl.assert_called_once()
+        mock_server = mock_smtp_ssl.return_value.__enter__.return_value
+        mock_server.login.assert_called_once()
+        recipients = [call.args[1] for call in mock_server.sendmail.call_args_list]
+        self.assertEqual(recipients, ["first@example.com", "second@example.com"])
+
+    @patch("smtplib.SMTP_SSL")
+    def test_send_email_via_gmail_raises_on_failed_recipient(self, mock_smtp_ssl):
+        """Tests that a failed delivery still fails the run."""
+        mock_smtp_ssl.return_value.__enter__.return_value.login.side_effect = smtplib.SMTPAuthenticationError(
+            535, b"Bad credentials")
+
+        with self.assertRaises(RuntimeError):
+            send_email_via_gmail(subject="Test Subject", html_body="<p>Test Body</p>")
+
+    @patch("smtplib.SMTP_SSL")  # main opens the SMTP connection in advance
+    @patch("openai.OpenAI")  # Mock the OpenAI client
     @patch("run_reminder.send_email_via_gmail")
     @patch("requests.get")
-    def test_main_integration(self, mock_requests_get, mock_send_email, mock_openai):
+    def test_main_integration(self, mock_requests_get, mock_send_email, mock_openai, mock_smtp_ssl):
         """
         Integration test for the main function, where requests is mocked
         to load the HTML from a file, and send_email_via_gmail is mocked
@@ -152,10 +290,239 @@ class TestRunReminder(unittest.TestCase):
             html_body,
         )
 
+        # The SMTP connection was opened and authenticated before sending
+        mock_smtp_ssl.return_value.__enter__.return_value.login.assert_called_once()
+        self.assertIsNotNone(kwargs.get("delivery"))
+
         print(html_body)
         # Optional: You can also check that the complete HTML structure is correct
         # by checking other tags/structures.
 
+    def test_digest_days_must_be_positive(self):
+        self.assertEqual(positive_int("7"), 7)
+        with self.assertRaises(argparse.ArgumentTypeError):
+            positive_int("0")
+
+    def test_fetch_image_uses_the_shared_transport_and_the_deadline(self):
+        http = MagicMock()
+        http.get.return_value = MagicMock(content=b"GIF89a", headers={"Content-Type": "image/gif"})
+
+        with deadline.activate(deadline.Deadline(5)):
+            image = fetch_image("https://example.com/cover.gif", http)
+
+        self.assertEqual(image, (b"GIF89a", "image/gif"))
+        self.assertLessEqual(http.get.call_args.kwargs["timeout"], 5)
+
+    @patch("smtplib.SMTP_SSL")
+    @patch("openai.OpenAI")
+    @patch("run_reminder.send_email_via_gmail")
+    @patch("requests.get")
+    def test_main_sends_optimized_email(self, mock_requests_get, mock_send_email, mock_openai, mock_smtp_ssl):
+        """Tests that OPTIMIZE_EMAIL sends the minified email."""
+        with open("test_website_data.html", "r", encoding="utf-8") as f:
+            mock_requests_get.return_value = MagicMock(text=f.read())
+
+        with patch.dict(os.environ, {"OPTIMIZE_EMAIL": "true"}):
+            main()
+
+        kwargs = mock_send_email.call_args.kwargs
+        self.assertIn("<h3>Free eBook - Mastering Scientific Computing with R</h3>", kwargs["html_body"])
+        self.assertNotIn("itemprop", kwargs["html_body"])
+        self.assertEqual(kwargs["images"], [])
+
+    @patch("smtplib.SMTP_SSL")
+    @patch("openai.OpenAI")
+    @patch("requests.get")
+    def test_main_traces_the_stages(self, mock_requests_get, mock_openai, mock_smtp_ssl):
+        """Tests that a traced run writes a span per stage, with the token usage of the labels."""
+        import json
+        from types import SimpleNamespace
+        with open("test_website_data.html", "r", encoding="utf-8") as f:
+            test_html_content = f.read()
+        mock_requests_get.return_value = MagicMock(text=test_html_content, content=test_html_content.encode())
+        mock_openai.return_value.chat.completions.create.return_value = SimpleNamespace(
+            model="fake", usage=SimpleNamespace(prompt_tokens=120, completion_tokens=5, total_tokens=125),
+            choices=[SimpleNamespace(message=SimpleNamespace(content="R, Scientific Computing"))])
+
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "trace.jsonl")
+            prometheus_path = os.path.join(directory, "reminder.prom")
+            with patch.dict(os.environ, {"TRACE_JSON_PATH": json_path, "TRACE_PROMETHEUS_PATH": prometheus_path}):
+                main()
+
+            with open(json_path, encoding="utf-8") as f:
+                spans = {span["span"]: span for span in map(json.loads, f)}
+            with open(prometheus_path, encoding="utf-8") as f:
+                metrics = f.read()
+
+        self.assertEqual(list(spans), ["fetch", "parse", "label", "render", "send"])
+        self.assertEqual(spans["fetch"]["bytes"], len(test_html_content.encode()))
+        self.assertEqual(spans["label"]["prompt_tokens"], 120)
+        self.assertEqual(spans["label"]["completion_tokens"], 5)
+        self.assertEqual(spans["send"]["recipients"], 1)
+        self.assertEqual(len({span["run_id"] for span in spans.values()}), 1)
+        self.assertIn('packt_reminder_stage_prompt_tokens{stage="label"} 120', metrics)
+        self.assertIn('packt_reminder_stage_success{stage="send"} 1', metrics)
+
+    @patch("smtplib.SMTP_SSL")
+    @patch("run_reminder.send_reminder")
+    @patch("run_reminder.create_email_builder")
+    @patch("run_reminder.fetch_books")
+    def test_main_creates_the_email_builder_while_fetching(self, mock_fetch_books, mock_create_email_builder,
+                                                          mock_send_reminder, mock_smtp_ssl):
+        """Tests that the OpenAI client and the label databases are set up while the page is fetched."""
+        builder_created = threading.Event()
+        mock_create_email_builder.side_effect = lambda http: builder_created.set() or MagicMock()
+
+        async def fetch_books(*args):
+            # Only returns once the builder exists, which it wouldn't if it was created after the fetch
+            return ["book"] if await asyncio.to_thread(builder_created.wait, 5) else []
+        mock_fetch_books.side_effect = fetch_books
+
+        main()
+
+        self.assertEqual(mock_send_reminder.call_args.args[0], ["book"])
+
+    def test_books_are_rendered_while_the_next_ones_are_labelled(self):
+        from book_record import BookRecord
+        books = [BookRecord(title="First"), BookRecord(title="Second")]
+        first_rendered = threading.Event()
+        overlapped = []
+
+        def get_labels(book):
+            if book.title == "Second":
+                overlapped.append(first_rendered.wait(5))
+            return f"{book.title} Label"
+
+        class Email:
+            def add(self, book, labels, date):
+                if book.title == "First":
+                    first_rendered.set()
+
+        entries = asyncio.run(label_books(books, MagicMock(get_labels=get_labels), Email()))
+
+        self.assertEqual(overlapped, [True])
+        self.assertEqual([labels for _, labels, _ in entries], ["First Label", "Second Label"])
+
+    @patch("smtplib.SMTP_SSL")
+    @patch("openai.OpenAI")
+    @patch("run_reminder.send_email_via_gmail")
+    @patch("requests.get")
+    def test_digest_is_built_from_the_recorded_days(self, mock_requests_get, mock_send_email, mock_openai,
+                                                    mock_smtp_ssl):
+        """Tests that daily runs only record the book and the digest sends them without fetching or labelling."""
+        from datetime import date, timedelta
+        from book_record import BookRecord
+        from catalog import Catalog
+        with open("test_website_data.html", "r", encoding="utf-8") as f:
+            mock_requests_get.return_value = MagicMock(text=f.read())
+        mock_openai.return_value.chat.completions.create.return_value.choices[0].message.content = "R"
+
+        with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ, {
+            "CATALOG_PATH": os.path.join(directory, "catalog.sqlite"),
+        }):
+            catalog = Catalog(os.environ["CATALOG_PATH"])
+            catalog.record_many([
+                (BookRecord(title="Yesterday's Book", snippet="<div>Yesterday</div>"), "Go", date.today() - timedelta(days=1)),
+                (BookRecord(title="Last Month's Book"), "Java", date.today() - timedelta(days=30)),
+            ])
+            catalog.close()
+
+            asyncio.run(record_async())
+            mock_send_email.assert_not_called()
+            mock_requests_get.reset_mock()
+            mock_openai.reset_mock()
+
+            asyncio.run(send_digest(7))
+
+        mock_requests_get.assert_not_called()
+        mock_openai.return_value.chat.completions.create.assert_not_called()
+        kwargs = mock_send_email.call_args.kwargs
+        self.assertIn("2 Books of the Last 7 Days", kwargs["subject"])
+        self.assertIn("<div>Yesterday</div>", kwargs["html_body"])
+        yesterday = (date.today() - timedelta(days=1)).strftime("%d.%m.%Y")
+        self.assertIn(f">On {yesterday} at PacktPub Free Learning:</a></h2>", kwargs["html_body"])
+        self.assertIn('<h3 class="product-info__title">Free eBook - Mastering Scientific Computing with R</h3>',
+                      kwargs["html_body"])
+        self.assertIn("<td>R</td>", kwargs["html_body"])
+        self.assertNotIn("Last Month's Book", kwargs["html_body"])
+
+    @patch("smtplib.SMTP_SSL")
+    @patch("openai.OpenAI")
+    @patch("run_reminder.send_email_via_gmail")
+    @patch("run_reminder.fetch_sources")
+    def test_main_merges_giveaway_sources(self, mock_fetch_sources, mock_send_email, mock_openai, mock_smtp_ssl):
+        """Tests that the books of all working sources end up in one email."""
+        from book_record import BookRecord
+        mock_fetch_sources.return_value = [
+            (MagicMock(), BookRecord(title="First Book"), None),
+            (MagicMock(), None, ConnectionError("down")),
+            (MagicMock(), BookRecord(title="Second Book"), None),
+        ]
+        os.environ["GIVEAWAY_SOURCES"] = "packt"
+        try:
+            main()
+        finally:
+            del os.environ["GIVEAWAY_SOURCES"]
+
+        html_body = mock_send_email.call_args.kwargs["html_body"]
+        self.assertIn("<td>First Book</td>", html_body)
+        self.assertIn("<td>Second Book</td>", html_body)
+        # The sources are fetched like the Packt page, with retries and the page cache, through one session
+        fetch = mock_fetch_sources.call_args.kwargs["fetch"]
+        self.assertEqual(fetch.func, fetch_website_content)
+        self.assertIsInstance(fetch.keywords["http"], requests.Session)
+
+    def run_daemon_polls(self, polls, recipients):
+        with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ, {
+            "DAEMON_STATE_PATH": os.path.join(directory, "state.json"),
+            "DAEMON_INTERVAL": "0",
+            "DAEMON_JITTER": "0",
+            "CHECKPOINT_DIR": os.path.join(directory, "runs"),
+            "RECIPIENT_EMAIL": recipients,
+        }):
+            asyncio.run(run_daemon(max_polls=polls))
+
+    @patch("smtplib.SMTP_SSL")
+    @patch("openai.OpenAI")
+    @patch("requests.get")
+    def test_run_daemon_sends_once_per_giveaway(self, mock_requests_get, mock_openai, mock_smtp_ssl):
+        """Tests that the daemon polls repeatedly but only sends the unchanged book once."""
+        with open("test_website_data.html", "r", encoding="utf-8") as f:
+            mock_requests_get.return_value = MagicMock(text=f.read())
+        mock_openai.return_value.chat.completions.create.return_value.choices[0].message.content = "R"
+
+        self.run_daemon_polls(3, "recipient@example.com")
+
+        self.assertEqual(mock_requests_get.call_count, 3)
+        server = mock_smtp_ssl.return_value.__enter__.return_value
+        self.assertEqual(server.sendmail.call_count, 1)
+        mock_openai.assert_called_once()
+
+    @patch("smtplib.SMTP_SSL")
+    @patch("openai.OpenAI")
+    @patch("requests.get")
+    def test_run_daemon_retries_only_the_failed_recipients(self, mock_requests_get, mock_openai, mock_smtp_ssl):
+        """Tests that a recipient who failed doesn't make the daemon label and send the book to everyone again."""
+        with open("test_website_data.html", "r", encoding="utf-8") as f:
+            mock_requests_get.return_value = MagicMock(text=f.read())
+        create = mock_openai.return_value.chat.completions.create
+        create.return_value.choices[0].message.content = "R, Scientific Computing"
+        server = mock_smtp_ssl.return_value.__enter__.return_value
+
+        def sendmail(sender, recipient, message):
+            if recipient == "bad@example.com":
+                raise smtplib.SMTPRecipientsRefused({recipient: (550, b"No such user")})
+        server.sendmail.side_effect = sendmail
+
+        with patch("builtins.print"):
+            self.run_daemon_polls(4, "good@example.com, bad@example.com")
+
+        recipients = [call.args[1] for call in server.sendmail.call_args_list]
+        self.assertEqual(recipients.count("good@example.com"), 1)
+        self.assertEqual(recipients.count("bad@example.com"), 4)
+        self.assertEqual(create.call_count, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,79 @@
+import email
+import smtplib
+import unittest
+from unittest.mock import MagicMock
+from book_record import BookRecord
+from email_renderer import render_html, render_text
+from mail_delivery import MailDelivery, SENT
+from smtp_stand_in import SmtpStandIn
+from subscribers import SubscriberStore, fan_out
+
+JAVA = (BookRecord(title="Learn Java 21"), "Java", "01.02.2023")
+KUBERNETES = (BookRecord(title="Kubernetes in Production"), "Kubernetes, DevOps", "01.02.2023")
+
+
+class TestSubscribers(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SubscriberStore(":memory:")
+        self.store.add_many([
+            ("all@example.com", [], [], "html"),
+            ("java@example.com", ["java"], [], "html"),
+            ("ops@example.com", ["Kubernetes", "Docker"], [], "text"),
+            ("no-devops@example.com", [], ["DevOps"], "html"),
+            ("java-not-ops@example.com", ["Java", "Kubernetes"], ["devops"], "html"),
+        ])
+        self.index = self.store.index()
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_route_by_include_and_exclude_rules(self):
+        self.assertEqual(self.index.route("Java"), {"all@example.com", "java@example.com", "no-devops@example.com",
+                                                   "java-not-ops@example.com"})
+        self.assertEqual(self.index.route("Kubernetes, DevOps"), {"all@example.com", "ops@example.com"})
+        self.assertEqual(self.index.route(""), {"all@example.com", "no-devops@example.com"})
+
+    def test_groups_subscribers_who_get_the_same_email(self):
+        groups = self.index.groups([JAVA, KUBERNETES])
+
+        self.assertEqual({key: set(recipients) for key, recipients in groups.items()}, {
+            ("html", (0, 1)): {"all@example.com"},
+            ("html", (0,)): {"java@example.com", "no-devops@example.com", "java-not-ops@example.com"},
+            ("text", (1,)): {"ops@example.com"},
+        })
+
+    def test_fan_out_renders_every_distinct_email_once(self):
+        render = MagicMock(side_effect=lambda format, entries: (
+            (None, render_text(entries), ()) if format == "text" else (render_html(entries), None, ())))
+
+        envelopes = fan_out(self.index, [JAVA, KUBERNETES], "sender@example.com", "Subject", render)
+
+        self.assertEqual(render.call_count, 3)
+        self.assertEqual(len(envelopes), 5)
+        with SmtpStandIn() as server:
+            delivery = MailDelivery(lambda: smtplib.SMTP("127.0.0.1", server.port), "sender@example.com", "password")
+            results = delivery.deliver(envelopes)
+        parts = {recipients[0]: {part.get_content_type(): part.get_payload(decode=True).decode("utf-8")
+                                 for part in email.message_from_bytes(data).walk() if not part.is_multipart()}
+                 for recipients, data in server.messages}
+
+        self.assertEqual(set(results.values()), {SENT})
+        self.assertEqual(list(parts["ops@example.com"]), ["text/plain"])
+        self.assertIn("Kubernetes in Production", parts["ops@example.com"]["text/plain"])
+        self.assertEqual(list(parts["java@example.com"]), ["text/html"])
+        self.assertNotIn("Kubernetes in Production", parts["java@example.com"]["text/html"])
+
+    def test_store_replaces_and_removes_subscribers(self):
+        self.store.add("JAVA@example.com", include=["Python"], format="text")
+
+        self.assertIn(("java@example.com", ["python"], [], "text"), list(self.store.subscribers()))
+        self.assertTrue(self.store.remove("java@example.com"))
+        self.assertFalse(self.store.remove("java@example.com"))
+        self.assertEqual(len(self.store.index()), 4)
+        with self.assertRaises(ValueError):
+            self.store.add("pdf@example.com", format="pdf")
+
+
+if __name__ == "__main__":
+    unittest.main()
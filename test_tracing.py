@@ -0,0 +1,103 @@
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from tracing import NULL_SPAN, Tracer, current_span, record_usage
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.directory.name, "trace.jsonl")
+        self.prometheus_path = os.path.join(self.directory.name, "reminder.prom")
+        self.tracer = Tracer(self.json_path, self.prometheus_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_spans(self):
+        with open(self.json_path, encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_disabled_tracer_returns_the_null_span(self):
+        tracer = Tracer()
+
+        with tracer.span("fetch") as span:
+            span.set(bytes=10)
+            self.assertIs(current_span(), NULL_SPAN)
+        tracer.flush()
+
+        self.assertIs(span, NULL_SPAN)
+        self.assertEqual(tracer.spans, [])
+
+    def test_span_records_duration_and_attributes(self):
+        with self.tracer.span("fetch", url="http://example.com") as span:
+            current_span().set(bytes=1024)
+            current_span().add("retries")
+            current_span().add("retries")
+        self.assertIs(current_span(), NULL_SPAN)
+        self.tracer.flush()
+
+        [logged] = self.read_spans()
+        self.assertEqual(logged["span"], "fetch")
+        self.assertEqual(logged["status"], "ok")
+        self.assertEqual(logged["url"], "http://example.com")
+        self.assertEqual(logged["bytes"], 1024)
+        self.assertEqual(logged["retries"], 2)
+        self.assertGreaterEqual(logged["duration_seconds"], 0)
+        self.assertEqual(logged["run_id"], self.tracer.run_id)
+
+    def test_failed_span_is_recorded_and_reraised(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span("send"):
+                raise ValueError("no recipients")
+        self.tracer.flush()
+
+        [logged] = self.read_spans()
+        self.assertEqual(logged["status"], "error")
+        self.assertEqual(logged["error"], "ValueError: no recipients")
+        with open(self.prometheus_path, encoding="utf-8") as file:
+            self.assertIn('packt_reminder_stage_success{stage="send"} 0', file.read())
+
+    def test_record_usage_adds_tokens_from_several_threads(self):
+        completion = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=4, total_tokens=104))
+
+        with self.tracer.span("label") as span:
+            # Like asyncio.to_thread, every thread runs in a copy of the caller's context
+            threads = [threading.Thread(target=contextvars.copy_context().run, args=(record_usage, completion))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # Mocked clients don't report usage
+            record_usage(MagicMock())
+
+        self.assertEqual(span.attributes, {"prompt_tokens": 800, "completion_tokens": 32, "total_tokens": 832})
+
+    def test_prometheus_textfile_keeps_latest_span_per_stage(self):
+        with self.tracer.span("fetch") as span:
+            span.set(bytes=100, url="http://example.com")
+        self.tracer.flush()
+        with self.tracer.span("fetch") as span:
+            span.set(bytes=200)
+        with self.tracer.span("label") as span:
+            span.add("prompt_tokens", 50)
+        self.tracer.flush()
+
+        with open(self.prometheus_path, encoding="utf-8") as file:
+            metrics = file.read()
+        self.assertIn("# TYPE packt_reminder_stage_duration_seconds gauge", metrics)
+        self.assertIn('packt_reminder_stage_bytes{stage="fetch"} 200', metrics)
+        self.assertIn('packt_reminder_stage_prompt_tokens{stage="label"} 50', metrics)
+        self.assertNotIn("url", metrics)
+        self.assertEqual(len(self.read_spans()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
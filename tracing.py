@@ -0,0 +1,180 @@
+# Records a span per stage of the reminder (fetch, parse, label, render, send) with its duration and counters
+# like bytes fetched, fetch attempts and OpenAI token usage. The spans are written as JSON log lines and as a
+# Prometheus textfile. Without a configured output, spans are a shared no-op object.
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+METRIC_PREFIX = "packt_reminder"
+
+# The span of the running stage; asyncio.to_thread copies it into the worker thread
+current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.error = None
+        self.lock = threading.Lock()
+
+    def set(self, **attributes):
+        with self.lock:
+            self.attributes.update(attributes)
+
+    def add(self, name: str, value=1):
+        # Several labelling threads can count tokens on the same span
+        with self.lock:
+            self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def to_dict(self, run_id):
+        return {
+            "timestamp": self.started_at,
+            "run_id": run_id,
+            "span": self.name,
+            "duration_seconds": round(self.duration, 6),
+            "status": "error" if self.error else "ok",
+            **({"error": self.error} if self.error else {}),
+            **self.attributes,
+        }
+
+
+class NullSpan:
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, name, value=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+
+    def __init__(self, json_path: str = None, prometheus_path: str = None):
+        """
+        'json_path' receives one JSON line per span ('-' for stdout), 'prometheus_path' a textfile
+        for the node exporter with the latest values of every stage. Without both, tracing is disabled.
+        """
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self.enabled = bool(json_path or prometheus_path)
+        self.run_id = uuid.uuid4().hex[:12]
+        self.spans = []
+        self.latest = {}
+        self.lock = threading.Lock()
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return NULL_SPAN
+        return self._span(name, attributes)
+
+    @contextmanager
+    def _span(self, name, attributes):
+        span = Span(name, attributes)
+        token = current.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            current.reset(token)
+            with self.lock:
+                self.spans.append(span)
+
+    def flush(self):
+        """
+        Writes the spans finished since the last flush and rewrites the Prometheus textfile.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            spans, self.spans = self.spans, []
+            for span in spans:
+                self.latest[span.name] = span
+        if not spans:
+            return
+        if self.json_path:
+            self.write_json_lines(spans)
+        if self.prometheus_path:
+            self.write_prometheus()
+
+    def write_json_lines(self, spans):
+        lines = "".join(json.dumps(span.to_dict(self.run_id), ensure_ascii=False) + "\n" for span in spans)
+        if self.json_path == "-":
+            sys.stdout.write(lines)
+        else:
+            with open(self.json_path, "a", encoding="utf-8") as file:
+                file.write(lines)
+
+    def write_prometheus(self):
+        metrics = {"stage_duration_seconds": [], "stage_success": [], "stage_last_run_timestamp_seconds": []}
+        for name, span in sorted(self.latest.items()):
+            labels = f'{{stage="{name}"}}'
+            metrics["stage_duration_seconds"].append(f"{labels} {span.duration:.6f}")
+            metrics["stage_success"].append(f"{labels} {0 if span.error else 1}")
+            metrics["stage_last_run_timestamp_seconds"].append(f"{labels} {span.started_at:.3f}")
+            for attribute, value in sorted(span.attributes.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metrics.setdefault(f"stage_{attribute}", []).append(f"{labels} {value}")
+
+        lines = []
+        for metric, samples in metrics.items():
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} gauge")
+            lines.extend(f"{METRIC_PREFIX}_{metric}{sample}" for sample in samples)
+
+        # The textfile collector must never read a half-written file
+        temporary_path = self.prometheus_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, self.prometheus_path)
+
+
+def current_span():
+    return current.get() or NULL_SPAN
+
+
+def record_usage(chat_completion):
+    """
+    Adds the prompt and completion tokens of an OpenAI chat completion to the current span.
+    """
+    span = current.get()
+    if span is None:
+        return
+    usage = getattr(chat_completion, "usage", None)
+    for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, field, None)
+        if isinstance(value, int):
+            span.add(field, value)
+
+
+tracer = Tracer()
+
+
+def configure(json_path: str = None, prometheus_path: str = None) -> Tracer:
+    global tracer
+    tracer = Tracer(json_path, prometheus_path)
+    return tracer
+
+
+def configure_from_env() -> Tracer:
+    return configure(os.environ.get("TRACE_JSON_PATH"), os.environ.get("TRACE_PROMETHEUS_PATH"))